@@ -2,10 +2,41 @@ import { Link } from "react-router-dom";
 import { Card, CardHeader, CardTitle, CardContent } from "@/components/ui/card";
 import { Building2 } from "lucide-react";
 import StatusBadge from "./StatusBadge.jsx";
+import { API_BASE_URL } from "../api/api.js";
+
+const mediaUrl = (url) => (url.startsWith("http") ? url : `${API_BASE_URL}${url}`);
+
+// Cover picture with every resized variant in srcset, so the browser downloads
+// the smallest one that fills the card (list via ?fields=...,cover_image,cover_variants)
+export function CoverImage({ property, sizes = "(min-width: 768px) 33vw, 100vw", className = "", ...props }) {
+  if (!property.cover_image) return null;
+  const variants = property.cover_variants || [];
+  const srcSet = (format) => variants.map((v) => `${mediaUrl(v[format])} ${v.width}w`).join(", ");
+  const fallback = variants.length ? variants[Math.min(1, variants.length - 1)] : null;
+
+  return (
+    <picture>
+      {variants.length > 0 && <source type="image/webp" srcSet={srcSet("webp")} sizes={sizes} />}
+      <img
+        src={mediaUrl(fallback ? fallback.jpg : property.cover_image)}
+        srcSet={variants.length ? srcSet("jpg") : undefined}
+        sizes={variants.length ? sizes : undefined}
+        width={fallback?.width}
+        height={fallback?.height}
+        alt={property.name}
+        loading="lazy"
+        decoding="async"
+        className={className}
+        {...props}
+      />
+    </picture>
+  );
+}
 
 export default function PropertyCard({ property }) {
   return (
-    <Card className="rounded-2xl border border-slate-200 bg-white shadow-sm hover:shadow-md transition-shadow">
+    <Card className="rounded-2xl border border-slate-200 bg-white shadow-sm hover:shadow-md transition-shadow overflow-hidden">
+      <CoverImage property={property} className="w-full h-40 object-cover" />
       <CardHeader className="pb-2">
         <div className="flex items-center justify-between">
           <CardTitle className="text-lg font-semibold truncate">{property.name}</CardTitle>
@@ -2,24 +2,52 @@
 import React, { useEffect, useState } from "react";
 import { Link } from "react-router-dom";
 import { Home, MapPin, Star, Users, Shield } from "lucide-react";
+import { CoverImage } from "../components/PropertyCard.jsx";
+
+const PROPERTY_FIELDS = "id,name,location,rent,status,cover_image,cover_variants";
 
 const HomePage = () => {
   const [properties, setProperties] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+
+  // Listings are keyset-paginated; each call fetches the page after `cursor`
+  const fetchPage = async (cursor) => {
+    const params = new URLSearchParams({ fields: PROPERTY_FIELDS });
+    if (cursor) params.set("cursor", cursor);
+    const response = await fetch(`http://localhost:5000/properties?${params}`);
+    if (!response.ok) {
+      const errorText = await response.text();
+      throw new Error(`HTTP error! status: ${response.status}, Body: ${errorText}`);
+    }
+    return response.json();
+  };
+
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    try {
+      setLoadingMore(true);
+      const data = await fetchPage(nextCursor);
+      setProperties((prev) => [...prev, ...(data.properties || [])]);
+      setNextCursor(data.next_cursor || null);
+    } catch (err) {
+      console.error("Error fetching more properties for Home page:", err);
+      setError("Failed to load properties. Please try again later.");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   useEffect(() => {
     const fetchProperties = async () => {
       try {
         setLoading(true);
         setError(null);
-        const response = await fetch("http://localhost:5000/properties");
-        if (!response.ok) {
-          const errorText = await response.text();
-          throw new Error(`HTTP error! status: ${response.status}, Body: ${errorText}`);
-        }
-        const data = await response.json();
-        setProperties(data);
+        const data = await fetchPage(null);
+        setProperties(data.properties || []);
+        setNextCursor(data.next_cursor || null);
       } catch (err) {
         console.error("Error fetching properties for Home page:", err);
         setError("Failed to load properties. Please try again later.");
@@ -54,15 +82,14 @@ const HomePage = () => {
     e.target.src = 'https://images.unsplash.com/photo-1560448204-e02f11c3d0e2?w=400&h=300&fit=crop';
   };
 
-  const getImageUrl = (pictures) => {
+  const getImageUrl = (coverImage) => {
     let imageUrl = 'https://images.unsplash.com/photo-1560448204-e02f11c3d0e2?w=400&h=300&fit=crop';
 
-    if (pictures && pictures.length > 0) {
-      const firstPicture = pictures[0];
-      if (firstPicture.startsWith('http')) {
-        imageUrl = firstPicture;
+    if (coverImage) {
+      if (coverImage.startsWith('http')) {
+        imageUrl = coverImage;
       } else {
-        imageUrl = `http://localhost:5000${firstPicture}`;
+        imageUrl = `http://localhost:5000${coverImage}`;
       }
     }
     return imageUrl;
@@ -116,7 +143,7 @@ const HomePage = () => {
               Featured Properties
             </h2>
             <p className="text-gray-600 mt-2">
-              {properties.length} available properties
+              {properties.length}{nextCursor ? "+" : ""} available properties
             </p>
           </div>
           <div className="flex items-center text-blue-600">
@@ -149,19 +176,7 @@ const HomePage = () => {
         ) : (
           <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 gap-8">
             {properties.map((prop) => {
-              let pictures = [];
-              if (typeof prop.pictures === "string") {
-                try {
-                  pictures = JSON.parse(prop.pictures);
-                } catch (e) {
-                  console.error("Invalid pictures JSON:", prop.pictures);
-                  pictures = [];
-                }
-              } else if (Array.isArray(prop.pictures)) {
-                pictures = prop.pictures;
-              }
-
-              const imageUrl = getImageUrl(pictures);
+              const imageUrl = getImageUrl(prop.cover_image);
 
               return (
                 <Link
@@ -171,12 +186,20 @@ const HomePage = () => {
                 >
                   <div className="bg-white rounded-xl shadow-md overflow-hidden group-hover:shadow-xl transition-shadow duration-200">
                     <div className="relative">
-                      <img
-                        src={imageUrl}
-                        alt={prop.name}
-                        className="w-full h-48 object-cover"
-                        onError={handleImageError}
-                      />
+                      {prop.cover_variants?.length ? (
+                        <CoverImage
+                          property={prop}
+                          className="w-full h-48 object-cover"
+                          onError={handleImageError}
+                        />
+                      ) : (
+                        <img
+                          src={imageUrl}
+                          alt={prop.name}
+                          className="w-full h-48 object-cover"
+                          onError={handleImageError}
+                        />
+                      )}
                       <div className="absolute top-3 right-3 bg-green-500 text-white text-xs px-3 py-1 rounded-full font-medium">
                         Available
                       </div>
@@ -213,6 +236,18 @@ const HomePage = () => {
             })}
           </div>
         )}
+
+        {!loading && !error && nextCursor && (
+          <div className="flex justify-center mt-10">
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="bg-blue-600 text-white px-8 py-3 rounded-lg font-medium hover:bg-blue-700 transition-colors disabled:opacity-50"
+            >
+              {loadingMore ? "Loading..." : "Load more properties"}
+            </button>
+          </div>
+        )}
       </div>
 
       {/* Call to Action */}
@@ -1,4 +1,4 @@
-import { useState, useEffect, useMemo } from "react";
+import { useState, useEffect } from "react";
 import { Link } from "react-router-dom";
 import { AnimatePresence, motion } from "framer-motion";
 import { Card, CardHeader, CardTitle, CardContent } from "@/components/ui/card";
@@ -11,38 +11,80 @@ import { Plus, Search, Building2 } from "lucide-react";
 import InlineError from "../components/InlineError.jsx";
 import StatusBadge from "../components/StatusBadge.jsx";
 import EmptyState from "../components/EmptyState.jsx";
+import { CoverImage } from "../components/PropertyCard.jsx";
 import { api } from "../api/api.js";
 
+const PAGE_SIZE = 20;
+
+// One page of properties: listings page with ?cursor=, search results with ?offset=
+function pageUrl(query, status, page) {
+  const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+  if (status !== "all") params.set("status", status);
+  if (!query) {
+    if (page) params.set("cursor", page);
+    return `/properties?${params}`;
+  }
+  params.set("q", query);
+  if (page) params.set("offset", String(page));
+  return `/properties/search?${params}`;
+}
+
+function nextPage(query, page, data) {
+  const rows = Array.isArray(data?.properties) ? data.properties : [];
+  if (!query) return data?.next_cursor || null;
+  // Typo-tolerant (fuzzy) results are a single page
+  return !data?.fuzzy && rows.length === PAGE_SIZE ? (page || 0) + rows.length : null;
+}
+
 export default function PropertiesListPage() {
   const [all, setAll] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState("");
   const [q, setQ] = useState("");
   const [status, setStatus] = useState("all");
+  const [next, setNext] = useState(null);
+
+  const query = q.trim();
 
+  // Typed queries go to the server-side search (ranked, typo-tolerant) once typing pauses;
+  // the status filter is applied by the server so later pages aren't missed
   useEffect(() => {
     let mounted = true;
-    (async () => {
+    const timer = setTimeout(async () => {
       try {
         setLoading(true);
-        const data = await api("/properties");
-        if (mounted) setAll(Array.isArray(data) ? data : []);
+        setError("");
+        const data = await api(pageUrl(query, status, null));
+        if (!mounted) return;
+        setAll(Array.isArray(data?.properties) ? data.properties : []);
+        setNext(nextPage(query, null, data));
       } catch (e) {
-        setError(e.message);
+        if (mounted) setError(e.message);
       } finally {
         if (mounted) setLoading(false);
       }
-    })();
-    return () => (mounted = false);
-  }, []);
+    }, query ? 250 : 0);
+    return () => {
+      mounted = false;
+      clearTimeout(timer);
+    };
+  }, [query, status]);
 
-  const filtered = useMemo(() => {
-    return all.filter((p) => {
-      const matchQ = `${p.name} ${p.location}`.toLowerCase().includes(q.toLowerCase());
-      const matchStatus = status === "all" ? true : p.status === status;
-      return matchQ && matchStatus;
-    });
-  }, [all, q, status]);
+  const loadMore = async () => {
+    if (!next || loadingMore) return;
+    try {
+      setLoadingMore(true);
+      const data = await api(pageUrl(query, status, next));
+      const rows = Array.isArray(data?.properties) ? data.properties : [];
+      setAll((prev) => [...prev, ...rows.filter((p) => !prev.some((seen) => seen.id === p.id))]);
+      setNext(nextPage(query, next, data));
+    } catch (e) {
+      setError(e.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   return (
     <div className="space-y-6">
@@ -92,17 +134,26 @@ export default function PropertiesListPage() {
         </div>
       ) : error ? (
         <InlineError message={error} />
-      ) : filtered.length === 0 ? (
+      ) : all.length === 0 ? (
         <EmptyState />
       ) : (
-        <div className="grid md:grid-cols-3 gap-4">
-          <AnimatePresence>
-            {filtered.map((p) => (
-              <motion.div key={p.id} initial={{ opacity: 0, y: 6 }} animate={{ opacity: 1, y: 0 }} exit={{ opacity: 0, y: -6 }}>
-                <PropertyCard property={p} />
-              </motion.div>
-            ))}
-          </AnimatePresence>
+        <div className="space-y-4">
+          <div className="grid md:grid-cols-3 gap-4">
+            <AnimatePresence>
+              {all.map((p) => (
+                <motion.div key={p.id} initial={{ opacity: 0, y: 6 }} animate={{ opacity: 1, y: 0 }} exit={{ opacity: 0, y: -6 }}>
+                  <PropertyCard property={p} />
+                </motion.div>
+              ))}
+            </AnimatePresence>
+          </div>
+          {next && (
+            <div className="flex justify-center">
+              <Button variant="outline" className="rounded-xl" onClick={loadMore} disabled={loadingMore}>
+                {loadingMore ? "Loading…" : "Load more"}
+              </Button>
+            </div>
+          )}
         </div>
       )}
     </div>
@@ -111,7 +162,8 @@ export default function PropertiesListPage() {
 
 function PropertyCard({ property }) {
   return (
-    <Card className="rounded-2xl border border-slate-200 bg-white shadow-sm hover:shadow-md transition-shadow">
+    <Card className="rounded-2xl border border-slate-200 bg-white shadow-sm hover:shadow-md transition-shadow overflow-hidden">
+      <CoverImage property={property} className="w-full h-40 object-cover" />
       <CardHeader className="pb-2">
         <div className="flex items-center justify-between">
           <CardTitle className="text-lg font-semibold truncate">{property.name}</CardTitle>
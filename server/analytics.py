@@ -0,0 +1,193 @@
+# analytics.py - Incrementally maintained daily/monthly payment rollups
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Payment, Lease, Property, PaymentRollup
+import logging
+
+logger = logging.getLogger(__name__)
+
+DAY = "day"
+MONTH = "month"
+GRANULARITIES = (DAY, MONTH)
+UNKNOWN_PROVIDER = "unknown"
+
+KEY = ("granularity", "bucket", "property_id", "status", "provider")
+
+
+def _buckets(value):
+    day = value.date() if isinstance(value, datetime) else value
+    return ((DAY, day.isoformat()), (MONTH, day.strftime("%Y-%m")))
+
+
+def _upsert(rows):
+    """Add count/amount deltas to rollup rows, creating them as needed, in one statement"""
+    if not rows:
+        return
+    table = PaymentRollup.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert_for = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert_for(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[column] for column in KEY],
+            set_={"count": table.c.count + stmt.excluded["count"], "amount": table.c.amount + stmt.excluded.amount}
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        updated = db.session.execute(
+            table.update().where(*[table.c[column] == row[column] for column in KEY]).values(
+                count=table.c.count + row["count"], amount=table.c.amount + row["amount"]
+            )
+        ).rowcount
+        if not updated:
+            db.session.execute(insert(table), [row])
+
+
+# ---------------- Event hooks (call before committing) ---------------- #
+def record_payments(changes):
+    """Move payments between status buckets.
+
+    ``changes`` are ``(created_at, landlord_id, property_id, provider, amount,
+    previous_status, status)`` tuples; ``previous_status`` is None for a new
+    payment. Deltas for the whole batch are combined before writing.
+    """
+    deltas = defaultdict(lambda: [0, 0.0, None])
+    for created_at, landlord_id, property_id, provider, amount, previous_status, status in changes:
+        if previous_status == status:
+            continue
+        provider = provider or UNKNOWN_PROVIDER
+        for granularity, bucket in _buckets(created_at or datetime.now()):
+            for key_status, sign in ((previous_status, -1), (status, 1)):
+                if key_status is None:
+                    continue
+                delta = deltas[(granularity, bucket, property_id, key_status, provider)]
+                delta[0] += sign
+                delta[1] += sign * amount
+                delta[2] = landlord_id
+
+    _upsert([
+        dict(zip(KEY, key), landlord_id=landlord_id, count=count, amount=amount)
+        for key, (count, amount, landlord_id) in deltas.items()
+        if count or amount
+    ])
+
+
+def record_payment(payment, previous_status=None):
+    """Single-payment form of record_payments"""
+    lease = payment.lease
+    record_payments([(
+        payment.created_at, lease.property.landlord_id, lease.property_id, payment.provider_id,
+        payment.amount, previous_status, payment.status
+    )])
+
+
+# ---------------- Reads ---------------- #
+def pick_granularity(start, end):
+    """Whole calendar months can be answered from monthly rows"""
+    return MONTH if start.day == 1 and (end + timedelta(days=1)).day == 1 else DAY
+
+
+def _bucket_range(granularity, start, end):
+    if granularity == MONTH:
+        return start.strftime("%Y-%m"), end.strftime("%Y-%m")
+    return start.isoformat(), end.isoformat()
+
+
+def payment_analytics(start, end, granularity=None, landlord_id=None, property_id=None, status=None):
+    """Time series and totals for payments created between two dates (inclusive).
+
+    Reads one rollup row per bucket, property, status and provider, so a
+    year of daily data is a few hundred rows however many payments it covers.
+    """
+    granularity = granularity or pick_granularity(start, end)
+    first, last = _bucket_range(granularity, start, end)
+
+    filters = [
+        PaymentRollup.granularity == granularity,
+        PaymentRollup.bucket >= first,
+        PaymentRollup.bucket <= last
+    ]
+    if landlord_id is not None:
+        filters.append(PaymentRollup.landlord_id == landlord_id)
+    if property_id is not None:
+        filters.append(PaymentRollup.property_id == property_id)
+    if status is not None:
+        filters.append(PaymentRollup.status == status)
+
+    by_bucket = db.session.query(
+        PaymentRollup.bucket, PaymentRollup.status,
+        func.sum(PaymentRollup.count), func.sum(PaymentRollup.amount)
+    ).filter(*filters).group_by(PaymentRollup.bucket, PaymentRollup.status).order_by(PaymentRollup.bucket)
+
+    by_provider = db.session.query(
+        PaymentRollup.provider, PaymentRollup.status,
+        func.sum(PaymentRollup.count), func.sum(PaymentRollup.amount)
+    ).filter(*filters).group_by(PaymentRollup.provider, PaymentRollup.status)
+
+    series = {}
+    statuses = defaultdict(lambda: {"count": 0, "amount": 0})
+    for bucket, row_status, count, amount in by_bucket:
+        if not count and not amount:
+            continue
+        point = series.setdefault(bucket, {"bucket": bucket, "count": 0, "amount": 0, "by_status": {}})
+        point["count"] += count
+        point["amount"] += amount
+        point["by_status"][row_status] = {"count": count, "amount": amount}
+        statuses[row_status]["count"] += count
+        statuses[row_status]["amount"] += amount
+
+    providers = defaultdict(lambda: defaultdict(lambda: {"count": 0, "amount": 0}))
+    for provider, row_status, count, amount in by_provider:
+        if count or amount:
+            providers[provider][row_status] = {"count": count, "amount": amount}
+
+    return {
+        "granularity": granularity,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "series": list(series.values()),
+        "by_status": dict(statuses),
+        "by_provider": {provider: dict(values) for provider, values in providers.items()},
+        "total_count": sum(values["count"] for values in statuses.values()),
+        "total_amount": sum(values["amount"] for values in statuses.values())
+    }
+
+
+# ---------------- Backfill ---------------- #
+def rebuild_payment_rollups():
+    """Recompute every rollup row from the payments table with one grouped query"""
+    day = func.date(Payment.created_at)
+    rows = db.session.query(
+        day, Property.landlord_id, Lease.property_id, Payment.status, Payment.provider_id,
+        func.count(Payment.id), func.coalesce(func.sum(Payment.amount), 0)
+    ).join(
+        Lease, Payment.lease_id == Lease.id
+    ).join(
+        Property, Lease.property_id == Property.id
+    ).filter(Payment.status.isnot(None)).group_by(
+        day, Property.landlord_id, Lease.property_id, Payment.status, Payment.provider_id
+    )
+
+    totals = defaultdict(lambda: [0, 0.0, None])
+    for day_value, landlord_id, property_id, status, provider, count, amount in rows:
+        day_value = day_value if isinstance(day_value, date) else date.fromisoformat(str(day_value)[:10])
+        for granularity, bucket in _buckets(day_value):
+            total = totals[(granularity, bucket, property_id, status, provider or UNKNOWN_PROVIDER)]
+            total[0] += count
+            total[1] += amount
+            total[2] = landlord_id
+
+    PaymentRollup.query.delete()
+    if totals:
+        db.session.execute(insert(PaymentRollup), [
+            dict(zip(KEY, key), landlord_id=landlord_id, count=count, amount=amount)
+            for key, (count, amount, landlord_id) in totals.items()
+        ])
+    db.session.commit()
+
+    logger.info(f"Rebuilt {len(totals)} payment rollup rows")
+    return len(totals)
@@ -1,9 +1,10 @@
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_cors import CORS
 from flask_restful import Api
 from models import db
-from routes import PropertyListResource, PropertyResource
+from routes import PropertyListResource, PropertyResource, PropertyPictureListResource, PropertySearchResource
 import os
+import click
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
@@ -19,6 +20,19 @@ def create_app():
     app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "dev-jwt-key")
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
     app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=7)
+    app.config["JWT_REVOCATION_BACKEND"] = os.getenv("JWT_REVOCATION_BACKEND", "database")
+    app.config["JWT_REVOCATION_NEGATIVE_TTL"] = float(os.getenv("JWT_REVOCATION_NEGATIVE_TTL", "5"))
+    for key in ("MPESA_BASE_URL", "MPESA_CONSUMER_KEY", "MPESA_CONSUMER_SECRET", "MPESA_SHORTCODE", "MPESA_PASSKEY",
+                "MPESA_CALLBACK_URL", "MPESA_CONNECT_TIMEOUT", "MPESA_READ_TIMEOUT", "MPESA_POOL_SIZE",
+                "MPESA_BREAKER_THRESHOLD", "MPESA_BREAKER_RESET",
+                "METRICS_ENABLED", "METRICS_STATEMENT_THRESHOLD", "METRICS_TOKEN",
+                "MEDIA_WORKERS", "MEDIA_MAX_BYTES", "MEDIA_SENDFILE", "MEDIA_ACCEL_PREFIX",
+                "RESPONSE_CACHE_ENABLED", "RESPONSE_CACHE_BACKEND", "RESPONSE_CACHE_SIZE", "RESPONSE_CACHE_TTL",
+                "IDENTITY_CACHE_SIZE", "IDENTITY_CACHE_TTL",
+                "NOTIFICATION_STREAM_LIMIT", "NOTIFICATION_STREAM_MAX_SECONDS",
+                "OUTBOX_MAX_ATTEMPTS", "OUTBOX_BACKOFF_SECONDS"):
+        if os.getenv(key):
+            app.config[key] = os.getenv(key)
 
     UPLOAD_FOLDER = "uploads/properties"
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -35,11 +49,23 @@ def create_app():
 
 
     db.init_app(app)
-    jwt = JWTManager(app)
     migrate = Migrate (app, db)
 
     api = Api(app)
 
+    from views import jwt
+    from revocation import revocation_store
+    from mpesa import mpesa_client
+    from media import media_store
+    from search import property_search
+    from identity import identity_cache
+    jwt.init_app(app)
+    identity_cache.init_app(app)
+    revocation_store.init_app(app)
+    mpesa_client.init_app(app)
+    media_store.init_app(app)  # also serves /uploads/properties/<path>
+    property_search.init_app(app)
+
     from views import (
         RegisterResource, LoginResource, LogoutResource, RefreshResource, ProfileResource,
         DashboardResource, UsersResource, HealthCheckResource, UserManagementResource,
@@ -49,12 +75,15 @@ def create_app():
         PaymentInitResource, MpesaCallbackResource, PaymentStatusResource, PaymentHistoryResource,
         LandlordPaymentDashboardResource, RentReminderResource, RepairRequestResource,
         RepairRequestDetailResource, NotificationListResource, NotificationResource,
-        BroadcastNotificationResource, TenantListResource
+        BroadcastNotificationResource, TenantListResource, NotificationStreamResource,
+        NotificationPollResource, ExportResource, PaymentAnalyticsResource
     )
 
     # Register resources
     api.add_resource(PropertyListResource, "/properties")
+    api.add_resource(PropertySearchResource, "/properties/search")
     api.add_resource(PropertyResource, "/properties/<int:id>")
+    api.add_resource(PropertyPictureListResource, "/properties/<int:id>/pictures")
     api.add_resource(RegisterResource, "/auth/register")
     api.add_resource(LoginResource, "/auth/login")
     api.add_resource(LogoutResource, "/auth/logout")
@@ -81,13 +110,124 @@ def create_app():
     api.add_resource(PaymentHistoryResource, '/payments/lease/<int:lease_id>')
     api.add_resource(LandlordPaymentDashboardResource, '/landlord/dashboard/payment')
     api.add_resource(RentReminderResource, '/reminders/rent')
+    api.add_resource(ExportResource, '/exports/<string:kind>')
+    api.add_resource(PaymentAnalyticsResource, '/analytics/payments')
     api.add_resource(RepairRequestResource, '/repairs')
     api.add_resource(RepairRequestDetailResource, '/repairs/<int:request_id>')
     api.add_resource(NotificationListResource, "/notifications")
     api.add_resource(NotificationResource, "/notifications/<int:notification_id>")
     api.add_resource(BroadcastNotificationResource, "/notifications/broadcast")
+    api.add_resource(NotificationStreamResource, "/notifications/stream")
+    api.add_resource(NotificationPollResource, "/notifications/poll")
     api.add_resource(TenantListResource, "/tenants")
 
+    # ETags and cached bodies for the read-mostly GETs marked with @cached_response
+    from response_cache import response_cache
+    response_cache.init_app(app, api)
+
+    # Per-endpoint query counts and latency at /metrics (opt-in via METRICS_ENABLED)
+    from instrumentation import instrumentation
+    instrumentation.init_app(app, api)
+
+    @app.cli.command("rebuild-summaries")
+    def rebuild_summaries_command():
+        """Backfill landlord financial summaries from payment, bill and lease history"""
+        from summaries import rebuild_summaries
+        rows = rebuild_summaries()
+        print(f"Rebuilt {rows} landlord financial summary rows")
+
+    @app.cli.command("generate-bills")
+    @click.option("--period", default=None, help="Billing month as YYYY-MM (default: this month)")
+    def generate_bills_command(period):
+        """Bill every active lease for the month and post the ledger charges; safe to rerun"""
+        from utils import monthly_billing_run
+        report = monthly_billing_run(period)
+        if report is None:
+            raise click.ClickException("Monthly billing failed; see the log")
+        print(f"Generated {report['bills']} bills for {report['period']} in {report['seconds']}s "
+              f"({report['rows_per_second']} rows/s), posted {report['ledger_charges']} ledger charges")
+
+    @app.cli.command("rebuild-ledger")
+    def rebuild_ledger_command():
+        """Rebuild every lease's rent ledger and balance from rent terms and payments"""
+        from ledger import rebuild_ledger
+        leases = rebuild_ledger()
+        print(f"Rebuilt ledgers for {leases} leases")
+
+    @app.cli.command("rebuild-analytics")
+    def rebuild_analytics_command():
+        """Recompute the daily/monthly payment rollups from the payments table"""
+        from analytics import rebuild_payment_rollups
+        rows = rebuild_payment_rollups()
+        print(f"Rebuilt {rows} payment rollup rows")
+
+    @app.cli.command("rebuild-search")
+    def rebuild_search_command():
+        """Create the property search index if needed and refill it from the properties table"""
+        try:
+            rows = property_search.create()
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        print(f"Indexed {rows} properties for search")
+
+    @app.cli.command("build-variants")
+    def build_variants_command():
+        """Build missing thumbnail/card/full variants of uploaded pictures (needs Pillow)"""
+        from media import rebuild_variants
+        try:
+            built = rebuild_variants()
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        print(f"Built variants for {built} uploaded pictures")
+
+    @app.cli.command("prune-revoked-tokens")
+    def prune_revoked_tokens_command():
+        """Delete revoked JWTs that have expired anyway"""
+        removed = revocation_store.prune()
+        print(f"Pruned {removed} expired revoked tokens")
+
+    @app.cli.command("drain-outbox")
+    @click.option("--batch-size", default=200, help="Messages to claim per batch")
+    @click.option("--loop", is_flag=True, help="Keep draining, sleeping when the outbox is empty")
+    def drain_outbox_command(batch_size, loop):
+        """Deliver queued emails and SMS from the outbox"""
+        import time
+        import outbox
+        while True:
+            sent = outbox.drain_outbox(batch_size)
+            print(f"Delivered {sent} outbound messages")
+            if not loop:
+                break
+            if not sent:
+                time.sleep(5)
+
+    @app.cli.command("process-callbacks")
+    @click.option("--batch-size", default=500, help="Callbacks to apply per batch")
+    @click.option("--loop", is_flag=True, help="Keep processing, sleeping when the inbox is empty")
+    def process_callbacks_command(batch_size, loop):
+        """Apply stored M-Pesa callbacks to payments, bills and summaries"""
+        import time
+        import payment_inbox
+        while True:
+            handled = payment_inbox.process_callbacks(batch_size)
+            print(f"Processed {handled} M-Pesa callbacks")
+            if not loop:
+                break
+            if not handled:
+                time.sleep(1)
+
+    # Drain the outbox and callback inbox from Celery beat when a broker is configured
+    if os.getenv("CELERY_BROKER_URL"):
+        import outbox
+        import payment_inbox
+        from utils import make_celery
+        app.config["CELERY_BROKER_URL"] = os.getenv("CELERY_BROKER_URL")
+        app.config["CELERY_RESULT_BACKEND"] = os.getenv("CELERY_RESULT_BACKEND", app.config["CELERY_BROKER_URL"])
+        celery = make_celery(app)
+        outbox.register_celery_tasks(celery, app)
+        payment_inbox.register_celery_tasks(celery, app)
+        app.extensions["celery"] = celery
+
 
     return app
 
@@ -0,0 +1,126 @@
+# fake_daraja.py - Local stand-in for the Safaricom Daraja API, for offline payment benchmarks
+#
+# Usage:
+#   python benchmarks/fake_daraja.py --port 8089 --latency-ms 50 --callback-delay 1
+#   MPESA_BASE_URL=http://127.0.0.1:8089 MPESA_CALLBACK_URL=http://127.0.0.1:5000 flask run
+#
+# Implements the two endpoints MpesaClient uses. When --callback-delay is set,
+# each accepted STK push is answered with a successful stkCallback POSTed to
+# the request's CallBackUrl, like Daraja does once the tenant enters their PIN.
+import argparse
+import itertools
+import random
+import secrets
+import threading
+import time
+import requests
+from flask import Flask, request, jsonify
+
+
+def create_fake_daraja(latency_ms=0, failure_rate=0.0, token_ttl=3599, callback_delay=None, fail_ratio=0.0):
+    app = Flask(__name__)
+    tokens = set()
+    checkout_ids = itertools.count(1)
+    stats = {"tokens_issued": 0, "stk_pushes": 0, "callbacks_sent": 0}
+    lock = threading.Lock()
+    callback_session = requests.Session()
+
+    def simulate_latency():
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+
+    def send_callback(url, checkout_id, amount, phone_number):
+        time.sleep(callback_delay)
+        succeeded = random.random() >= fail_ratio
+        callback = {
+            "Body": {
+                "stkCallback": {
+                    "MerchantRequestID": f"fake-{checkout_id}",
+                    "CheckoutRequestID": checkout_id,
+                    "ResultCode": 0 if succeeded else 1032,
+                    "ResultDesc": "The service request is processed successfully." if succeeded
+                    else "Request cancelled by user",
+                }
+            }
+        }
+        if succeeded:
+            callback["Body"]["stkCallback"]["CallbackMetadata"] = {"Item": [
+                {"Name": "Amount", "Value": amount},
+                {"Name": "MpesaReceiptNumber", "Value": secrets.token_hex(5).upper()},
+                {"Name": "PhoneNumber", "Value": phone_number},
+            ]}
+        try:
+            callback_session.post(url, json=callback, timeout=10)
+            with lock:
+                stats["callbacks_sent"] += 1
+        except requests.RequestException as e:
+            app.logger.warning(f"Callback to {url} failed: {e}")
+
+    @app.get("/oauth/v1/generate")
+    def generate_token():
+        simulate_latency()
+        if not request.authorization:
+            return jsonify({"errorCode": "400.008.01", "errorMessage": "Invalid Authentication passed"}), 400
+        token = secrets.token_urlsafe(24)
+        with lock:
+            tokens.add(token)
+            stats["tokens_issued"] += 1
+        return jsonify({"access_token": token, "expires_in": str(token_ttl)})
+
+    @app.post("/mpesa/stkpush/v1/processrequest")
+    def stk_push():
+        simulate_latency()
+        if random.random() < failure_rate:
+            return jsonify({"errorCode": "500.001.1001", "errorMessage": "Simulated upstream failure"}), 503
+
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if token not in tokens:
+            return jsonify({"errorCode": "404.001.03", "errorMessage": "Invalid Access Token"}), 401
+
+        payload = request.get_json(silent=True) or {}
+        checkout_id = f"ws_CO_fake_{next(checkout_ids)}"
+        with lock:
+            stats["stk_pushes"] += 1
+
+        if callback_delay is not None and payload.get("CallBackUrl"):
+            threading.Thread(
+                target=send_callback,
+                args=(payload["CallBackUrl"], checkout_id, payload.get("Amount"), payload.get("PhoneNumber")),
+                daemon=True
+            ).start()
+
+        return jsonify({
+            "MerchantRequestID": f"fake-{checkout_id}",
+            "CheckoutRequestID": checkout_id,
+            "ResponseCode": "0",
+            "ResponseDescription": "Success. Request accepted for processing",
+            "CustomerMessage": "Success. Request accepted for processing"
+        })
+
+    @app.get("/_stats")
+    def get_stats():
+        with lock:
+            return jsonify(stats)
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Daraja API for offline M-Pesa benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay added to every response")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of STK pushes answered with 503")
+    parser.add_argument("--token-ttl", type=int, default=3599, help="expires_in reported for access tokens")
+    parser.add_argument("--callback-delay", type=float, default=None,
+                        help="Seconds before POSTing the stkCallback; omit to send no callbacks")
+    parser.add_argument("--fail-ratio", type=float, default=0.0, help="Share of callbacks reporting a cancelled payment")
+    args = parser.parse_args()
+
+    create_fake_daraja(
+        latency_ms=args.latency_ms,
+        failure_rate=args.failure_rate,
+        token_ttl=args.token_ttl,
+        callback_delay=args.callback_delay,
+        fail_ratio=args.fail_ratio
+    ).run(host=args.host, port=args.port, threaded=True)
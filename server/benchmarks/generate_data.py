@@ -0,0 +1,198 @@
+# generate_data.py - Synthetic large-portfolio dataset for benchmarks, loaded with bulk inserts
+#
+# Usage (from server/):
+#   DATABASE_URL=postgresql:///rentals_bench python benchmarks/generate_data.py \
+#       --landlords 200 --properties 20000 --tenants 20000 --leases 18000 \
+#       --payments 400000 --notifications 200000
+#
+# Rows are added next to whatever is already in the database, so run it
+# against an empty benchmark database. Every generated user's password is
+# "password". Derived tables (landlord summaries, rent ledgers, payment
+# rollups) are rebuilt afterwards unless --skip-derived is given.
+import argparse
+import os
+import random
+import secrets
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faker import Faker
+from sqlalchemy import func, insert
+from models import db, bcrypt, User, Property, PropertyPicture, Lease, Payment, Notification, NOTIFICATION_TYPES
+
+BATCH_SIZE = 5000
+PASSWORD = "password"
+MAX_PICTURES = 4
+LOCATIONS = ("Kilimani", "Westlands", "Kileleshwa", "Lavington", "Karen", "Ngong Road", "Parklands",
+             "South B", "Embakasi", "Ruaka", "Thika Road", "Rongai")
+PAYMENT_STATUSES = (("successful", 0.85), ("failed", 0.1), ("pending", 0.05))
+
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _insert(model, rows, batch_size, returning=False):
+    """executemany INSERT in chunks; with ``returning`` the new ids come back in row order"""
+    ids = []
+    for chunk in _chunks(rows, batch_size):
+        if returning:
+            stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+            ids.extend(db.session.scalars(stmt, chunk).all())
+        else:
+            db.session.execute(insert(model), chunk)
+        db.session.commit()
+    return ids
+
+
+def _users(fake, role, count, run, national_id_start, password_hash, created):
+    rows = []
+    for n in range(count):
+        first_name, last_name = fake.first_name(), fake.last_name()
+        rows.append(dict(
+            public_id=fake.uuid4(), username=f"bench_{run}_{role}{n}", email=f"{role}{n}.{run}@bench.example",
+            national_id=national_id_start + n, password_hash=password_hash, role=role,
+            first_name=first_name[:40], last_name=last_name[:40], phone_number=f"07{random.randrange(10**8):08d}",
+            is_active=True, created_at=created, updated_at=created
+        ))
+    return rows
+
+
+def generate_portfolio(landlords=50, properties=2000, tenants=2000, leases=1800, payments=40000,
+                       notifications=20000, seed=42, batch_size=BATCH_SIZE, rebuild_derived=True):
+    """Load a synthetic portfolio and return how many rows of each kind were created.
+
+    Leases get distinct properties (up to the number of properties) and start
+    within the last two years; payments fall between a lease's start and today.
+    Runs inside an app context.
+    """
+    fake = Faker()
+    Faker.seed(seed)
+    random.seed(seed)
+    run = secrets.token_hex(3)
+    today = date.today()
+    now = datetime.now()
+    started = time.perf_counter()
+
+    password_hash = bcrypt.generate_password_hash(PASSWORD).decode("utf-8")
+    national_id_start = (db.session.query(func.max(User.national_id)).scalar() or 0) + 1
+    admin_ids = _insert(User, _users(fake, "admin", 1, run, national_id_start, password_hash, now),
+                        batch_size, returning=True)
+    landlord_ids = _insert(User, _users(fake, "landlord", landlords, run, national_id_start + 1, password_hash, now),
+                           batch_size, returning=True)
+    tenant_ids = _insert(User, _users(fake, "tenant", tenants, run, national_id_start + 1 + landlords,
+                                      password_hash, now), batch_size, returning=True)
+
+    leased = min(leases, properties, tenants)
+    property_rows = []
+    for n in range(properties):
+        property_rows.append(dict(
+            name=f"{fake.last_name()} {random.choice(('Apartments', 'Court', 'Heights', 'Residence'))} {n}"[:100],
+            location=random.choice(LOCATIONS), rent=float(random.randrange(8000, 150000, 500)),
+            status="occupied" if n < leased else "vacant", landlord_id=random.choice(landlord_ids)
+        ))
+    property_ids = _insert(Property, property_rows, batch_size, returning=True)
+
+    picture_rows = []
+    for property_id in property_ids:
+        for position in range(random.randint(1, MAX_PICTURES)):
+            picture_rows.append(dict(
+                property_id=property_id, position=position, url=f"https://images.example/{property_id}/{position}.jpg",
+                width=1200, height=800, byte_size=random.randrange(80_000, 400_000), created_at=now
+            ))
+    _insert(PropertyPicture, picture_rows, batch_size)
+
+    lease_rows = []
+    for n in range(leased):
+        start_date = today - timedelta(days=random.randrange(30, 730))
+        lease_rows.append(dict(
+            tenant_id=tenant_ids[n], property_id=property_ids[n], start_date=start_date,
+            rent_amount=property_rows[n]["rent"], status="active", vacate_status="pending"
+        ))
+    lease_ids = _insert(Lease, lease_rows, batch_size, returning=True)
+
+    payment_rows = []
+    statuses, weights = zip(*PAYMENT_STATUSES)
+    for n in range(payments if lease_ids else 0):
+        index = random.randrange(len(lease_ids))
+        lease = lease_rows[index]
+        age = (today - lease["start_date"]).days
+        payment_rows.append(dict(
+            lease_id=lease_ids[index], amount=int(lease["rent_amount"]), provider_id="mpesa",
+            status=random.choices(statuses, weights)[0], transaction_id=f"BENCH{run}{n}",
+            created_at=now - timedelta(days=random.randrange(age), seconds=random.randrange(86400))
+        ))
+    _insert(Payment, payment_rows, batch_size)
+
+    notification_rows = []
+    for n in range(notifications if tenant_ids else 0):
+        created = now - timedelta(minutes=random.randrange(60 * 24 * 180))
+        is_read = random.random() < 0.7
+        notification_rows.append(dict(
+            sender_id=random.choice(landlord_ids or admin_ids), recipient_id=random.choice(tenant_ids),
+            title=fake.sentence(nb_words=5)[:200], message=fake.paragraph(nb_sentences=2),
+            notification_type=random.choice(NOTIFICATION_TYPES), is_broadcast=False, is_read=is_read,
+            created_at=created, read_at=created + timedelta(hours=1) if is_read else None
+        ))
+    _insert(Notification, notification_rows, batch_size)
+
+    counts = {
+        "landlords": len(landlord_ids),
+        "tenants": len(tenant_ids),
+        "properties": len(property_ids),
+        "pictures": len(picture_rows),
+        "leases": len(lease_ids),
+        "payments": len(payment_rows),
+        "notifications": len(notification_rows),
+    }
+
+    if rebuild_derived:
+        from summaries import rebuild_summaries
+        from ledger import rebuild_ledger
+        from analytics import rebuild_payment_rollups
+        rebuild_summaries()
+        rebuild_ledger()
+        rebuild_payment_rollups()
+
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    counts["admin_username"] = f"bench_{run}_admin0"
+    return counts
+
+
+def add_arguments(parser):
+    parser.add_argument("--landlords", type=int, default=50)
+    parser.add_argument("--properties", type=int, default=2000)
+    parser.add_argument("--tenants", type=int, default=2000)
+    parser.add_argument("--leases", type=int, default=1800)
+    parser.add_argument("--payments", type=int, default=40000)
+    parser.add_argument("--notifications", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42, help="Seed for Faker and random, for repeatable datasets")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows per INSERT batch")
+
+
+def dataset_options(args):
+    return dict(
+        landlords=args.landlords, properties=args.properties, tenants=args.tenants, leases=args.leases,
+        payments=args.payments, notifications=args.notifications, seed=args.seed, batch_size=args.batch_size
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a synthetic large-portfolio dataset for benchmarks")
+    add_arguments(parser)
+    parser.add_argument("--create-tables", action="store_true", help="Run db.create_all() first (no migrations)")
+    parser.add_argument("--skip-derived", action="store_true",
+                        help="Don't rebuild summaries, ledgers and payment rollups afterwards")
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        if args.create_tables:
+            db.create_all()
+        counts = generate_portfolio(rebuild_derived=not args.skip_derived, **dataset_options(args))
+    print(", ".join(f"{key}={value}" for key, value in counts.items()))
@@ -0,0 +1,233 @@
+# run_benchmarks.py - Time the hot API endpoints against a synthetic portfolio and save the results as JSON
+#
+# Usage (from server/):
+#   python benchmarks/run_benchmarks.py --output benchmarks/results/$(git rev-parse --short HEAD).json
+#   python benchmarks/run_benchmarks.py --compare benchmarks/results/<previous>.json --tolerance 0.2
+#
+# By default a throwaway SQLite database is created and filled with
+# generate_data.py (see its options for the dataset size); pass
+# --database-url to benchmark an existing, already-loaded database instead.
+# Each endpoint is requested through the Flask test client with the
+# instrumentation middleware on, so the JSON records statement counts and
+# DB/serialization time next to the latencies. With --compare, the run
+# exits non-zero when an endpoint's median latency or statement count grew
+# by more than --tolerance over the baseline file. The response cache is off
+# unless --response-cache is given, so repeated requests measure the work
+# behind each endpoint rather than cache hits.
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_data import add_arguments, dataset_options, generate_portfolio
+
+# (name, role, path) - role is who calls it; ids are filled in from the dataset
+ENDPOINTS = (
+    ("properties_list", None, "/properties"),
+    ("properties_filtered", None, "/properties?location=Kilimani&limit=50"),
+    ("property_detail", None, "/properties/{property_id}"),
+    ("leases_landlord", "landlord", "/leases"),
+    ("lease_detail", "tenant", "/leases/{lease_id}"),
+    ("bills_landlord", "landlord", "/bills"),
+    ("landlord_dashboard", "landlord", "/landlord/dashboard"),
+    ("tenant_dashboard", "tenant", "/tenant/dashboard"),
+    ("admin_dashboard", "admin", "/admin/dashboard"),
+    ("dashboard_stats", "landlord", "/dashboard/stats"),
+    ("landlord_payment_dashboard", "landlord", "/landlord/dashboard/payment"),
+    ("payment_history", "tenant", "/payments/lease/{lease_id}"),
+    ("payment_analytics", "landlord", "/analytics/payments"),
+    ("notifications", "tenant", "/notifications"),
+    ("notification_poll", "tenant", "/notifications/poll?timeout=0"),
+    ("tenants_list", "landlord", "/tenants"),
+    ("users_admin", "admin", "/auth/users"),
+    ("profile", "tenant", "/auth/profile"),
+)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _subjects():
+    """The busiest landlord, one of their tenants with a lease, and an admin, as plain values"""
+    from sqlalchemy import func
+    from models import db, User, Property, Lease
+    landlord_id = db.session.query(Property.landlord_id).group_by(Property.landlord_id) \
+        .order_by(func.count(Property.id).desc()).limit(1).scalar()
+    lease = Lease.query.join(Property).filter(Property.landlord_id == landlord_id, Lease.status == "active") \
+        .order_by(Lease.id).first()
+    users = {
+        "landlord": db.session.get(User, landlord_id) if landlord_id else None,
+        "tenant": lease.tenant if lease else None,
+        "admin": User.query.filter_by(role="admin").order_by(User.id).first(),
+    }
+    subjects = {
+        role: {"public_id": user.public_id, "role": user.role, "email": user.email, "is_active": user.is_active}
+        for role, user in users.items() if user is not None
+    }
+    subjects["lease_id"] = lease.id if lease else None
+    subjects["property_id"] = lease.property_id if lease else None
+    return subjects
+
+
+def run_endpoints(app, requests_per_endpoint, warmup=2, only=None):
+    """Time every endpoint; must be called without an app context pushed.
+
+    The test client reuses a pushed context, which would carry ``g`` (the
+    cached identity and user), the session's identity map and skipped
+    teardowns from one request into the next. Without one, every request
+    gets a fresh context and session, as it does under gunicorn.
+    """
+    from flask import has_app_context
+    from flask_jwt_extended import create_access_token
+    from instrumentation import instrumentation
+
+    if has_app_context():
+        raise RuntimeError("run_endpoints() must run outside an app context")
+
+    with app.app_context():
+        subjects = _subjects()
+        headers = {}
+        for role in ("landlord", "tenant", "admin"):
+            user = subjects.get(role)
+            if user is not None:
+                claims = {"role": user["role"], "email": user["email"], "isActive": user["is_active"]}
+                token = create_access_token(identity=user["public_id"], additional_claims=claims)
+                headers[role] = {"Authorization": f"Bearer {token}"}
+
+    client = app.test_client()
+    results = {}
+    for name, role, path in ENDPOINTS:
+        if (role and role not in headers) or (only and name not in only):
+            continue
+        url = path.format(lease_id=subjects["lease_id"], property_id=subjects["property_id"])
+        request_headers = headers.get(role, {})
+        for _ in range(warmup):
+            client.get(url, headers=request_headers)
+
+        instrumentation.reset()
+        timings, statuses = [], set()
+        for _ in range(requests_per_endpoint):
+            started = time.perf_counter()
+            response = client.get(url, headers=request_headers)
+            response.get_data()
+            timings.append((time.perf_counter() - started) * 1000)
+            statuses.add(response.status_code)
+
+        report = instrumentation.report()
+        metrics = report[0] if report else {}
+        results[name] = {
+            "path": url,
+            "status_codes": sorted(statuses),
+            "requests": len(timings),
+            "median_ms": round(statistics.median(timings), 2),
+            "mean_ms": round(statistics.mean(timings), 2),
+            "p95_ms": round(_percentile(timings, 0.95), 2),
+            "min_ms": round(min(timings), 2),
+            "avg_statements": metrics.get("avg_statements"),
+            "avg_db_ms": metrics.get("avg_db_ms"),
+            "avg_serialize_ms": metrics.get("avg_serialize_ms"),
+        }
+        print(f"{name:28} {results[name]['median_ms']:>9.2f}ms median {results[name]['p95_ms']:>9.2f}ms p95 "
+              f"{metrics.get('avg_statements', 0):>7} stmts  {sorted(statuses)}")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Endpoints whose median latency or statement count regressed beyond ``tolerance``"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        for key in ("median_ms", "avg_statements"):
+            before, after = previous.get(key), current.get(key)
+            if before and after and after > before * (1 + tolerance):
+                regressions.append(f"{name}: {key} {before} -> {after} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot API endpoints on a synthetic portfolio")
+    add_arguments(parser)
+    parser.add_argument("--database-url", default=None, help="Benchmark an existing database instead of generating one")
+    parser.add_argument("--requests", type=int, default=20, help="Timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed requests per endpoint before timing")
+    parser.add_argument("--endpoints", default=None,
+                        help="Comma-separated endpoint names to run (default: all); see ENDPOINTS")
+    parser.add_argument("--output", default=None, help="Write the results JSON here")
+    parser.add_argument("--compare", default=None, help="Baseline results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed growth over the baseline (0.2 = 20%%)")
+    parser.add_argument("--response-cache", action="store_true", help="Leave the ETag/response cache on")
+    args = parser.parse_args()
+
+    workdir = None
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        workdir = tempfile.mkdtemp(prefix="rentals-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["METRICS_ENABLED"] = "true"
+    os.environ["RESPONSE_CACHE_ENABLED"] = "true" if args.response_cache else "false"
+    os.environ.setdefault("JWT_REVOCATION_BACKEND", "memory")
+
+    from app import create_app
+    from models import db
+    app = create_app()
+
+    with app.app_context():
+        dataset = None
+        if workdir:
+            db.create_all()
+            print("Generating dataset...")
+            dataset = generate_portfolio(**dataset_options(args))
+            print(", ".join(f"{key}={value}" for key, value in dataset.items()))
+        database = db.engine.url.get_backend_name()
+
+    only = set(args.endpoints.split(",")) if args.endpoints else None
+    results = run_endpoints(app, args.requests, args.warmup, only)
+
+    output = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "database": database,
+        "dataset": dataset,
+        "requests_per_endpoint": args.requests,
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
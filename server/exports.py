@@ -0,0 +1,124 @@
+# exports.py - Streaming CSV/NDJSON exports of payments, bills and leases
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, time
+from sqlalchemy import or_
+from models import db, Payment, Bill, Lease, Property
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+# Rows fetched per round trip from the server-side cursor
+FETCH_SIZE = 1000
+# Rows encoded into each chunk handed to the WSGI server
+CHUNK_ROWS = 500
+
+
+def _payments(start, end):
+    query = db.session.query(
+        Payment.id, Payment.lease_id, Lease.property_id, Property.landlord_id, Lease.tenant_id,
+        Payment.amount, Payment.status, Payment.provider_id, Payment.transaction_id, Payment.created_at
+    ).join(Lease, Payment.lease_id == Lease.id).join(Property, Lease.property_id == Property.id)
+    if start:
+        query = query.filter(Payment.created_at >= datetime.combine(start, time.min))
+    if end:
+        query = query.filter(Payment.created_at <= datetime.combine(end, time.max))
+    return query, Payment.id
+
+
+def _bills(start, end):
+    query = db.session.query(
+        Bill.id, Bill.lease_id, Lease.property_id, Property.landlord_id, Lease.tenant_id,
+        Bill.amount, Bill.due_date, Bill.status, Bill.period, Bill.created_at
+    ).join(Lease, Bill.lease_id == Lease.id).join(Property, Lease.property_id == Property.id)
+    if start:
+        query = query.filter(Bill.due_date >= start)
+    if end:
+        query = query.filter(Bill.due_date <= end)
+    return query, Bill.id
+
+
+def _leases(start, end):
+    query = db.session.query(
+        Lease.id, Lease.property_id, Property.landlord_id, Lease.tenant_id,
+        Lease.start_date, Lease.end_date, Lease.rent_amount, Lease.status
+    ).join(Property, Lease.property_id == Property.id)
+    # Leases in effect at any point of the range
+    if start:
+        query = query.filter(or_(Lease.end_date.is_(None), Lease.end_date >= start))
+    if end:
+        query = query.filter(Lease.start_date <= end)
+    return query, Lease.id
+
+
+EXPORTS = {
+    "payments": _payments,
+    "bills": _bills,
+    "leases": _leases,
+}
+
+
+def export_rows(kind, landlord_id=None, start=None, end=None):
+    """Return the export's column names and an iterator over its rows.
+
+    Rows are plain column tuples read from a server-side cursor ``FETCH_SIZE``
+    at a time, so memory use does not depend on how many rows match.
+    """
+    query, order_by = EXPORTS[kind](start, end)
+    if landlord_id is not None:
+        query = query.filter(Property.landlord_id == landlord_id)
+    query = query.order_by(order_by).execution_options(stream_results=True).yield_per(FETCH_SIZE)
+    columns = [column["name"] for column in query.column_descriptions]
+    return columns, iter(query)
+
+
+def _value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_value(value) for value in row])
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_ndjson(columns, rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({column: _value(value) for column, value in zip(columns, row)}))
+        if len(lines) == CHUNK_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson}
+
+
+def gzip_stream(chunks):
+    """Gzip text chunks as they are produced, without buffering the whole body"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(kind, fmt="csv", landlord_id=None, start=None, end=None, gzip=False):
+    """Body generator for an export response"""
+    chunks = ENCODERS[fmt](*export_rows(kind, landlord_id, start, end))
+    if gzip:
+        return gzip_stream(chunks)
+    return (chunk.encode("utf-8") for chunk in chunks)
@@ -0,0 +1,74 @@
+# identity.py - Request-scoped identity with a small in-process user cache
+from collections import namedtuple
+from flask import g
+from flask_jwt_extended import get_jwt_identity
+from cache import TTLCache
+from models import db, User
+
+IDENTITY_CACHE_SIZE = 10000
+IDENTITY_CACHE_TTL = 60
+
+# The few user fields needed for authorization, safe to share between requests
+Identity = namedtuple("Identity", ["id", "public_id", "role", "is_active"])
+
+
+class IdentityCache(TTLCache):
+    """Identities by public_id, sized by ``IDENTITY_CACHE_SIZE`` and ``IDENTITY_CACHE_TTL``"""
+
+    def init_app(self, app):
+        self.maxsize = int(app.config.get("IDENTITY_CACHE_SIZE", IDENTITY_CACHE_SIZE))
+        self.ttl = float(app.config.get("IDENTITY_CACHE_TTL", IDENTITY_CACHE_TTL))
+        self.clear()
+        app.extensions["identity_cache"] = self
+
+
+identity_cache = IdentityCache(maxsize=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL)
+
+
+def load_identity(public_id):
+    """Return the Identity for a public_id, from the cache or a single query.
+
+    Entries are invalidated locally when a user's role or status changes;
+    other worker processes pick the change up once the TTL expires.
+    """
+    identity = identity_cache.get(public_id)
+    if identity is not None:
+        return identity
+
+    row = db.session.query(User.id, User.public_id, User.role, User.is_active).filter(
+        User.public_id == public_id
+    ).first()
+    if row is None:
+        return None
+
+    identity = Identity(*row)
+    identity_cache.set(public_id, identity)
+    return identity
+
+
+def current_identity():
+    """Identity of the user making the current request, looked up once per request"""
+    public_id = get_jwt_identity()
+    identity = g.get("identity")
+    if identity is None or identity.public_id != public_id:
+        identity = g.identity = load_identity(public_id)
+    return identity
+
+
+def current_user():
+    """Full User row for the current request, loaded at most once per request"""
+    identity = current_identity()
+    if identity is None:
+        return None
+    user = g.get("current_user")
+    if user is None or user.id != identity.id:
+        user = g.current_user = db.session.get(User, identity.id)
+    return user
+
+
+def invalidate_identity(public_id):
+    """Drop a cached identity after the user's role or active flag changes"""
+    identity_cache.delete(public_id)
+    cached = g.get("identity")
+    if cached is not None and cached.public_id == public_id:
+        g.pop("identity", None)
@@ -0,0 +1,227 @@
+# instrumentation.py - Opt-in per-endpoint query counts and latency histograms
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from flask import Response, g, request, has_request_context, abort
+from flask import request_started, request_finished
+from sqlalchemy import event
+from models import db
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS = (
+    ("statements", "app_request_db_statements", "SQL statements executed per request", STATEMENT_BUCKETS),
+    ("db_seconds", "app_request_db_seconds", "Time spent in SQL statements per request", SECONDS_BUCKETS),
+    ("serialize_seconds", "app_request_serialize_seconds",
+     "Time spent turning models into dicts and JSON per request", SECONDS_BUCKETS),
+    ("seconds", "app_request_duration_seconds", "Total request latency up to the response", SECONDS_BUCKETS),
+)
+
+
+class Histogram:
+    """Cumulative bucket counts plus sum and count, as Prometheus expects"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield bound, cumulative
+        yield "+Inf", self.count
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Instrumentation:
+    """Records statement count, DB time, serialization time and latency per endpoint.
+
+    Off unless ``METRICS_ENABLED`` is set. SQL time comes from the engine's
+    cursor events, serialization time from wrapping the serializer schemas,
+    the models' ``to_dict`` and the API's JSON representation, and
+    everything is keyed by the Flask endpoint. Requests running more than ``METRICS_STATEMENT_THRESHOLD``
+    statements are logged and counted. Histograms live in the worker process,
+    so each worker reports its own numbers at ``/metrics``.
+    """
+
+    def __init__(self, statement_threshold=25):
+        self.enabled = False
+        self.statement_threshold = statement_threshold
+        self.token = None
+        self._histograms = {}
+        self._flagged = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app, api=None):
+        self.enabled = str(app.config.get("METRICS_ENABLED", "")).lower() in ("1", "true", "yes")
+        if not self.enabled:
+            return
+        self.statement_threshold = int(app.config.get("METRICS_STATEMENT_THRESHOLD", self.statement_threshold))
+        self.token = app.config.get("METRICS_TOKEN")
+
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(db.engine, "after_cursor_execute", self._after_cursor_execute)
+        request_started.connect(self._request_started, app)
+        request_finished.connect(self._request_finished, app)
+
+        from serializers import Schema
+        for name in ("__call__", "many"):
+            if not hasattr(getattr(Schema, name), "__wrapped__"):
+                setattr(Schema, name, timed_serialization(getattr(Schema, name)))
+        for mapper in db.Model.registry.mappers:
+            model = mapper.class_
+            if hasattr(model, "to_dict") and not hasattr(model.to_dict, "__wrapped__"):
+                model.to_dict = timed_serialization(model.to_dict)
+        if api is not None:
+            for mediatype, representation in list(api.representations.items()):
+                if hasattr(representation, "__wrapped__"):
+                    continue
+                api.representations[mediatype] = timed_serialization(representation)
+
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+        app.extensions["instrumentation"] = self
+
+    # ---------------- Hooks ---------------- #
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and "request_metrics" in g:
+            conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("metrics_started")
+        if started and has_request_context() and "request_metrics" in g:
+            metrics = g.request_metrics
+            metrics["statements"] += 1
+            metrics["db_seconds"] += time.perf_counter() - started.pop()
+
+    def _request_started(self, sender, **extra):
+        if request.endpoint == "metrics":
+            return
+        g.request_metrics = {"started": time.perf_counter(), "statements": 0, "db_seconds": 0.0,
+                             "serialize_seconds": 0.0, "serialize_depth": 0}
+
+    def _request_finished(self, sender, response, **extra):
+        metrics = g.pop("request_metrics", None)
+        if metrics is None:
+            return
+        metrics["seconds"] = time.perf_counter() - metrics["started"]
+        self.observe(request.endpoint or "unmatched", metrics)
+
+    # ---------------- Recording ---------------- #
+    def observe(self, endpoint, metrics):
+        with self._lock:
+            histograms = self._histograms.get(endpoint)
+            if histograms is None:
+                histograms = self._histograms[endpoint] = {
+                    key: Histogram(buckets) for key, _, _, buckets in METRICS
+                }
+            for key, histogram in histograms.items():
+                histogram.observe(metrics[key])
+            flagged = metrics["statements"] > self.statement_threshold
+            if flagged:
+                self._flagged[endpoint] = self._flagged.get(endpoint, 0) + 1
+
+        if flagged:
+            logger.warning(
+                f"{request.method} {request.path} ({endpoint}) ran {metrics['statements']} SQL statements "
+                f"in {metrics['db_seconds'] * 1000:.1f}ms (threshold {self.statement_threshold})"
+            )
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._flagged.clear()
+
+    def report(self):
+        """Per-endpoint averages and p95s, slowest endpoints first"""
+        with self._lock:
+            rows = []
+            for endpoint, histograms in self._histograms.items():
+                requests = histograms["seconds"].count
+                rows.append({
+                    "endpoint": endpoint,
+                    "requests": requests,
+                    "avg_statements": round(histograms["statements"].sum / requests, 1),
+                    "p95_statements": histograms["statements"].quantile(0.95),
+                    "avg_db_ms": round(histograms["db_seconds"].sum / requests * 1000, 2),
+                    "avg_serialize_ms": round(histograms["serialize_seconds"].sum / requests * 1000, 2),
+                    "avg_ms": round(histograms["seconds"].sum / requests * 1000, 2),
+                    "p95_ms": histograms["seconds"].quantile(0.95) * 1000,
+                    "over_threshold": self._flagged.get(endpoint, 0)
+                })
+        return sorted(rows, key=lambda row: row["avg_ms"], reverse=True)
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            for key, name, description, _ in METRICS:
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} histogram")
+                for endpoint, histograms in sorted(self._histograms.items()):
+                    histogram = histograms[key]
+                    label = f'endpoint="{_label(endpoint)}"'
+                    for bound, count in histogram.samples():
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+                    lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{label}}} {histogram.count}")
+
+            name = "app_requests_over_statement_threshold_total"
+            lines.append(f"# HELP {name} Requests that ran more than {self.statement_threshold} SQL statements")
+            lines.append(f"# TYPE {name} counter")
+            for endpoint, count in sorted(self._flagged.items()):
+                lines.append(f'{name}{{endpoint="{_label(endpoint)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def metrics_view(self):
+        if self.token and request.headers.get("Authorization") != f"Bearer {self.token}":
+            abort(401)
+        return Response(self.prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+def timed_serialization(func):
+    """Add a function's run time to the request's serialization time (outermost call only)"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        metrics = g.get("request_metrics") if has_request_context() else None
+        if metrics is None:
+            return func(*args, **kwargs)
+        metrics["serialize_depth"] += 1
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics["serialize_depth"] -= 1
+            if not metrics["serialize_depth"]:
+                metrics["serialize_seconds"] += time.perf_counter() - started
+    return wrapper
+
+
+instrumentation = Instrumentation()
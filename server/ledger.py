@@ -0,0 +1,313 @@
+# ledger.py - Per-lease rent ledger with materialized running balances
+from datetime import datetime
+from sqlalchemy import insert, update
+from models import db, Lease, Payment, LedgerEntry, LeaseBalance, SUCCESSFUL
+from summaries import period_for
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHARGE = "charge"
+PAYMENT = "payment"
+
+
+def period_start(period):
+    """First day of a 'YYYY-MM' period"""
+    return datetime.strptime(period, "%Y-%m").date().replace(day=1)
+
+
+def next_period(period):
+    year, month = map(int, period.split("-"))
+    return f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def due_date_for(lease_start, period):
+    """Rent is due on the 1st, or on the start date in a lease's first month"""
+    return max(period_start(period), lease_start)
+
+
+def charge_reference(lease_id, period):
+    return f"charge:{lease_id}:{period}"
+
+
+# ---------------- Balances ---------------- #
+def get_balance(lease_id, for_update=False):
+    """Fetch (or start) a lease's balance row; ``for_update`` serializes concurrent postings on Postgres"""
+    balance = db.session.get(LeaseBalance, lease_id, with_for_update=for_update or None)
+    if balance is None:
+        balance = LeaseBalance(lease_id=lease_id, charged=0, credited=0, balance=0)
+        db.session.add(balance)
+    return balance
+
+
+def _refresh_oldest_unpaid(balance):
+    """Point at the first charge not covered by the lease's credits (credits settle oldest charges first)"""
+    if balance.balance <= 0:
+        balance.oldest_unpaid_period = None
+        balance.oldest_unpaid_due = None
+        return
+    oldest = db.session.query(LedgerEntry.period, LedgerEntry.due_date).filter(
+        LedgerEntry.lease_id == balance.lease_id,
+        LedgerEntry.entry_type == CHARGE,
+        LedgerEntry.charged_to_date > balance.credited
+    ).order_by(LedgerEntry.charged_to_date).first()
+    balance.oldest_unpaid_period, balance.oldest_unpaid_due = oldest if oldest else (None, None)
+
+
+def _exists(reference):
+    return db.session.query(LedgerEntry.id).filter(LedgerEntry.reference == reference).first() is not None
+
+
+# ---------------- Posting (the caller commits) ---------------- #
+def post_charge(lease, period):
+    """Charge a lease's rent for a period; posting the same period twice does nothing"""
+    reference = charge_reference(lease.id, period)
+    if _exists(reference):
+        return None
+
+    balance = get_balance(lease.id, for_update=True)
+    amount = lease.rent_amount
+    was_settled = balance.balance <= 0
+    balance.charged += amount
+    balance.balance += amount
+    balance.last_charged_period = max(balance.last_charged_period or period, period)
+
+    entry = LedgerEntry(
+        lease_id=lease.id, entry_type=CHARGE, reference=reference, period=period,
+        due_date=due_date_for(lease.start_date, period), debit=amount, credit=0,
+        charged_to_date=balance.charged, balance_after=balance.balance
+    )
+    db.session.add(entry)
+    db.session.flush()
+
+    # A new charge only becomes the oldest unpaid one if everything before it was paid
+    if was_settled and balance.balance > 0:
+        balance.oldest_unpaid_period, balance.oldest_unpaid_due = period, entry.due_date
+    return entry
+
+
+def charge_lease_through(lease, period=None):
+    """Post every missing rent charge from the lease's first month up to ``period``"""
+    period = period or period_for()
+    last = period_for(lease.end_date) if lease.end_date else period
+    balance = db.session.get(LeaseBalance, lease.id)
+    current = next_period(balance.last_charged_period) if balance and balance.last_charged_period \
+        else period_for(lease.start_date)
+
+    posted = []
+    while current <= min(period, last):
+        entry = post_charge(lease, current)
+        if entry:
+            posted.append(entry)
+        current = next_period(current)
+    return posted
+
+
+def post_payments(payments):
+    """Credit successful payments to their leases' ledgers.
+
+    ``payments`` are rows or objects with id, lease_id, amount and created_at.
+    Balances for all affected leases are loaded in one query; payments
+    already on the ledger are skipped.
+    """
+    payments = list(payments)
+    if not payments:
+        return 0
+
+    posted_refs = {
+        reference for (reference,) in db.session.query(LedgerEntry.reference).filter(
+            LedgerEntry.reference.in_([f"payment:{p.id}" for p in payments])
+        )
+    }
+    lease_ids = {p.lease_id for p in payments}
+    balances = {
+        b.lease_id: b for b in LeaseBalance.query.filter(LeaseBalance.lease_id.in_(lease_ids)).with_for_update()
+    }
+
+    entries = []
+    touched = set()
+    for payment in payments:
+        reference = f"payment:{payment.id}"
+        if reference in posted_refs:
+            continue
+        balance = balances.get(payment.lease_id)
+        if balance is None:
+            balance = balances[payment.lease_id] = get_balance(payment.lease_id)
+        balance.credited += payment.amount
+        balance.balance -= payment.amount
+        touched.add(payment.lease_id)
+        entries.append(dict(
+            lease_id=payment.lease_id, entry_type=PAYMENT, reference=reference,
+            period=period_for(payment.created_at or datetime.now()), debit=0, credit=payment.amount,
+            charged_to_date=balance.charged, balance_after=balance.balance, payment_id=payment.id
+        ))
+
+    if entries:
+        db.session.execute(insert(LedgerEntry), entries)
+    for lease_id in touched:
+        _refresh_oldest_unpaid(balances[lease_id])
+    return len(entries)
+
+
+def delete_lease(lease_id):
+    """Remove a lease's ledger before the lease itself is deleted"""
+    LedgerEntry.query.filter_by(lease_id=lease_id).delete(synchronize_session=False)
+    LeaseBalance.query.filter_by(lease_id=lease_id).delete(synchronize_session=False)
+
+
+# ---------------- Batch charging ---------------- #
+def post_rent_charges(period=None, batch_size=1000, on_chunk=None):
+    """Charge every active lease for ``period`` in chunks of ``batch_size``.
+
+    Each chunk is one SELECT, bulk INSERT/UPDATE statements and a commit, so
+    the job can be stopped and rerun: leases already charged for the period
+    are filtered out by ``last_charged_period``. Returns the number of charges.
+    """
+    period = period or period_for()
+    first_day = period_start(period)
+    last_day = period_start(next_period(period))
+    last_id = 0
+    posted = 0
+
+    while True:
+        chunk = db.session.query(
+            Lease.id, Lease.rent_amount, Lease.start_date, LeaseBalance.lease_id, LeaseBalance.charged,
+            LeaseBalance.balance, LeaseBalance.oldest_unpaid_period, LeaseBalance.oldest_unpaid_due
+        ).outerjoin(
+            LeaseBalance, LeaseBalance.lease_id == Lease.id
+        ).filter(
+            Lease.id > last_id,
+            Lease.status == "active",
+            Lease.start_date < last_day,
+            (Lease.end_date.is_(None)) | (Lease.end_date >= first_day),
+            (LeaseBalance.last_charged_period.is_(None)) | (LeaseBalance.last_charged_period < period)
+        ).order_by(Lease.id).limit(batch_size).all()
+        if not chunk:
+            break
+
+        entries, new_balances, changed_balances = [], [], []
+        for lease_id, rent, start_date, has_balance, charged, balance, oldest_period, oldest_due in chunk:
+            charged, balance = (charged or 0) + rent, (balance or 0) + rent
+            due = due_date_for(start_date, period)
+            if balance > 0 and oldest_period is None:
+                oldest_period, oldest_due = period, due
+            entries.append(dict(
+                lease_id=lease_id, entry_type=CHARGE, reference=charge_reference(lease_id, period), period=period,
+                due_date=due, debit=rent, credit=0, charged_to_date=charged, balance_after=balance
+            ))
+            values = dict(
+                lease_id=lease_id, charged=charged, balance=balance, last_charged_period=period,
+                oldest_unpaid_period=oldest_period, oldest_unpaid_due=oldest_due
+            )
+            if has_balance is None:
+                new_balances.append(dict(values, credited=0))
+            else:
+                changed_balances.append(values)
+
+        db.session.execute(insert(LedgerEntry), entries)
+        if new_balances:
+            db.session.execute(insert(LeaseBalance), new_balances)
+        if changed_balances:
+            db.session.execute(update(LeaseBalance), changed_balances)
+        db.session.commit()
+
+        posted += len(entries)
+        last_id = chunk[-1][0]
+        if on_chunk:
+            on_chunk(posted)
+
+    logger.info(f"Posted {posted} rent charges for {period}")
+    return posted
+
+
+# ---------------- Backfill ---------------- #
+def rebuild_ledger(period=None, batch_size=500):
+    """Rebuild every lease's ledger from its rent terms and successful payments.
+
+    Lease status history is not recorded, so active leases are charged from
+    their start through ``period`` and ended leases through their end date.
+    """
+    period = period or period_for()
+    LedgerEntry.query.delete()
+    LeaseBalance.query.delete()
+
+    last_id = 0
+    rebuilt = 0
+    while True:
+        leases = Lease.query.filter(
+            Lease.id > last_id,
+            Lease.status.in_(["active", "terminated", "expired"])
+        ).order_by(Lease.id).limit(batch_size).all()
+        if not leases:
+            break
+
+        payments = {}
+        for payment in Payment.query.filter(
+            Payment.lease_id.in_([lease.id for lease in leases]), Payment.status == SUCCESSFUL
+        ).order_by(Payment.created_at, Payment.id):
+            payments.setdefault(payment.lease_id, []).append(payment)
+
+        entries, balances = [], []
+        for lease in leases:
+            lease_entries, balance = _replay(lease, payments.get(lease.id, []), period)
+            entries.extend(lease_entries)
+            balances.append(balance)
+
+        if entries:
+            db.session.execute(insert(LedgerEntry), entries)
+        db.session.execute(insert(LeaseBalance), balances)
+        db.session.commit()
+
+        rebuilt += len(leases)
+        last_id = leases[-1].id
+
+    logger.info(f"Rebuilt ledgers for {rebuilt} leases")
+    return rebuilt
+
+
+def _replay(lease, payments, period):
+    """Compute one lease's ledger entries and balance row in date order"""
+    last = period
+    if lease.status != "active":
+        if not lease.end_date:
+            last = None
+        else:
+            last = min(period, period_for(lease.end_date))
+
+    events = []
+    current = period_for(lease.start_date)
+    while last and current <= last:
+        events.append((due_date_for(lease.start_date, current), 0, current))
+        current = next_period(current)
+    for payment in payments:
+        created = payment.created_at or datetime.now()
+        events.append((created.date(), 1, payment))
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    charged = credited = 0
+    entries, charges = [], []
+    last_charged = None
+    for when, kind, item in events:
+        if kind == 0:
+            charged += lease.rent_amount
+            last_charged = item
+            charges.append((charged, item, when))
+            entries.append(dict(
+                lease_id=lease.id, entry_type=CHARGE, reference=charge_reference(lease.id, item), period=item,
+                due_date=when, debit=lease.rent_amount, credit=0, charged_to_date=charged,
+                balance_after=charged - credited
+            ))
+        else:
+            credited += item.amount
+            entries.append(dict(
+                lease_id=lease.id, entry_type=PAYMENT, reference=f"payment:{item.id}", period=period_for(when),
+                debit=0, credit=item.amount, charged_to_date=charged, balance_after=charged - credited,
+                payment_id=item.id
+            ))
+
+    oldest = next(((p, due) for total, p, due in charges if total > credited), (None, None))
+    balance = dict(
+        lease_id=lease.id, charged=charged, credited=credited, balance=charged - credited,
+        last_charged_period=last_charged, oldest_unpaid_period=oldest[0], oldest_unpaid_due=oldest[1]
+    )
+    return entries, balance
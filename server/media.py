@@ -0,0 +1,340 @@
+# media.py - Content-addressed picture uploads, resized variants built in a process pool, and their serving
+import hashlib
+import mimetypes
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from flask import Response, abort, current_app, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+import logging
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it originals are stored and served as uploaded
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+URL_PREFIX = "/uploads/properties"
+CHUNK_SIZE = 64 * 1024
+MAX_BYTES = 10 * 1024 * 1024
+
+# Bounding boxes of the resized copies, smallest first; pictures are never upscaled
+VARIANTS = (("thumb", 320, 240), ("card", 640, 480), ("full", 1600, 1200))
+# Every variant is written in each format; the extension doubles as the format key
+FORMATS = (
+    ("webp", "WEBP", {"quality": 80, "method": 4}),
+    ("jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+)
+
+# Content-addressed names (originals and variants) never change, so browsers may keep them for a year;
+# anything else (files from before uploads were hashed) is revalidated every few minutes
+HASHED_NAME = re.compile(r"^([0-9a-f]{2})/(\1[0-9a-f]{62})(-[a-z]+)?\.[a-z0-9]+$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MUTABLE_MAX_AGE = 300
+SENDFILE_MODES = ("", "x-sendfile", "x-accel-redirect")
+
+# Magic numbers of the accepted upload types
+SIGNATURES = ((b"\xff\xd8\xff", "jpg"), (b"\x89PNG\r\n\x1a\n", "png"), (b"GIF87a", "gif"), (b"GIF89a", "gif"))
+
+StoredFile = namedtuple("StoredFile", ["digest", "path", "url", "byte_size", "width", "height", "created"])
+
+
+class MediaError(Exception):
+    """An upload was rejected; ``status`` is the HTTP status to answer with"""
+
+    status = 400
+
+
+class UploadTooLarge(MediaError):
+    status = 413
+
+
+class UnsupportedMedia(MediaError):
+    status = 415
+
+
+def sniff(head):
+    """Extension for the first bytes of a file, or None when it isn't an accepted image"""
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def variant_sizes(width, height):
+    """``(name, width, height)`` of the variants of a ``width`` x ``height`` picture.
+
+    Sizes only depend on the original's dimensions, so the serializer can list
+    variants without touching the disk. A variant that would come out no
+    bigger than the previous one is left out.
+    """
+    if not width or not height:
+        return []
+    sizes = []
+    for name, max_width, max_height in VARIANTS:
+        scale = min(1, max_width / width, max_height / height)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if sizes and size[0] <= sizes[-1][1]:
+            continue
+        sizes.append((name, *size))
+    return sizes
+
+
+def relative_path(digest, suffix):
+    """Where a file derived from ``digest`` lives under the upload folder"""
+    return f"{digest[:2]}/{digest}{suffix}"
+
+
+def variant_url(digest, name, extension):
+    return f"{URL_PREFIX}/{relative_path(digest, f'-{name}.{extension}')}"
+
+
+def build_variants(source, folder, digest):
+    """Write every variant of ``source`` in every format; runs in a pool worker.
+
+    Files that already exist are kept, so rebuilding is cheap and a picture
+    uploaded twice is only resized once. Returns the paths written.
+    """
+    written = []
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        for name, width, height in variant_sizes(*image.size):
+            resized = None
+            for extension, image_format, options in FORMATS:
+                path = os.path.join(folder, relative_path(digest, f"-{name}.{extension}"))
+                if os.path.exists(path):
+                    continue
+                if resized is None:
+                    resized = image.resize((width, height), Image.LANCZOS) if (width, height) != image.size else image
+                partial = f"{path}.{os.getpid()}.tmp"
+                resized.save(partial, image_format, **options)
+                os.replace(partial, path)
+                written.append(path)
+    return written
+
+
+class MediaStore:
+    """Streams uploads to the upload folder under their SHA-256, resizes them off the request and serves them.
+
+    Originals are written to ``<folder>/<aa>/<sha256>.<ext>`` while being
+    hashed, so the body is never held in memory and identical uploads share
+    one file. Variants are built by ``build_variants`` in a process pool
+    (``MEDIA_WORKERS`` processes, started on first use) and pictures are
+    flagged ``variants_ready`` once they exist.
+
+    Files are served from ``/uploads/properties/<path>`` with a strong ETag
+    (the content hash), 304s for ``If-None-Match`` and Range support. With
+    ``MEDIA_SENDFILE`` set to ``x-sendfile`` or ``x-accel-redirect`` the
+    bytes are left to the front-end server and the worker only answers
+    with headers.
+    """
+
+    def __init__(self):
+        self.folder = None
+        self.max_bytes = MAX_BYTES
+        self.workers = 2
+        self.sendfile = ""
+        self.accel_prefix = "/protected-uploads/"
+        self._executor = None
+        self._lock = threading.Lock()
+        # path -> ((mtime_ns, size), sha256) for files whose names aren't their hash
+        self._etags = {}
+
+    def init_app(self, app):
+        self.folder = os.path.abspath(app.config["UPLOAD_FOLDER"])
+        self.max_bytes = int(app.config.get("MEDIA_MAX_BYTES", MAX_BYTES))
+        self.workers = int(app.config.get("MEDIA_WORKERS", self.workers))
+        self.sendfile = str(app.config.get("MEDIA_SENDFILE", "")).lower()
+        if self.sendfile not in SENDFILE_MODES:
+            raise ValueError(f"MEDIA_SENDFILE must be one of {', '.join(repr(mode) for mode in SENDFILE_MODES)}")
+        self.accel_prefix = app.config.get("MEDIA_ACCEL_PREFIX", self.accel_prefix)
+        if Image is None:
+            logger.warning("Pillow is not installed; picture variants will not be generated")
+        app.add_url_rule(f"{URL_PREFIX}/<path:filename>", "media", self.serve)
+        app.extensions["media_store"] = self
+
+    @property
+    def can_resize(self):
+        return Image is not None
+
+    def path(self, relative):
+        return os.path.join(self.folder, relative)
+
+    # ---------------- Uploads ---------------- #
+    def save(self, stream, content_length=None):
+        """Copy an upload stream to its content-addressed path and describe it.
+
+        Raises UploadTooLarge past ``MEDIA_MAX_BYTES`` and UnsupportedMedia
+        for anything that isn't a JPEG, PNG, GIF or WebP.
+        """
+        if content_length and content_length > self.max_bytes:
+            raise UploadTooLarge(f"Pictures can be at most {self.max_bytes // (1024 * 1024)} MB")
+
+        os.makedirs(self.folder, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        fd, partial = tempfile.mkstemp(prefix=".upload-", dir=self.folder)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadTooLarge(f"Pictures can be at most {self.max_bytes // (1024 * 1024)} MB")
+                    if len(head) < 16:
+                        head += chunk[:16]
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            extension = sniff(head)
+            if size == 0 or extension is None:
+                raise UnsupportedMedia("Upload a JPEG, PNG, GIF or WebP picture")
+
+            digest = digest.hexdigest()
+            relative = relative_path(digest, f".{extension}")
+            path = self.path(relative)
+            created = not os.path.exists(path)
+            if created:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+        width = height = None
+        if Image is not None:
+            try:
+                with Image.open(path) as image:
+                    width, height = ImageOps.exif_transpose(image).size
+            except Exception as e:
+                raise UnsupportedMedia(f"Could not read the picture: {e}")
+
+        return StoredFile(digest, path, f"{URL_PREFIX}/{relative}", size, width, height, created)
+
+    def variants_exist(self, digest, width, height):
+        return all(
+            os.path.exists(self.path(relative_path(digest, f"-{name}.{extension}")))
+            for name, _, _ in variant_sizes(width, height)
+            for extension, _, _ in FORMATS
+        )
+
+    # ---------------- Variants ---------------- #
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Never fork a threaded web worker: a child could inherit a lock (logging, the connection
+                # pool, Pillow's allocator) held by another thread and deadlock. forkserver children are
+                # forked from a clean single-threaded server process instead.
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def submit_variants(self, app, stored):
+        """Build the variants of a stored upload in the background, then flag its pictures"""
+        if Image is None:
+            return None
+
+        def finished(future):
+            try:
+                future.result()
+            except Exception:
+                logger.exception(f"Building variants of {stored.digest} failed")
+                return
+            with app.app_context():
+                mark_variants_ready(stored.digest)
+
+        future = self._pool().submit(build_variants, stored.path, self.folder, stored.digest)
+        future.add_done_callback(finished)
+        return future
+
+    # ---------------- Serving ---------------- #
+    def _etag(self, filename, path, stat):
+        """Strong ETag of a file and whether its name pins its content"""
+        match = HASHED_NAME.match(filename)
+        if match:
+            return match.group(2) + (match.group(3) or ""), True
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._etags.get(path)
+        if cached is None or cached[0] != version:
+            with open(path, "rb") as f:
+                cached = self._etags[path] = (version, hashlib.file_digest(f, "sha256").hexdigest())
+        return cached[1], False
+
+    def serve(self, filename):
+        path = safe_join(self.folder, filename)
+        if path is None or os.path.basename(path).startswith(".") or not os.path.isfile(path):
+            abort(404)
+        stat = os.stat(path)
+        etag, immutable = self._etag(filename, path, stat)
+        max_age = IMMUTABLE_MAX_AGE if immutable else MUTABLE_MAX_AGE
+
+        if self.sendfile == "x-accel-redirect":
+            # nginx serves the internal location, Range requests included
+            response = Response(mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream")
+            response.set_etag(etag)
+            response.last_modified = stat.st_mtime
+            if request.if_none_match.contains(etag):
+                response.status_code = 304
+            else:
+                response.headers["X-Accel-Redirect"] = f"{self.accel_prefix.rstrip('/')}/{filename}"
+        else:
+            response = send_file(
+                path, request.environ, use_x_sendfile=self.sendfile == "x-sendfile",
+                response_class=current_app.response_class, conditional=True, etag=etag,
+                last_modified=stat.st_mtime, max_age=max_age
+            )
+
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = immutable or None
+        return response
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+def mark_variants_ready(digest):
+    from models import db, PropertyPicture
+    PropertyPicture.query.filter_by(content_hash=digest).update({"variants_ready": True})
+    db.session.commit()
+
+
+def rebuild_variants():
+    """Build missing variants for every uploaded picture, in this process. Returns how many were updated"""
+    from models import db, PropertyPicture
+    if Image is None:
+        raise RuntimeError("Pillow is required to build picture variants")
+
+    digests = db.session.query(PropertyPicture.content_hash, PropertyPicture.url).filter(
+        PropertyPicture.content_hash.isnot(None), PropertyPicture.variants_ready.is_(False)
+    ).distinct().all()
+    built = 0
+    for digest, url in digests:
+        source = media_store.path(url[len(URL_PREFIX) + 1:])
+        if not os.path.exists(source):
+            logger.warning(f"Original of {digest} is missing at {source}")
+            continue
+        build_variants(source, media_store.folder, digest)
+        mark_variants_ready(digest)
+        built += 1
+    return built
+
+
+media_store = MediaStore()
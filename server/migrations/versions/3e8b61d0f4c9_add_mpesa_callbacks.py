@@ -0,0 +1,41 @@
+"""add mpesa callbacks inbox
+
+Revision ID: 3e8b61d0f4c9
+Revises: a73f0c5e19d2
+Create Date: 2026-10-17 13:48:27.530941
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8b61d0f4c9'
+down_revision = 'a73f0c5e19d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('mpesa_callbacks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('checkout_request_id', sa.String(length=120), nullable=True),
+    sa.Column('result_code', sa.Integer(), nullable=True),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('received_at', sa.DateTime(), nullable=False),
+    sa.Column('available_at', sa.DateTime(), nullable=False),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.Column('outcome', sa.String(length=20), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('mpesa_callbacks', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_mpesa_callbacks_checkout_request_id'), ['checkout_request_id'], unique=False)
+        batch_op.create_index('ix_mpesa_callbacks_processed_available', ['processed_at', 'available_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('mpesa_callbacks', schema=None) as batch_op:
+        batch_op.drop_index('ix_mpesa_callbacks_processed_available')
+        batch_op.drop_index(batch_op.f('ix_mpesa_callbacks_checkout_request_id'))
+
+    op.drop_table('mpesa_callbacks')
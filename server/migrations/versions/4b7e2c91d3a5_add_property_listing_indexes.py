@@ -0,0 +1,32 @@
+"""add property listing indexes
+
+Revision ID: 4b7e2c91d3a5
+Revises: 09d6eed566d2
+Create Date: 2026-10-17 09:12:40.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e2c91d3a5'
+down_revision = '09d6eed566d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('properties', schema=None) as batch_op:
+        batch_op.create_index('ix_properties_location_id', ['location', 'id'], unique=False)
+        batch_op.create_index('ix_properties_status_id', ['status', 'id'], unique=False)
+        batch_op.create_index('ix_properties_landlord_id_id', ['landlord_id', 'id'], unique=False)
+        batch_op.create_index('ix_properties_rent_id', ['rent', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('properties', schema=None) as batch_op:
+        batch_op.drop_index('ix_properties_rent_id')
+        batch_op.drop_index('ix_properties_landlord_id_id')
+        batch_op.drop_index('ix_properties_status_id')
+        batch_op.drop_index('ix_properties_location_id')
@@ -0,0 +1,28 @@
+"""add notification broadcast id
+
+Revision ID: 5d0b7e3a94f1
+Revises: c2a91e4f7b08
+Create Date: 2026-10-17 12:02:44.870126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0b7e3a94f1'
+down_revision = 'c2a91e4f7b08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('broadcast_id', sa.String(length=32), nullable=True))
+        batch_op.create_index(batch_op.f('ix_notifications_broadcast_id'), ['broadcast_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_notifications_broadcast_id'))
+        batch_op.drop_column('broadcast_id')
@@ -0,0 +1,43 @@
+"""add payment rollups
+
+Revision ID: 6a1f3b9c2e84
+Revises: f2a6c9d84b13
+Create Date: 2026-10-17 16:12:40.305518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a1f3b9c2e84'
+down_revision = 'f2a6c9d84b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('payment_rollups',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('granularity', sa.String(length=5), nullable=False),
+    sa.Column('bucket', sa.String(length=10), nullable=False),
+    sa.Column('landlord_id', sa.Integer(), nullable=False),
+    sa.Column('property_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('provider', sa.String(length=120), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['landlord_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['property_id'], ['properties.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('granularity', 'bucket', 'property_id', 'status', 'provider', name='uq_payment_rollups_bucket_key')
+    )
+    with op.batch_alter_table('payment_rollups', schema=None) as batch_op:
+        batch_op.create_index('ix_payment_rollups_landlord_bucket', ['granularity', 'landlord_id', 'bucket'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('payment_rollups', schema=None) as batch_op:
+        batch_op.drop_index('ix_payment_rollups_landlord_bucket')
+
+    op.drop_table('payment_rollups')
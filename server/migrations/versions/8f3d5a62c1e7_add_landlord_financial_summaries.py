@@ -0,0 +1,37 @@
+"""add landlord financial summaries
+
+Revision ID: 8f3d5a62c1e7
+Revises: 4b7e2c91d3a5
+Create Date: 2026-10-17 10:03:18.552914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3d5a62c1e7'
+down_revision = '4b7e2c91d3a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('landlord_financial_summaries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('landlord_id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.String(length=7), nullable=False),
+    sa.Column('collected', sa.Float(), nullable=False),
+    sa.Column('billed', sa.Float(), nullable=False),
+    sa.Column('pending_bills', sa.Float(), nullable=False),
+    sa.Column('active_leases', sa.Integer(), nullable=False),
+    sa.Column('expected_rent', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['landlord_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('landlord_id', 'period', name='uq_landlord_financial_summaries_landlord_period')
+    )
+
+
+def downgrade():
+    op.drop_table('landlord_financial_summaries')
@@ -0,0 +1,116 @@
+"""move property pictures into their own table
+
+Revision ID: 9c4e7a2d15b8
+Revises: 6a1f3b9c2e84
+Create Date: 2026-10-17 17:05:12.481936
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime, timezone
+import json
+import os
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e7a2d15b8'
+down_revision = '6a1f3b9c2e84'
+branch_labels = None
+depends_on = None
+
+UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'uploads', 'properties')
+UPLOAD_PREFIX = '/uploads/properties/'
+
+properties = sa.table('properties', sa.column('id', sa.Integer), sa.column('pictures', sa.Text))
+property_pictures = sa.table(
+    'property_pictures',
+    sa.column('property_id', sa.Integer), sa.column('position', sa.Integer), sa.column('url', sa.String),
+    sa.column('width', sa.Integer), sa.column('height', sa.Integer), sa.column('byte_size', sa.Integer),
+    sa.column('created_at', sa.DateTime)
+)
+
+
+def _urls(value):
+    """The URLs in an old ``pictures`` value: a JSON list, a JSON string or a bare URL"""
+    if not value:
+        return []
+    try:
+        loaded = json.loads(value)
+    except ValueError:
+        return [value]
+    if isinstance(loaded, str):
+        loaded = [loaded]
+    if not isinstance(loaded, list):
+        return []
+    return [url for url in loaded if isinstance(url, str) and url]
+
+
+def _local_metadata(url):
+    """Size (and dimensions, when Pillow is installed) of a picture uploaded to this server"""
+    if UPLOAD_PREFIX not in url:
+        return {}
+    path = os.path.join(UPLOAD_FOLDER, os.path.basename(url.split(UPLOAD_PREFIX, 1)[1]))
+    if not os.path.isfile(path):
+        return {}
+    metadata = {'byte_size': os.path.getsize(path)}
+    try:
+        from PIL import Image
+        with Image.open(path) as image:
+            metadata['width'], metadata['height'] = image.size
+    except Exception:
+        pass
+    return metadata
+
+
+def upgrade():
+    op.create_table('property_pictures',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('property_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('url', sa.String(length=500), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=True),
+    sa.Column('height', sa.Integer(), nullable=True),
+    sa.Column('byte_size', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['property_id'], ['properties.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('property_pictures', schema=None) as batch_op:
+        batch_op.create_index('ix_property_pictures_property_id_position', ['property_id', 'position'], unique=False)
+
+    connection = op.get_bind()
+    now = datetime.now(timezone.utc)
+    rows = []
+    for property_id, value in connection.execute(sa.select(properties.c.id, properties.c.pictures)):
+        for position, url in enumerate(_urls(value)):
+            row = dict(property_id=property_id, position=position, url=url[:500], width=None, height=None,
+                       byte_size=None, created_at=now)
+            row.update(_local_metadata(url))
+            rows.append(row)
+    if rows:
+        connection.execute(property_pictures.insert(), rows)
+
+    with op.batch_alter_table('properties', schema=None) as batch_op:
+        batch_op.drop_column('pictures')
+
+
+def downgrade():
+    with op.batch_alter_table('properties', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('pictures', sa.Text(), nullable=True))
+
+    connection = op.get_bind()
+    galleries = {}
+    for property_id, url in connection.execute(
+        sa.select(property_pictures.c.property_id, property_pictures.c.url)
+        .order_by(property_pictures.c.property_id, property_pictures.c.position)
+    ):
+        galleries.setdefault(property_id, []).append(url)
+    for property_id, urls in galleries.items():
+        connection.execute(
+            properties.update().where(properties.c.id == property_id).values(pictures=json.dumps(urls))
+        )
+
+    with op.batch_alter_table('property_pictures', schema=None) as batch_op:
+        batch_op.drop_index('ix_property_pictures_property_id_position')
+
+    op.drop_table('property_pictures')
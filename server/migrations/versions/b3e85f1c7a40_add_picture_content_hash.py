@@ -0,0 +1,30 @@
+"""add content hash and variant flag to property pictures
+
+Revision ID: b3e85f1c7a40
+Revises: 9c4e7a2d15b8
+Create Date: 2026-10-17 17:48:31.902217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e85f1c7a40'
+down_revision = '9c4e7a2d15b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('property_pictures', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('variants_ready', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.create_index('ix_property_pictures_content_hash', ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('property_pictures', schema=None) as batch_op:
+        batch_op.drop_index('ix_property_pictures_content_hash')
+        batch_op.drop_column('variants_ready')
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,26 @@
+"""add bill status/due date index
+
+Revision ID: b58d2e7a0c61
+Revises: 3e8b61d0f4c9
+Create Date: 2026-10-17 14:21:09.846112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b58d2e7a0c61'
+down_revision = '3e8b61d0f4c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bills', schema=None) as batch_op:
+        batch_op.create_index('ix_bills_status_due_date', ['status', 'due_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('bills', schema=None) as batch_op:
+        batch_op.drop_index('ix_bills_status_due_date')
@@ -0,0 +1,28 @@
+"""add table versions
+
+Revision ID: c7d2e94a1f36
+Revises: b3e85f1c7a40
+Create Date: 2026-10-17 18:26:09.517342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2e94a1f36'
+down_revision = 'b3e85f1c7a40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('table_versions',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('table_versions')
@@ -0,0 +1,62 @@
+"""add full-text search index over property name and location
+
+Revision ID: d8f4a6b2c913
+Revises: c7d2e94a1f36
+Create Date: 2026-10-17 19:12:44.305518
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f4a6b2c913'
+down_revision = 'c7d2e94a1f36'
+branch_labels = None
+depends_on = None
+
+# Kept in step with search.py; the index is maintained by the application, not by triggers
+SQLITE_UPGRADE = (
+    "CREATE VIRTUAL TABLE property_search USING fts5("
+    "name, location, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "CREATE VIRTUAL TABLE property_search_terms USING fts5vocab(property_search, row)",
+    "INSERT INTO property_search (rowid, name, location) SELECT id, name, location FROM properties",
+)
+SQLITE_DOWNGRADE = (
+    "DROP TABLE property_search_terms",
+    "DROP TABLE property_search",
+)
+
+POSTGRES_UPGRADE = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE TABLE property_search ("
+    "property_id INTEGER PRIMARY KEY REFERENCES properties (id) ON DELETE CASCADE, "
+    "document TSVECTOR NOT NULL, content TEXT NOT NULL)",
+    "INSERT INTO property_search (property_id, document, content) "
+    "SELECT id, setweight(to_tsvector('simple', name), 'A') || setweight(to_tsvector('simple', location), 'B'), "
+    "name || ' ' || location FROM properties",
+    "CREATE INDEX ix_property_search_document ON property_search USING GIN (document)",
+    "CREATE INDEX ix_property_search_content_trgm ON property_search USING GIN (content gin_trgm_ops)",
+)
+POSTGRES_DOWNGRADE = (
+    "DROP TABLE property_search",
+)
+
+
+def _statements(upgrade):
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return SQLITE_UPGRADE if upgrade else SQLITE_DOWNGRADE
+    if dialect == 'postgresql':
+        return POSTGRES_UPGRADE if upgrade else POSTGRES_DOWNGRADE
+    # Other databases search with LIKE; nothing to create
+    return ()
+
+
+def upgrade():
+    for statement in _statements(upgrade=True):
+        op.execute(statement)
+
+
+def downgrade():
+    for statement in _statements(upgrade=False):
+        op.execute(statement)
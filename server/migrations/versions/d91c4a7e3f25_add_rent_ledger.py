@@ -0,0 +1,65 @@
+"""add rent ledger
+
+Revision ID: d91c4a7e3f25
+Revises: b58d2e7a0c61
+Create Date: 2026-10-17 14:58:36.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91c4a7e3f25'
+down_revision = 'b58d2e7a0c61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ledger_entries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lease_id', sa.Integer(), nullable=False),
+    sa.Column('entry_type', sa.String(length=20), nullable=False),
+    sa.Column('reference', sa.String(length=64), nullable=False),
+    sa.Column('period', sa.String(length=7), nullable=False),
+    sa.Column('due_date', sa.Date(), nullable=True),
+    sa.Column('debit', sa.Float(), nullable=False),
+    sa.Column('credit', sa.Float(), nullable=False),
+    sa.Column('charged_to_date', sa.Float(), nullable=False),
+    sa.Column('balance_after', sa.Float(), nullable=False),
+    sa.Column('payment_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['lease_id'], ['leases.id'], ),
+    sa.ForeignKeyConstraint(['payment_id'], ['payments.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('reference')
+    )
+    with op.batch_alter_table('ledger_entries', schema=None) as batch_op:
+        batch_op.create_index('ix_ledger_entries_lease_type_charged', ['lease_id', 'entry_type', 'charged_to_date'], unique=False)
+
+    op.create_table('lease_balances',
+    sa.Column('lease_id', sa.Integer(), nullable=False),
+    sa.Column('charged', sa.Float(), nullable=False),
+    sa.Column('credited', sa.Float(), nullable=False),
+    sa.Column('balance', sa.Float(), nullable=False),
+    sa.Column('last_charged_period', sa.String(length=7), nullable=True),
+    sa.Column('oldest_unpaid_period', sa.String(length=7), nullable=True),
+    sa.Column('oldest_unpaid_due', sa.Date(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['lease_id'], ['leases.id'], ),
+    sa.PrimaryKeyConstraint('lease_id')
+    )
+    with op.batch_alter_table('lease_balances', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_lease_balances_oldest_unpaid_due'), ['oldest_unpaid_due'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('lease_balances', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_lease_balances_oldest_unpaid_due'))
+
+    op.drop_table('lease_balances')
+    with op.batch_alter_table('ledger_entries', schema=None) as batch_op:
+        batch_op.drop_index('ix_ledger_entries_lease_type_charged')
+
+    op.drop_table('ledger_entries')
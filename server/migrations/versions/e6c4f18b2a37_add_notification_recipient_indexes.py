@@ -0,0 +1,28 @@
+"""add notification recipient indexes
+
+Revision ID: e6c4f18b2a37
+Revises: 5d0b7e3a94f1
+Create Date: 2026-10-17 12:40:11.204395
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6c4f18b2a37'
+down_revision = '5d0b7e3a94f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_notifications_recipient_read_created', ['recipient_id', 'is_read', 'created_at'], unique=False)
+        batch_op.create_index('ix_notifications_recipient_created_id', ['recipient_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_recipient_created_id')
+        batch_op.drop_index('ix_notifications_recipient_read_created')
@@ -0,0 +1,28 @@
+"""add bill period
+
+Revision ID: f2a6c9d84b13
+Revises: d91c4a7e3f25
+Create Date: 2026-10-17 15:34:52.117640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a6c9d84b13'
+down_revision = 'd91c4a7e3f25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bills', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('period', sa.String(length=7), nullable=True))
+        batch_op.create_unique_constraint('uq_bills_lease_period', ['lease_id', 'period'])
+
+
+def downgrade():
+    with op.batch_alter_table('bills', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_bills_lease_period', type_='unique')
+        batch_op.drop_column('period')
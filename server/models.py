@@ -1,4 +1,3 @@
-import json
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import Enum
 from flask_bcrypt import Bcrypt
@@ -6,7 +5,6 @@ from sqlalchemy.orm import validates
 from datetime import date, datetime, timezone
 import hashlib
 import uuid
-from sqlalchemy_serializer import SerializerMixin
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
@@ -30,9 +28,21 @@ IN_PROGRESS = 'in progress'
 CLOSED = 'closed'
 REPAIR_REQUEST_STATUS = {OPEN, IN_PROGRESS, CLOSED}
 
+NOTIFICATION_TYPES = ("general", "urgent", "maintenance", "payment", "lease", "system")
 
 
-class User(db.Model, SerializerMixin):
+class Serializable:
+    """``to_dict()`` through the model's compiled schema in serializers.py.
+
+    ``fields`` is an optional projection from ``Schema.parse_fields``.
+    """
+
+    def to_dict(self, fields=None):
+        from serializers import dump
+        return dump(self, fields)
+
+
+class User(db.Model, Serializable):
     __tablename__ = "users"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -52,9 +62,6 @@ class User(db.Model, SerializerMixin):
     leases = db.relationship("Lease", back_populates="tenant", cascade="all, delete-orphan")
     properties = db.relationship("Property", back_populates="landlord")
 
-    serialize_rules = ("-leases.tenant", "-leases.property" "-properties.landlord","-sent_notifications.sender","-received_notifications.recipient","-sent_notifications.recipient", "-received_notifications.sender",)
-
-
     def __repr__(self):
         return f"<User {self.username}>"
 
@@ -93,28 +100,12 @@ class User(db.Model, SerializerMixin):
             raise ValueError("Invalid")
         return national_id
 
-    def to_dict(self):
-        return {
-            "public_id": self.public_id,
-            "first_name": self.first_name,
-            "last_name": self.last_name,
-            "username": self.username,
-            "email": self.email,
-            "national_id": self.national_id,
-            "phone_number": self.phone_number,
-            "role": self.role,
-            "is_active": self.is_active,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None
-        }
-
-
     @staticmethod
     def validate_role_static(role):
         return role in VALID_ROLES
 
 
-class Property(db.Model, SerializerMixin):
+class Property(db.Model, Serializable):
     __tablename__ = "properties"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -122,44 +113,62 @@ class Property(db.Model, SerializerMixin):
     location = db.Column(db.String(150), nullable=False)
     rent = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), nullable=False, default="vacant")
-    pictures = db.Column(db.Text, nullable=True)
     landlord_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
 
     landlord = db.relationship("User", back_populates="properties")
 
+    pictures = db.relationship("PropertyPicture", back_populates="property", order_by="PropertyPicture.position",
+                               cascade="all, delete-orphan")
+    # Just the first picture, so listings can load covers without whole galleries
+    cover_picture = db.relationship(
+        "PropertyPicture", uselist=False, viewonly=True,
+        primaryjoin="and_(Property.id == PropertyPicture.property_id, PropertyPicture.position == 0)"
+    )
+
     leases = db.relationship("Lease", back_populates="property", cascade="all, delete-orphan")
 
-    serialize_rules = (
-        "-leases.property",
-        "-landlord.properties",
+    # Composite indexes backing the filtered, keyset-paginated /properties listing
+    __table_args__ = (
+        db.Index("ix_properties_location_id", "location", "id"),
+        db.Index("ix_properties_status_id", "status", "id"),
+        db.Index("ix_properties_landlord_id_id", "landlord_id", "id"),
+        db.Index("ix_properties_rent_id", "rent", "id"),
+    )
+
+    def set_pictures(self, urls):
+        """Replace the gallery with ``urls`` in order, keeping the rows (and sizes) of URLs already there"""
+        existing = {picture.url: picture for picture in self.pictures}
+        pictures = []
+        for position, url in enumerate(urls):
+            picture = existing.pop(url, None) or PropertyPicture(url=url)
+            picture.position = position
+            pictures.append(picture)
+        self.pictures = pictures
+
+
+class PropertyPicture(db.Model, Serializable):
+    __tablename__ = "property_pictures"
+
+    id = db.Column(db.Integer, primary_key=True)
+    property_id = db.Column(db.Integer, db.ForeignKey("properties.id"), nullable=False)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    url = db.Column(db.String(500), nullable=False)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    byte_size = db.Column(db.Integer, nullable=True)
+    # SHA-256 of uploaded files (None for external URLs); resized copies are named after it
+    content_hash = db.Column(db.String(64), nullable=True)
+    variants_ready = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    property = db.relationship("Property", back_populates="pictures")
+
+    __table_args__ = (
+        db.Index("ix_property_pictures_property_id_position", "property_id", "position"),
+        db.Index("ix_property_pictures_content_hash", "content_hash"),
     )
 
-    def to_dict(self):
-        parsed_pictures = []
-        if self.pictures:
-            try:
-                loaded_data = json.loads(self.pictures)
-                if isinstance(loaded_data, list):
-                    parsed_pictures = loaded_data
-                elif isinstance(loaded_data, str):
-                    parsed_pictures = [loaded_data]
-            except json.JSONDecodeError:
-                parsed_pictures = [self.pictures]
-            except Exception:
-                parsed_pictures = []
-
-        return {
-            "id": self.id,
-            "name": self.name,
-            "location": self.location,
-            "rent": self.rent,
-            "status": self.status,
-            "pictures": parsed_pictures,
-            "landlord_id": self.landlord_id,
-        }
-
-
-class Lease(db.Model, SerializerMixin):
+class Lease(db.Model, Serializable):
     __tablename__ = "leases"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -177,7 +186,6 @@ class Lease(db.Model, SerializerMixin):
     property = db.relationship("Property", back_populates="leases")
     bills = db.relationship("Bill", back_populates="lease", cascade="all, delete-orphan")
     payments = db.relationship('Payment', back_populates='lease', cascade='all, delete-orphan')
-    serialize_rules = ("-tenant.leases", "-property.leases", "-bills.lease", "-payments.lease")
 
     @validates("end_date")
     def validate_dates(self, key, end_date):
@@ -224,7 +232,7 @@ class Lease(db.Model, SerializerMixin):
         return value
 
 
-class Bill(db.Model, SerializerMixin):
+class Bill(db.Model, Serializable):
     __tablename__ = "bills"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -232,11 +240,18 @@ class Bill(db.Model, SerializerMixin):
     amount = db.Column(db.Float, nullable=False)
     due_date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String, default="unpaid")
+    # Billing month ('YYYY-MM') of monthly rent bills; one-off bills leave it empty
+    period = db.Column(db.String(7), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
 
     lease = db.relationship("Lease", back_populates="bills")
 
-    serialize_rules = ("-lease.bills",)
+    # Overdue scans look for unpaid bills by due date across all leases;
+    # the unique period keeps the monthly billing job from billing a lease twice
+    __table_args__ = (
+        db.Index("ix_bills_status_due_date", "status", "due_date"),
+        db.UniqueConstraint("lease_id", "period", name="uq_bills_lease_period"),
+    )
 
     @validates("amount")
     def validate_amount(self, key, value):
@@ -267,7 +282,7 @@ class Bill(db.Model, SerializerMixin):
             return round(self.amount * (1 + penalty_rate), 2)
         return self.amount
 
-class Notification(db.Model, SerializerMixin):
+class Notification(db.Model, Serializable):
     __tablename__ = "notifications"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -278,47 +293,31 @@ class Notification(db.Model, SerializerMixin):
     notification_type = db.Column(db.String(50), default="general", nullable=False)
     is_broadcast = db.Column(db.Boolean, default=False, nullable=False)
     is_read = db.Column(db.Boolean, default=False, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
     read_at = db.Column(db.DateTime, nullable=True)
+    broadcast_id = db.Column(db.String(32), nullable=True, index=True)
 
     sender = db.relationship("User", foreign_keys=[sender_id], backref="sent_notifications")
     recipient = db.relationship("User", foreign_keys=[recipient_id], backref="received_notifications")
 
-    serialize_rules = ("-sender.sent_notifications", "-recipient.received_notifications","-sender.received_notifications", "-recipient.sent_notifications","-sender.password_hash", "-recipient.password_hash")
+
+    # Bell-icon polls: unread counts and newest-first pages per recipient
+    __table_args__ = (
+        db.Index("ix_notifications_recipient_read_created", "recipient_id", "is_read", "created_at"),
+        db.Index("ix_notifications_recipient_created_id", "recipient_id", "created_at", "id"),
+    )
 
     @validates('notification_type')
     def validate_notification_type(self, key, value):
-        valid_types = ["general", "urgent", "maintenance", "payment", "lease", "system"]
-        if value not in valid_types:
-            raise ValueError(f"Invalid notification type: {value}. Must be one of {valid_types}")
+        if value not in NOTIFICATION_TYPES:
+            raise ValueError(f"Invalid notification type: {value}. Must be one of {list(NOTIFICATION_TYPES)}")
         return value
 
     def mark_as_read(self):
         self.is_read = True
         self.read_at = datetime.now(timezone.utc)
 
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "sender": {
-                "id": self.sender.public_id if self.sender else None,
-                "name": f"{self.sender.first_name} {self.sender.last_name}" if self.sender else "System",
-                "role": self.sender.role if self.sender else "System"
-            },
-            "recipient": {
-                "id": self.recipient.public_id if self.recipient else None,
-                "name": f"{self.recipient.first_name} {self.recipient.last_name}" if self.recipient else "All tenants"
-            } if self.recipient else None,
-            "title": self.title,
-            "message": self.message,
-            "notification_type": self.notification_type,
-            "is_broadcast": self.is_broadcast,
-            "is_read": self.is_read,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "read_at": self.read_at.isoformat() if self.read_at else None
-        }
-
-class Payment(db.Model):
+class Payment(db.Model, Serializable):
     __tablename__ = 'payments'
 
 
@@ -333,7 +332,7 @@ class Payment(db.Model):
     lease = db.relationship('Lease', back_populates= 'payments')
 
 
-class RepairRequest(db.Model):
+class RepairRequest(db.Model, Serializable):
     __tablename__ = 'repairs'
 
 
@@ -344,4 +343,143 @@ class RepairRequest(db.Model):
     description = db.Column(db.Text, nullable=False)
     status = db.Column(Enum(*REPAIR_REQUEST_STATUS, name='status'))
     priority = db.Column(db.String(20), default='normal')
-    created_at = db.Column(db.DateTime, default =lambda: datetime.now(timezone.utc))
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default =lambda: datetime.now(timezone.utc))
+
+class LandlordFinancialSummary(db.Model):
+    """Per-landlord, per-month totals kept up to date as payments, bills and
+    leases change, so dashboards don't rescan history. See summaries.py."""
+    __tablename__ = 'landlord_financial_summaries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    landlord_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    period = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    collected = db.Column(db.Float, nullable=False, default=0)
+    billed = db.Column(db.Float, nullable=False, default=0)
+    pending_bills = db.Column(db.Float, nullable=False, default=0)
+    active_leases = db.Column(db.Integer, nullable=False, default=0)
+    expected_rent = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        db.UniqueConstraint('landlord_id', 'period', name='uq_landlord_financial_summaries_landlord_period'),
+    )
+
+
+class RevokedToken(db.Model):
+    """JWT ids revoked by logout, kept until the token would have expired anyway"""
+    __tablename__ = 'revoked_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, index=True, nullable=False)
+    expires_at = db.Column(db.DateTime, index=True, nullable=False)
+    revoked_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+
+class OutboundMessage(db.Model):
+    """Email/SMS waiting to be delivered by the outbox worker. See outbox.py."""
+    __tablename__ = 'outbound_messages'
+
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(10), nullable=False)  # email | sms
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=True)
+    body = db.Column(db.Text, nullable=False)
+    html_body = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending | sending | sent | failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    # The worker scans for due messages by status and retry time
+    __table_args__ = (
+        db.Index('ix_outbound_messages_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+
+class MpesaCallback(db.Model):
+    """Raw Daraja STK callbacks, stored as received and applied later by payment_inbox.py"""
+    __tablename__ = 'mpesa_callbacks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    checkout_request_id = db.Column(db.String(120), nullable=True, index=True)
+    result_code = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.Text, nullable=False)
+    received_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    available_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    outcome = db.Column(db.String(20), nullable=True)  # applied | duplicate | unmatched | invalid
+
+    # Workers pick up unprocessed callbacks that are due, oldest first
+    __table_args__ = (
+        db.Index('ix_mpesa_callbacks_processed_available', 'processed_at', 'available_at'),
+    )
+
+
+class LedgerEntry(db.Model):
+    """One line of a lease's rent ledger: a rent charge (debit) or a payment (credit). See ledger.py."""
+    __tablename__ = 'ledger_entries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    lease_id = db.Column(db.Integer, db.ForeignKey('leases.id'), nullable=False)
+    entry_type = db.Column(db.String(20), nullable=False)  # charge | payment
+    # Makes posting idempotent: "charge:<lease>:<period>", "payment:<id>"
+    reference = db.Column(db.String(64), nullable=False, unique=True)
+    period = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    due_date = db.Column(db.Date, nullable=True)
+    debit = db.Column(db.Float, nullable=False, default=0)
+    credit = db.Column(db.Float, nullable=False, default=0)
+    # Total charged to the lease up to and including this entry; locates the oldest unpaid charge
+    charged_to_date = db.Column(db.Float, nullable=False)
+    balance_after = db.Column(db.Float, nullable=False)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_ledger_entries_lease_type_charged', 'lease_id', 'entry_type', 'charged_to_date'),
+    )
+
+
+class LeaseBalance(db.Model):
+    """Materialized running totals of a lease's ledger, so balance questions are single-row lookups"""
+    __tablename__ = 'lease_balances'
+
+    lease_id = db.Column(db.Integer, db.ForeignKey('leases.id'), primary_key=True)
+    charged = db.Column(db.Float, nullable=False, default=0)
+    credited = db.Column(db.Float, nullable=False, default=0)
+    balance = db.Column(db.Float, nullable=False, default=0)
+    last_charged_period = db.Column(db.String(7), nullable=True)
+    oldest_unpaid_period = db.Column(db.String(7), nullable=True)
+    oldest_unpaid_due = db.Column(db.Date, nullable=True, index=True)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc), nullable=False)
+
+
+class PaymentRollup(db.Model):
+    """Daily and monthly payment counts and sums per property, status and provider. See analytics.py."""
+    __tablename__ = 'payment_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(5), nullable=False)  # day | month
+    bucket = db.Column(db.String(10), nullable=False)  # 'YYYY-MM-DD' or 'YYYY-MM'
+    landlord_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    property_id = db.Column(db.Integer, db.ForeignKey('properties.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    provider = db.Column(db.String(120), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket', 'property_id', 'status', 'provider',
+                            name='uq_payment_rollups_bucket_key'),
+        db.Index('ix_payment_rollups_landlord_bucket', 'granularity', 'landlord_id', 'bucket'),
+    )
+
+
+class TableVersion(db.Model):
+    """Change counter per table, bumped on commit; response ETags are built from these. See response_cache.py."""
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
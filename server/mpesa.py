@@ -0,0 +1,234 @@
+# mpesa.py - Pooled M-Pesa Daraja client with a cached OAuth token and a circuit breaker
+import base64
+import threading
+import time
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+import logging
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_URL = "https://sandbox.safaricom.co.ke"
+# Refresh the OAuth token this many seconds before Daraja says it expires
+TOKEN_REFRESH_MARGIN = 60
+
+
+class MpesaError(Exception):
+    """Daraja rejected a request or returned something unusable"""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details
+
+
+class MpesaUnavailable(MpesaError):
+    """Daraja is unreachable or the circuit breaker is open; retry later"""
+
+
+class CircuitBreaker:
+    """Stops calling Daraja after repeated failures so requests fail fast.
+
+    After ``failure_threshold`` consecutive failures the breaker opens for
+    ``reset_timeout`` seconds. The first call after that is let through as a
+    trial; success closes the breaker and failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"M-Pesa circuit opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class MpesaClient:
+    """Thread-safe Daraja client shared by every request in a worker.
+
+    One ``requests.Session`` keeps TLS connections to Daraja alive across STK
+    pushes, the OAuth token is reused until shortly before it expires, every
+    call has connect/read timeouts, and a circuit breaker turns an outage into
+    immediate ``MpesaUnavailable`` errors instead of piled-up slow requests.
+    """
+
+    def __init__(self, **settings):
+        self._token_lock = threading.Lock()
+        self.configure(**settings)
+
+    def configure(self, base_url=SANDBOX_URL, consumer_key=None, consumer_secret=None, shortcode=None,
+                  passkey=None, callback_url=None, connect_timeout=3.05, read_timeout=10, pool_size=20,
+                  failure_threshold=5, reset_timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.shortcode = shortcode
+        self.passkey = passkey
+        self.callback_url = callback_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session = self._make_session()
+
+        self._token = None
+        self._token_expires_at = 0
+
+    def init_app(self, app):
+        self.configure(
+            base_url=app.config.get("MPESA_BASE_URL", SANDBOX_URL),
+            consumer_key=app.config.get("MPESA_CONSUMER_KEY"),
+            consumer_secret=app.config.get("MPESA_CONSUMER_SECRET"),
+            shortcode=app.config.get("MPESA_SHORTCODE"),
+            passkey=app.config.get("MPESA_PASSKEY"),
+            callback_url=app.config.get("MPESA_CALLBACK_URL"),
+            connect_timeout=float(app.config.get("MPESA_CONNECT_TIMEOUT", 3.05)),
+            read_timeout=float(app.config.get("MPESA_READ_TIMEOUT", 10)),
+            pool_size=int(app.config.get("MPESA_POOL_SIZE", 20)),
+            failure_threshold=int(app.config.get("MPESA_BREAKER_THRESHOLD", 5)),
+            reset_timeout=float(app.config.get("MPESA_BREAKER_RESET", 30))
+        )
+        app.extensions["mpesa_client"] = self
+
+    def _make_session(self):
+        session = requests.Session()
+        # Retries are left to the caller; a timed-out STK push may already have reached the phone
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @property
+    def configured(self):
+        return all([self.consumer_key, self.consumer_secret, self.shortcode, self.passkey])
+
+    # ---------------- Transport ---------------- #
+    def _request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            raise MpesaUnavailable("M-Pesa is temporarily unavailable")
+
+        try:
+            res = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            raise MpesaUnavailable(f"M-Pesa request failed: {e}") from e
+
+        if res.status_code >= 500:
+            self.breaker.record_failure()
+            raise MpesaUnavailable(f"M-Pesa returned {res.status_code}", details=res.text[:500])
+        self.breaker.record_success()
+
+        try:
+            body = res.json()
+        except ValueError:
+            raise MpesaError(f"M-Pesa returned a non-JSON response ({res.status_code})", details=res.text[:500])
+        if res.status_code != 200:
+            raise MpesaError(f"M-Pesa returned {res.status_code}", details=body)
+        return body
+
+    # ---------------- OAuth ---------------- #
+    def access_token(self):
+        """Return a valid OAuth token, fetching a new one only near expiry.
+
+        The lock makes concurrent requests that find the token stale wait for
+        a single refresh instead of each asking Daraja for a new one.
+        """
+        if self._token and time.monotonic() < self._token_expires_at:
+            return self._token
+
+        with self._token_lock:
+            if self._token and time.monotonic() < self._token_expires_at:
+                return self._token
+
+            body = self._request(
+                "GET", "/oauth/v1/generate",
+                params={"grant_type": "client_credentials"},
+                auth=(self.consumer_key, self.consumer_secret)
+            )
+            if "access_token" not in body:
+                raise MpesaError("M-Pesa did not return an access token", details=body)
+
+            expires_in = int(body.get("expires_in", 3599))
+            self._token = body["access_token"]
+            self._token_expires_at = time.monotonic() + max(expires_in - TOKEN_REFRESH_MARGIN, 0)
+            return self._token
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+            self._token_expires_at = 0
+
+    # ---------------- STK push ---------------- #
+    def stk_push(self, phone_number, amount, account_reference, description):
+        """Start a Lipa na M-Pesa Online payment; returns Daraja's response (with CheckoutRequestID)"""
+        if not self.configured:
+            raise MpesaError("M-Pesa credentials not configured")
+
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        password = base64.b64encode(f"{self.shortcode}{self.passkey}{timestamp}".encode()).decode("utf-8")
+        payload = {
+            "BusinessShortCode": self.shortcode,
+            "Password": password,
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPaybillOnline",
+            "Amount": int(amount),
+            "PartyA": phone_number,  # tenant phone
+            "PartyB": self.shortcode,
+            "PhoneNumber": phone_number,
+            "CallBackUrl": f"{self.callback_url}/payments/callback",
+            "AccountReference": account_reference,
+            "TransactionDesc": description
+        }
+
+        for attempt in range(2):
+            headers = {"Authorization": f"Bearer {self.access_token()}"}
+            try:
+                body = self._request("POST", "/mpesa/stkpush/v1/processrequest", json=payload, headers=headers)
+            except MpesaError as e:
+                # A token revoked early by Daraja gets one refresh and retry
+                if attempt == 0 and not isinstance(e, MpesaUnavailable) and _is_invalid_token(e.details):
+                    self.invalidate_token()
+                    continue
+                raise
+            if "CheckoutRequestID" not in body:
+                raise MpesaError("M-Pesa did not accept the payment request", details=body)
+            return body
+
+
+def _is_invalid_token(details):
+    return isinstance(details, dict) and details.get("errorCode") == "404.001.03"
+
+
+mpesa_client = MpesaClient()
@@ -0,0 +1,185 @@
+# notifications.py - Notification fan-out, visibility and live delivery
+import threading
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import event, func, insert, select, literal, true, false, or_, and_
+from sqlalchemy.orm import Session
+from models import db, Notification, User, NOTIFICATION_TYPES, ROLE_TENANT
+from serializers import NOTIFICATION_LOADERS, loader_options
+
+
+def visible_to(user_id):
+    """Filter for notifications a user should see: their own rows, plus
+    broadcasts stored without a recipient. Fanned-out broadcasts already
+    carry the recipient's id, so they are covered by the first clause."""
+    return or_(
+        Notification.recipient_id == user_id,
+        and_(Notification.is_broadcast == True, Notification.recipient_id.is_(None))
+    )
+
+
+def fan_out_broadcast(sender_id, title, message, notification_type="general"):
+    """Copy one broadcast to every active tenant with a single INSERT ... SELECT.
+
+    No tenant rows are loaded into Python, so the cost stays in the database
+    however many tenants there are. Returns ``(broadcast_id, recipients_count)``;
+    the broadcast id tags every row so the fan-out can be looked up later.
+    The caller commits.
+    """
+    if notification_type not in NOTIFICATION_TYPES:
+        raise ValueError(f"Invalid notification type: {notification_type}. Must be one of {list(NOTIFICATION_TYPES)}")
+
+    broadcast_id = uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+
+    recipients = select(
+        literal(sender_id),
+        User.id,
+        literal(title),
+        literal(message),
+        literal(notification_type),
+        true(),
+        false(),
+        literal(now, type_=Notification.created_at.type),
+        literal(broadcast_id)
+    ).where(
+        User.role == ROLE_TENANT,
+        User.is_active == True
+    )
+
+    _pending(db.session).add(EVERYONE)
+    result = db.session.execute(
+        insert(Notification).from_select(
+            ["sender_id", "recipient_id", "title", "message", "notification_type",
+             "is_broadcast", "is_read", "created_at", "broadcast_id"],
+            recipients
+        )
+    )
+    return broadcast_id, result.rowcount
+
+
+def bulk_notify(rows):
+    """Insert many direct notifications in one executemany; the caller commits.
+
+    ``rows`` are dicts with sender_id, recipient_id, title, message and
+    notification_type. Recipients are still woken up once the caller commits.
+    """
+    if not rows:
+        return 0
+    now = datetime.now(timezone.utc)
+    db.session.execute(insert(Notification), [
+        {"is_broadcast": False, "is_read": False, "created_at": now, **row} for row in rows
+    ])
+    _pending(db.session).update(row["recipient_id"] for row in rows)
+    return len(rows)
+
+
+# ---------------- In-process pub/sub ---------------- #
+# Wake-up signal meaning "every subscriber should check for new rows"
+EVERYONE = "*"
+
+
+class Subscription:
+    """One waiting stream or long-poll request for a user"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._event = threading.Event()
+
+    def notify(self):
+        self._event.set()
+
+    def wait(self, timeout):
+        """Block until woken or ``timeout`` seconds pass; True if woken"""
+        woken = self._event.wait(timeout)
+        self._event.clear()
+        return woken
+
+
+class NotificationHub:
+    """Wakes waiting requests in this process when notifications are committed.
+
+    The hub carries no payloads: woken requests read their new rows with one
+    indexed query. Commits made by other worker processes are not seen here,
+    so waiters also re-check on their heartbeat timeout.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._streams = 0
+        self._lock = threading.Lock()
+
+    def open_stream(self, limit):
+        """Claim one of ``limit`` stream slots of this process; False when all are taken"""
+        with self._lock:
+            if self._streams >= limit:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._lock:
+            self._streams = max(0, self._streams - 1)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscribers.pop(subscription.user_id, None)
+
+    def publish(self, user_ids):
+        with self._lock:
+            if EVERYONE in user_ids:
+                targets = [s for subs in self._subscribers.values() for s in subs]
+            else:
+                targets = [s for user_id in user_ids for s in self._subscribers.get(user_id, ())]
+        for subscription in targets:
+            subscription.notify()
+
+
+hub = NotificationHub()
+
+
+def _pending(session):
+    return session.info.setdefault("notify_user_ids", set())
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_new_notifications(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, Notification):
+            _pending(session).add(obj.recipient_id if obj.recipient_id is not None else EVERYONE)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed_notifications(session):
+    user_ids = session.info.pop("notify_user_ids", None)
+    if user_ids:
+        hub.publish(user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_notifications(session):
+    session.info.pop("notify_user_ids", None)
+
+
+def latest_notification_id(user_id):
+    """Id of the newest notification the user can see, or 0"""
+    latest = db.session.query(func.max(Notification.id)).filter(visible_to(user_id)).scalar()
+    return latest or 0
+
+
+def notifications_since(user_id, last_id, limit=100):
+    """Serialized notifications newer than ``last_id``, oldest first"""
+    rows = Notification.query.options(*loader_options(NOTIFICATION_LOADERS)).filter(
+        visible_to(user_id),
+        Notification.id > last_id
+    ).order_by(Notification.id.asc()).limit(limit).all()
+    return [row.to_dict() for row in rows]
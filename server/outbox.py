@@ -0,0 +1,230 @@
+# outbox.py - Durable email/SMS outbox drained in batches by background workers
+import os
+import smtplib
+from datetime import datetime, timedelta, timezone
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from flask import current_app
+from sqlalchemy import update
+from models import db, OutboundMessage
+import logging
+
+logger = logging.getLogger(__name__)
+
+EMAIL = 'email'
+SMS = 'sms'
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 6 * 60 * 60
+# A claimed message whose worker died becomes due again after this long
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# ---------------- Transports ---------------- #
+def build_email(from_email, to_email, subject, body, html_body=None):
+    msg = MIMEMultipart('alternative')
+    msg['From'] = from_email
+    msg['To'] = to_email
+    msg['Subject'] = subject
+
+    # Add plain text version
+    msg.attach(MIMEText(body, 'plain'))
+
+    # Add HTML version if provided
+    if html_body:
+        msg.attach(MIMEText(html_body, 'html'))
+    return msg
+
+
+class SMTPMailer:
+    """One SMTP connection (STARTTLS + login done once) reused for many messages.
+
+    Set SMTP_USE_TLS=false and leave EMAIL_PASSWORD empty to talk to a plain
+    local SMTP stand-in such as ``python -m aiosmtpd -n -l localhost:1025``.
+    """
+
+    def __init__(self):
+        self.server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+        self.port = int(os.getenv('SMTP_PORT', '587'))
+        self.user = os.getenv('EMAIL_USER')
+        self.password = os.getenv('EMAIL_PASSWORD')
+        self.use_tls = os.getenv('SMTP_USE_TLS', 'true').lower() == 'true'
+        self.sender = os.getenv('EMAIL_FROM', self.user)
+        self._connection = None
+
+    def __enter__(self):
+        if not self.sender:
+            raise RuntimeError("Email credentials not configured")
+        self._connection = smtplib.SMTP(self.server, self.port, timeout=30)
+        if self.use_tls:
+            self._connection.starttls()
+        if self.user and self.password:
+            self._connection.login(self.user, self.password)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self._connection.quit()
+        except smtplib.SMTPException:
+            pass
+        self._connection = None
+
+    def send(self, to_email, subject, body, html_body=None):
+        self._connection.send_message(build_email(self.sender, to_email, subject, body, html_body))
+
+
+class SMSSender:
+    """One Twilio client reused for many messages"""
+
+    def __init__(self):
+        account_sid = os.getenv('TWILIO_ACCOUNT_SID')
+        auth_token = os.getenv('TWILIO_AUTH_TOKEN')
+        self.from_phone = os.getenv('TWILIO_PHONE_NUMBER')
+
+        if not all([account_sid, auth_token, self.from_phone]):
+            raise RuntimeError("Twilio credentials not configured")
+
+        from twilio.rest import Client
+        self.client = Client(account_sid, auth_token)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send(self, phone_number, message):
+        return self.client.messages.create(body=message, from_=self.from_phone, to=phone_number)
+
+
+# ---------------- Enqueueing ---------------- #
+def enqueue_email(to_email, subject, body, html_body=None):
+    """Queue an email; it is saved with the caller's transaction and sent by the worker"""
+    message = OutboundMessage(channel=EMAIL, recipient=to_email, subject=subject, body=body, html_body=html_body)
+    db.session.add(message)
+    return message
+
+
+def enqueue_sms(phone_number, body):
+    """Queue an SMS; it is saved with the caller's transaction and sent by the worker"""
+    message = OutboundMessage(channel=SMS, recipient=phone_number, body=body)
+    db.session.add(message)
+    return message
+
+
+# ---------------- Draining ---------------- #
+def _claim_batch(batch_size, now):
+    """Mark up to ``batch_size`` due messages as being sent by this worker.
+
+    Each candidate is claimed with a conditional UPDATE that only matches while
+    it is still due, so a message another worker claimed in the meantime is
+    dropped instead of sent twice. On Postgres, SKIP LOCKED additionally lets
+    several workers pick disjoint candidates up front.
+    """
+    query = OutboundMessage.query.filter(
+        OutboundMessage.status.in_(['pending', 'sending']),
+        OutboundMessage.next_attempt_at <= now
+    ).order_by(OutboundMessage.id).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+
+    claimed = []
+    for message in query.all():
+        result = db.session.execute(
+            update(OutboundMessage)
+            .where(
+                OutboundMessage.id == message.id,
+                OutboundMessage.status.in_(['pending', 'sending']),
+                OutboundMessage.next_attempt_at <= now
+            )
+            .values(status='sending', next_attempt_at=now + CLAIM_TIMEOUT)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            claimed.append(message)
+    # Committing expires the claimed rows, so they reload with the values this worker wrote
+    db.session.commit()
+    return claimed
+
+
+def _record_failure(message, error, now):
+    max_attempts = int(current_app.config.get('OUTBOX_MAX_ATTEMPTS', MAX_ATTEMPTS))
+    backoff_seconds = int(current_app.config.get('OUTBOX_BACKOFF_SECONDS', BACKOFF_BASE_SECONDS))
+    message.attempts += 1
+    message.last_error = str(error)[:1000]
+    if message.attempts >= max_attempts:
+        message.status = 'failed'
+        logger.error(f"Giving up on {message.channel} #{message.id} to {message.recipient}: {error}")
+    else:
+        delay = min(backoff_seconds * 2 ** (message.attempts - 1), BACKOFF_MAX_SECONDS)
+        message.status = 'pending'
+        message.next_attempt_at = now + timedelta(seconds=delay)
+
+
+def _deliver(messages, transport_factory, send, now):
+    """Send a claimed batch over one transport, recording each outcome"""
+    sent = 0
+    try:
+        with transport_factory() as transport:
+            for message in messages:
+                try:
+                    send(transport, message)
+                    message.status = 'sent'
+                    message.sent_at = _utcnow()
+                    sent += 1
+                except Exception as e:
+                    _record_failure(message, e, now)
+    except Exception as e:
+        # The transport itself failed (connect, STARTTLS, login or credentials)
+        for message in messages:
+            if message.status == 'sending':
+                _record_failure(message, e, now)
+    return sent
+
+
+def drain_outbox(batch_size=200, mailer_factory=SMTPMailer, sms_factory=SMSSender):
+    """Deliver one batch of due messages; returns the number sent.
+
+    Emails in the batch share one SMTP connection and SMS share one Twilio
+    client. Failures are retried with exponential backoff up to OUTBOX_MAX_ATTEMPTS.
+    """
+    now = _utcnow()
+    messages = _claim_batch(batch_size, now)
+    if not messages:
+        return 0
+
+    emails = [m for m in messages if m.channel == EMAIL]
+    texts = [m for m in messages if m.channel == SMS]
+
+    sent = 0
+    if emails:
+        sent += _deliver(
+            emails, mailer_factory,
+            lambda mailer, m: mailer.send(m.recipient, m.subject, m.body, m.html_body), now
+        )
+    if texts:
+        sent += _deliver(texts, sms_factory, lambda sender, m: sender.send(m.recipient, m.body), now)
+
+    db.session.commit()
+    logger.info(f"Outbox delivered {sent}/{len(messages)} messages")
+    return sent
+
+
+def register_celery_tasks(celery, app, interval=10.0):
+    """Register the outbox drain as a Celery task, scheduled every ``interval`` seconds by beat"""
+
+    @celery.task(name='outbox.drain')
+    def drain_outbox_task(batch_size=200):
+        with app.app_context():
+            return drain_outbox(batch_size)
+
+    celery.conf.beat_schedule = {
+        **(celery.conf.beat_schedule or {}),
+        'drain-outbox': {'task': 'outbox.drain', 'schedule': interval},
+    }
+    return drain_outbox_task
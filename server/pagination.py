@@ -0,0 +1,34 @@
+# pagination.py - Opaque cursors and page-size parsing for keyset-paginated listings
+import base64
+import binascii
+import json
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(*values):
+    """Turn the sort key of the last row on a page into an opaque cursor string"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, size=1):
+    """Return the ``size`` sort key values encoded in a cursor, or raise ValueError"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    # Sort keys are plain scalars; null, lists and objects only come from tampered cursors
+    if not all(isinstance(value, (int, float, str)) and not isinstance(value, bool) for value in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def parse_limit(value):
+    """Clamp the ?limit= query param to 1..MAX_PAGE_SIZE"""
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    limit = int(value)
+    return max(1, min(limit, MAX_PAGE_SIZE))
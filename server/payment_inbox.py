@@ -0,0 +1,215 @@
+# payment_inbox.py - Append-only inbox for M-Pesa callbacks, applied in idempotent batches
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import update
+from models import db, MpesaCallback, Payment, Lease, Property, Bill, PENDING, SUCCESSFUL, FAILED
+import summaries
+import ledger
+import analytics
+from notifications import bulk_notify
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A callback can beat the commit of its Payment row; look again after this long
+UNMATCHED_RETRY = timedelta(seconds=30)
+# ...and give up once the callback is this old
+UNMATCHED_GIVE_UP = timedelta(minutes=15)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# ---------------- Receiving ---------------- #
+def record_callback(body):
+    """Store a raw stkCallback payload; the only work done while Daraja waits for the ACK"""
+    result = (body or {}).get("Body", {}).get("stkCallback", {})
+    result_code = result.get("ResultCode")
+    callback = MpesaCallback(
+        checkout_request_id=result.get("CheckoutRequestID"),
+        result_code=result_code if isinstance(result_code, int) else None,
+        payload=json.dumps(body)
+    )
+    db.session.add(callback)
+    db.session.commit()
+    return callback
+
+
+# ---------------- Processing ---------------- #
+def _claim_batch(batch_size, now):
+    query = MpesaCallback.query.filter(
+        MpesaCallback.processed_at.is_(None),
+        MpesaCallback.available_at <= now
+    ).order_by(MpesaCallback.id).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        # Concurrent workers take disjoint batches instead of waiting on each other
+        query = query.with_for_update(skip_locked=True)
+    return query.all()
+
+
+def _transition(checkout_ids, status):
+    """Move pending payments to ``status``; returns the ids that actually changed.
+
+    The ``status == pending`` guard makes this idempotent: a duplicate or
+    replayed callback, or one already applied by another worker, matches nothing.
+    """
+    if not checkout_ids:
+        return []
+    result = db.session.execute(
+        update(Payment)
+        .where(Payment.transaction_id.in_(checkout_ids), Payment.status == PENDING)
+        .values(status=status)
+        .returning(Payment.id)
+    )
+    return [row[0] for row in result]
+
+
+def _settle_bills(paid, totals):
+    """Mark each lease's oldest unpaid bills paid, as far as the new payments cover them"""
+    lease_ids = {row.lease_id for row in paid}
+    remaining = defaultdict(float)
+    for row in paid:
+        remaining[row.lease_id] += row.amount
+
+    bills = db.session.query(Bill.id, Bill.lease_id, Bill.amount, Bill.due_date).filter(
+        Bill.lease_id.in_(lease_ids), Bill.status == "unpaid"
+    ).order_by(Bill.lease_id, Bill.due_date, Bill.id).all()
+
+    landlords = {row.lease_id: row.landlord_id for row in paid}
+    settled = []
+    for bill in bills:
+        if bill.amount <= remaining[bill.lease_id]:
+            remaining[bill.lease_id] -= bill.amount
+            settled.append(bill.id)
+            totals[(landlords[bill.lease_id], summaries.period_for(bill.due_date))]["pending_bills"] -= bill.amount
+
+    if settled:
+        db.session.execute(update(Bill).where(Bill.id.in_(settled)).values(status="paid"))
+    return len(settled)
+
+
+def _payment_notifications(successful_rows, failed_rows):
+    notifications = []
+    for row in successful_rows:
+        notifications.append(dict(
+            sender_id=row.tenant_id, recipient_id=row.landlord_id, notification_type="payment",
+            title="Payment Received",
+            message=f"Payment of {row.amount} has been received for lease #{row.lease_id}."
+        ))
+        notifications.append(dict(
+            sender_id=row.landlord_id, recipient_id=row.tenant_id, notification_type="payment",
+            title="Payment Confirmed",
+            message=f"Your payment of {row.amount} for lease #{row.lease_id} was successful."
+        ))
+    for row in failed_rows:
+        notifications.append(dict(
+            sender_id=row.landlord_id, recipient_id=row.tenant_id, notification_type="payment",
+            title="Payment Failed",
+            message=f"Your payment of {row.amount} for lease #{row.lease_id} was not completed."
+        ))
+    return bulk_notify(notifications)
+
+
+def process_callbacks(batch_size=500):
+    """Apply one batch of stored callbacks; returns the number of callbacks handled.
+
+    Status changes, summary totals, ledger credits, analytics rollups, bill settlement and notifications for the
+    whole batch are written with a handful of set-based statements and one
+    commit, so a month-end burst costs roughly the same per batch as a trickle.
+    """
+    now = _utcnow()
+    callbacks = _claim_batch(batch_size, now)
+    if not callbacks:
+        db.session.rollback()
+        return 0
+
+    # The first callback per checkout decides the outcome; the rest are duplicates
+    first = {}
+    outcomes = {}
+    for callback in callbacks:
+        if not callback.checkout_request_id or callback.result_code is None:
+            outcomes[callback.id] = "invalid"
+        elif callback.checkout_request_id in first:
+            outcomes[callback.id] = "duplicate"
+        else:
+            first[callback.checkout_request_id] = callback
+
+    succeeded = [cid for cid, cb in first.items() if cb.result_code == 0]
+    failed = [cid for cid, cb in first.items() if cb.result_code != 0]
+    changed = {SUCCESSFUL: _transition(succeeded, SUCCESSFUL), FAILED: _transition(failed, FAILED)}
+
+    changed_ids = changed[SUCCESSFUL] + changed[FAILED]
+    rows = db.session.query(
+        Payment.id, Payment.transaction_id, Payment.amount, Payment.created_at, Payment.lease_id,
+        Payment.provider_id, Lease.property_id, Lease.tenant_id, Property.landlord_id
+    ).join(Lease, Payment.lease_id == Lease.id).join(Property, Lease.property_id == Property.id).filter(
+        Payment.id.in_(changed_ids)
+    ).all() if changed_ids else []
+
+    applied = {row.transaction_id for row in rows}
+    known = applied | {
+        transaction_id for (transaction_id,) in db.session.query(Payment.transaction_id).filter(
+            Payment.transaction_id.in_(list(set(first) - applied))
+        )
+    }
+
+    for checkout_id, callback in first.items():
+        if checkout_id in applied:
+            outcomes[callback.id] = "applied"
+        elif checkout_id in known:
+            outcomes[callback.id] = "duplicate"
+        elif now - callback.received_at < UNMATCHED_GIVE_UP:
+            # The payment may not be committed yet; leave it in the inbox for a later pass
+            callback.available_at = now + UNMATCHED_RETRY
+        else:
+            outcomes[callback.id] = "unmatched"
+            logger.warning(f"No payment for M-Pesa callback {checkout_id}")
+
+    paid_ids = set(changed[SUCCESSFUL])
+    successful_rows = [row for row in rows if row.id in paid_ids]
+    failed_rows = [row for row in rows if row.id not in paid_ids]
+
+    totals = defaultdict(lambda: defaultdict(float))
+    for row in successful_rows:
+        totals[(row.landlord_id, summaries.period_for(row.created_at))]["collected"] += row.amount
+    settled = _settle_bills(successful_rows, totals) if successful_rows else 0
+    ledger.post_payments(successful_rows)
+    analytics.record_payments(
+        (row.created_at, row.landlord_id, row.property_id, row.provider_id, row.amount, PENDING,
+         SUCCESSFUL if row.id in paid_ids else FAILED)
+        for row in rows
+    )
+    summaries.apply_totals(totals)
+    _payment_notifications(successful_rows, failed_rows)
+
+    by_outcome = defaultdict(list)
+    for callback_id, outcome in outcomes.items():
+        by_outcome[outcome].append(callback_id)
+    for outcome, ids in by_outcome.items():
+        db.session.execute(
+            update(MpesaCallback).where(MpesaCallback.id.in_(ids)).values(processed_at=now, outcome=outcome)
+        )
+
+    db.session.commit()
+    logger.info(
+        f"Processed {len(outcomes)} M-Pesa callbacks: {len(successful_rows)} paid, "
+        f"{len(failed_rows)} failed, {settled} bills settled"
+    )
+    return len(outcomes)
+
+
+def register_celery_tasks(celery, app, interval=2.0):
+    """Register callback processing as a Celery task, scheduled every ``interval`` seconds by beat"""
+
+    @celery.task(name='payment_inbox.process')
+    def process_callbacks_task(batch_size=500):
+        with app.app_context():
+            return process_callbacks(batch_size)
+
+    celery.conf.beat_schedule = {
+        **(celery.conf.beat_schedule or {}),
+        'process-mpesa-callbacks': {'task': 'payment_inbox.process', 'schedule': interval},
+    }
+    return process_callbacks_task
@@ -0,0 +1,69 @@
+# rent_status.py - Rent arrears for active leases, read from the ledger balances
+from collections import namedtuple
+from datetime import date, timedelta
+from models import db, Lease, LeaseBalance, Property, User
+
+# Reminders go out when a lease's oldest unpaid rent is this many days late
+REMINDER_DAYS = (1, 7, 14, 30)
+
+RentStatus = namedtuple(
+    "RentStatus", ["lease", "tenant", "landlord_id", "days_behind", "amount_due", "oldest_unpaid_period"]
+)
+
+
+def lease_rent_status(landlord_id=None, lease_ids=None, overdue_only=False, days_behind=None, as_of=None):
+    """Rent status of active leases, computed in one query.
+
+    Every answer comes from the lease's materialized ledger balance (see
+    ledger.py): a lease is behind when its oldest unpaid charge is past its
+    due date, days behind count from that date and the amount due is the
+    outstanding balance. ``days_behind`` limits the result to leases exactly
+    that many days late (any of a list), which is how reminder schedules pick
+    their leases. Returns ``RentStatus`` tuples with the lease and tenant loaded.
+    """
+    as_of = as_of or date.today()
+
+    query = db.session.query(
+        Lease,
+        User,
+        Property.landlord_id,
+        LeaseBalance.balance,
+        LeaseBalance.oldest_unpaid_period,
+        LeaseBalance.oldest_unpaid_due
+    ).join(
+        Property, Lease.property_id == Property.id
+    ).join(
+        User, Lease.tenant_id == User.id
+    ).outerjoin(
+        LeaseBalance, LeaseBalance.lease_id == Lease.id
+    ).filter(Lease.status == "active")
+
+    if overdue_only:
+        query = query.filter(LeaseBalance.oldest_unpaid_due < as_of)
+    if landlord_id is not None:
+        query = query.filter(Property.landlord_id == landlord_id)
+    if lease_ids is not None:
+        query = query.filter(Lease.id.in_(lease_ids))
+    if days_behind is not None:
+        days = days_behind if isinstance(days_behind, (list, tuple, set)) else [days_behind]
+        query = query.filter(LeaseBalance.oldest_unpaid_due.in_([as_of - timedelta(days=n) for n in days]))
+
+    statuses = []
+    for lease, tenant, owner_id, balance, oldest_period, oldest_due in query.order_by(Lease.id):
+        behind = (as_of - oldest_due).days if oldest_due and oldest_due < as_of else 0
+        statuses.append(RentStatus(lease, tenant, owner_id, behind, max(balance or 0, 0), oldest_period))
+    return statuses
+
+
+def overdue_leases(landlord_id=None, days_behind=None, as_of=None):
+    """Active leases with rent past due; see lease_rent_status"""
+    return lease_rent_status(landlord_id=landlord_id, overdue_only=True, days_behind=days_behind, as_of=as_of)
+
+
+def status_dict(status):
+    return {
+        "is_up_to_date": status.days_behind == 0,
+        "days_behind": status.days_behind,
+        "outstanding_amount": status.amount_due,
+        "oldest_unpaid_period": status.oldest_unpaid_period
+    }
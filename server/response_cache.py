@@ -0,0 +1,199 @@
+# response_cache.py - Conditional GET and cached responses for read-mostly resources, keyed on table versions
+import hashlib
+import threading
+from functools import wraps
+from flask import Response, request
+from flask_restful import unpack
+from sqlalchemy import event, insert, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from cache import TTLCache
+from models import db, TableVersion
+import logging
+
+logger = logging.getLogger(__name__)
+
+PUBLIC = "public"
+USER = "user"
+
+
+class DatabaseVersionBackend:
+    """Counters in the table_versions table, so every worker sees every commit"""
+
+    def versions(self, tables):
+        rows = db.session.execute(
+            select(TableVersion.name, TableVersion.version).where(TableVersion.name.in_(tables))
+        )
+        return dict(rows.all())
+
+    def bump(self, tables):
+        table = TableVersion.__table__
+        rows = [{"name": name, "version": 1} for name in sorted(tables)]
+        # The session has just committed; count on a connection of our own
+        with db.engine.begin() as connection:
+            dialect = connection.dialect.name
+            if dialect in ("postgresql", "sqlite"):
+                insert_for = postgresql.insert if dialect == "postgresql" else sqlite.insert
+                stmt = insert_for(table)
+                stmt = stmt.on_conflict_do_update(index_elements=[table.c.name],
+                                                  set_={"version": table.c.version + 1})
+                connection.execute(stmt, rows)
+                return
+            for row in rows:
+                updated = connection.execute(
+                    table.update().where(table.c.name == row["name"]).values(version=table.c.version + 1)
+                ).rowcount
+                if not updated:
+                    connection.execute(insert(table), [row])
+
+
+class MemoryVersionBackend:
+    """Process-local counters for tests and single-worker development"""
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def versions(self, tables):
+        return {name: self._versions[name] for name in tables if name in self._versions}
+
+    def bump(self, tables):
+        with self._lock:
+            for name in tables:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+
+BACKENDS = {
+    "database": DatabaseVersionBackend,
+    "memory": MemoryVersionBackend,
+}
+
+
+class ResponseCache:
+    """Weak ETags and cached bodies for GET endpoints that declare the tables they read.
+
+    Every commit that inserts, updates or deletes rows of a declared table
+    bumps that table's version (flushed objects and ORM bulk statements are
+    both seen; raw SQL is not). A response's ETag hashes the endpoint, the
+    caller's scope, the query string and those versions, so a matching
+    ``If-None-Match`` is answered with 304 after reading a handful of
+    counters and no rows. Bodies are kept in a bounded per-worker LRU under
+    the same key and reused while the versions hold.
+    """
+
+    def __init__(self, backend=None, cache_size=1024, ttl=300):
+        self.enabled = True
+        self.backend = backend or DatabaseVersionBackend()
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self.tracked = set()
+        self.api = None
+
+    def init_app(self, app, api):
+        self.enabled = str(app.config.get("RESPONSE_CACHE_ENABLED", "true")).lower() in ("1", "true", "yes")
+        backend_name = app.config.get("RESPONSE_CACHE_BACKEND", "database")
+        if backend_name not in BACKENDS:
+            raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {backend_name}. Must be one of {list(BACKENDS)}")
+        self.backend = BACKENDS[backend_name]()
+        self.cache = TTLCache(
+            maxsize=int(app.config.get("RESPONSE_CACHE_SIZE", 1024)),
+            ttl=float(app.config.get("RESPONSE_CACHE_TTL", 300))
+        )
+        self.api = api
+
+        for name, listener in (("after_flush", self._after_flush), ("do_orm_execute", self._do_orm_execute),
+                               ("after_commit", self._after_commit), ("after_rollback", self._after_rollback)):
+            if not event.contains(db.session, name, listener):
+                event.listen(db.session, name, listener)
+        app.extensions["response_cache"] = self
+
+    # ---------------- Change tracking ---------------- #
+    def _changed(self, session, tables):
+        changed = {table for table in tables if table in self.tracked}
+        if changed:
+            session.info.setdefault("changed_tables", set()).update(changed)
+
+    def _after_flush(self, session, flush_context):
+        self._changed(session, {
+            table.name
+            for instance in (*session.new, *session.dirty, *session.deleted)
+            for table in inspect(instance).mapper.tables
+        })
+
+    def _do_orm_execute(self, state):
+        if state.is_insert or state.is_update or state.is_delete:
+            self._changed(state.session, {state.statement.table.name})
+
+    def _after_commit(self, session):
+        changed = session.info.pop("changed_tables", None)
+        if changed and self.enabled:
+            try:
+                self.backend.bump(changed)
+            except Exception:
+                # Cached entries still expire after RESPONSE_CACHE_TTL
+                logger.exception(f"Could not bump table versions for {sorted(changed)}")
+
+    def _after_rollback(self, session):
+        session.info.pop("changed_tables", None)
+
+    # ---------------- Responses ---------------- #
+    def etag(self, key, tables):
+        versions = self.backend.versions(tables)
+        digest = hashlib.sha1(repr((key, [(name, versions.get(name, 0)) for name in tables])).encode())
+        return digest.hexdigest()
+
+    def respond(self, fn, args, kwargs, tables, scope):
+        key = (request.endpoint, scope, request.path, tuple(sorted(request.args.items(multi=True))))
+        etag = self.etag(key, tables)
+        headers = {"ETag": f'W/"{etag}"',
+                   "Cache-Control": "private, no-cache" if scope is not None else "public, no-cache"}
+        if scope is not None:
+            headers["Vary"] = "Authorization"
+
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers=headers)
+
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] == etag:
+            _, body, status, mimetype = cached
+            return Response(body, status=status, mimetype=mimetype, headers=headers)
+
+        rv = fn(*args, **kwargs)
+        if isinstance(rv, Response):
+            return rv
+        data, status, extra_headers = unpack(rv)
+        response = self.api.make_response(data, status, headers=extra_headers)
+        if status == 200:
+            self.cache.set(key, (etag, response.get_data(), status, response.mimetype))
+            response.headers.update(headers)
+        return response
+
+    def clear(self):
+        self.cache.clear()
+
+
+response_cache = ResponseCache()
+
+
+def cached_response(*tables, scope=PUBLIC):
+    """Serve a Flask-RESTful GET through the response cache.
+
+    ``tables`` are every table the response is built from. With
+    ``scope=USER`` responses are cached per caller, so put the decorator
+    under ``jwt_required``/role checks.
+    """
+    response_cache.tracked.update(tables)
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not response_cache.enabled or response_cache.api is None:
+                return fn(*args, **kwargs)
+            user_scope = None
+            if scope == USER:
+                from identity import current_identity
+                identity = current_identity()
+                if identity is None:
+                    return fn(*args, **kwargs)
+                user_scope = identity.id
+            return response_cache.respond(fn, args, kwargs, tables, user_scope)
+        return wrapper
+    return decorator
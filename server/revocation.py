@@ -0,0 +1,117 @@
+# revocation.py - Shared JWT revocation store with a per-worker front cache
+import threading
+import time
+from datetime import datetime, timezone
+from sqlalchemy.exc import IntegrityError
+from cache import TTLCache
+from models import db, RevokedToken
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Prune expired rows after this many revocations in a worker
+PRUNE_EVERY = 500
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class DatabaseRevocationBackend:
+    """Revoked jtis in the revoked_tokens table, visible to every worker"""
+
+    def add(self, jti, expires_at):
+        try:
+            db.session.add(RevokedToken(jti=jti, expires_at=expires_at))
+            db.session.commit()
+        except IntegrityError:
+            # Already revoked (e.g. a repeated logout)
+            db.session.rollback()
+
+    def contains(self, jti):
+        return db.session.query(RevokedToken.id).filter(RevokedToken.jti == jti).first() is not None
+
+    def prune(self, now):
+        removed = RevokedToken.query.filter(RevokedToken.expires_at < now).delete(synchronize_session=False)
+        db.session.commit()
+        return removed
+
+
+class MemoryRevocationBackend:
+    """Process-local stand-in for tests and single-worker development"""
+
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._tokens[jti] = expires_at
+
+    def contains(self, jti):
+        return jti in self._tokens
+
+    def prune(self, now):
+        with self._lock:
+            expired = [jti for jti, expires_at in self._tokens.items() if expires_at < now]
+            for jti in expired:
+                del self._tokens[jti]
+        return len(expired)
+
+
+BACKENDS = {
+    "database": DatabaseRevocationBackend,
+    "memory": MemoryRevocationBackend,
+}
+
+
+class RevocationStore:
+    """Answers "is this jti revoked?" from a bounded in-process cache first.
+
+    Revoked jtis are cached until the token expires, since revocation is
+    permanent. Misses are cached for ``negative_ttl`` seconds, which bounds how
+    long a logout on another worker can go unnoticed.
+    """
+
+    def __init__(self, backend=None, cache_size=10000, negative_ttl=5):
+        self.backend = backend or DatabaseRevocationBackend()
+        self.cache = TTLCache(maxsize=cache_size, ttl=negative_ttl)
+        self._revocations = 0
+
+    def init_app(self, app):
+        backend_name = app.config.get("JWT_REVOCATION_BACKEND", "database")
+        if backend_name not in BACKENDS:
+            raise ValueError(f"Unknown JWT_REVOCATION_BACKEND: {backend_name}. Must be one of {list(BACKENDS)}")
+        self.backend = BACKENDS[backend_name]()
+        self.cache = TTLCache(
+            maxsize=int(app.config.get("JWT_REVOCATION_CACHE_SIZE", 10000)),
+            ttl=float(app.config.get("JWT_REVOCATION_NEGATIVE_TTL", 5))
+        )
+        app.extensions["revocation_store"] = self
+
+    def revoke(self, jti, expires_at):
+        """Revoke a jti; ``expires_at`` is the token's ``exp`` claim (unix time)"""
+        expires = datetime.fromtimestamp(expires_at, timezone.utc).replace(tzinfo=None)
+        self.backend.add(jti, expires)
+        self.cache.set(jti, True, ttl=max(0, expires_at - time.time()))
+
+        self._revocations += 1
+        if self._revocations % PRUNE_EVERY == 0:
+            self.prune()
+
+    def is_revoked(self, jti):
+        cached = self.cache.get(jti)
+        if cached is not None:
+            return cached
+        revoked = self.backend.contains(jti)
+        self.cache.set(jti, revoked)
+        return revoked
+
+    def prune(self):
+        """Delete revocations whose tokens have expired"""
+        removed = self.backend.prune(_utcnow())
+        logger.info(f"Pruned {removed} expired revoked tokens")
+        return removed
+
+
+revocation_store = RevocationStore()
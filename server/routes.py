@@ -1,16 +1,69 @@
-import json
-from flask import request
+from flask import request, current_app
 from flask_restful import Resource
 from flask_jwt_extended import jwt_required, get_jwt_identity # Import get_jwt_identity
-from models import db, Property
+from models import db, Property, PropertyPicture, ROLE_ADMIN
+from identity import current_identity
+from media import media_store, MediaError
+from response_cache import cached_response
+from search import property_search
+from pagination import encode_cursor, decode_cursor, parse_limit
+import serializers
 import traceback
 
+
+def _picture_urls(value):
+    """``pictures`` from a payload as a list of URLs (a single URL is accepted too)"""
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not all(isinstance(url, str) and url.strip() for url in value):
+        raise ValueError("pictures must be a list of URLs")
+    return [url.strip() for url in value]
+
+
 # ---------------- RESOURCES ---------------- #
 class PropertyListResource(Resource):
+    @cached_response("properties", "property_pictures")
     def get(self):
-        """Return all properties"""
-        properties = Property.query.all()
-        return [p.to_dict() for p in properties], 200
+        """Return one page of properties, filtered server-side.
+
+        Pages are keyed on ``Property.id`` so every page costs an index seek
+        no matter how deep the client has scrolled. Pass the ``next_cursor``
+        from one response as ``?cursor=`` to fetch the next page.
+        """
+        args = request.args
+        try:
+            limit = parse_limit(args.get("limit"))
+            min_rent = args.get("min_rent", type=float)
+            max_rent = args.get("max_rent", type=float)
+            landlord_id = args.get("landlord_id", type=int)
+            after_id = int(decode_cursor(args["cursor"])[0]) if args.get("cursor") else None
+            fields = serializers.requested_fields(serializers.PROPERTY)
+        except (TypeError, ValueError) as e:
+            return {"message": str(e)}, 400
+
+        query = Property.query.options(*serializers.loader_options(serializers.PROPERTY_LOADERS, fields))
+        if args.get("location"):
+            query = query.filter(Property.location == args["location"])
+        if args.get("status"):
+            query = query.filter(Property.status == args["status"])
+        if landlord_id is not None:
+            query = query.filter(Property.landlord_id == landlord_id)
+        if min_rent is not None:
+            query = query.filter(Property.rent >= min_rent)
+        if max_rent is not None:
+            query = query.filter(Property.rent <= max_rent)
+        if after_id is not None:
+            query = query.filter(Property.id > after_id)
+
+        # Fetch one extra row to know whether another page exists
+        properties = query.order_by(Property.id.asc()).limit(limit + 1).all()
+        has_more = len(properties) > limit
+        properties = properties[:limit]
+
+        return {
+            "properties": serializers.PROPERTY.many(properties, fields),
+            "next_cursor": encode_cursor(properties[-1].id) if has_more else None,
+        }, 200
 
     @jwt_required()
     def post(self):
@@ -22,7 +75,10 @@ class PropertyListResource(Resource):
             location = data.get("location")
             rent = data.get("rent")
             status = data.get("status", "vacant")
-            pictures = data.get("pictures", [])
+            try:
+                pictures = _picture_urls(data.get("pictures") or [])
+            except ValueError as e:
+                return {"message": str(e)}, 400
 
             # Get the ID of the current logged-in user (landlord)
             current_user_id = get_jwt_identity()
@@ -38,9 +94,9 @@ class PropertyListResource(Resource):
                 location=location,
                 rent=rent,
                 status=status,
-                pictures=json.dumps(pictures),
                 landlord_id=current_user_id # Add the landlord_id here
             )
+            prop.set_pictures(pictures)
 
             db.session.add(prop)
             db.session.commit()
@@ -52,10 +108,59 @@ class PropertyListResource(Resource):
             return {"message": str(e)}, 500
 
 
+class PropertySearchResource(Resource):
+    @cached_response("properties", "property_pictures")
+    def get(self):
+        """Properties matching ``?q=`` on name and location, best match first.
+
+        Takes the same ``status``, ``min_rent``, ``max_rent`` and
+        ``landlord_id`` filters as the listing, plus ``limit`` and
+        ``offset``. ``fuzzy`` is true when nothing matched word for word and
+        the results are near misses (typos, words the listings don't use).
+        """
+        args = request.args
+        query = (args.get("q") or "").strip()
+        if not query:
+            return {"message": "q is required"}, 400
+        try:
+            limit = parse_limit(args.get("limit"))
+            offset = max(0, args.get("offset", 0, type=int))
+            filters = dict(
+                status=args.get("status") or None,
+                min_rent=args.get("min_rent", type=float),
+                max_rent=args.get("max_rent", type=float),
+                landlord_id=args.get("landlord_id", type=int),
+            )
+            fields = serializers.requested_fields(serializers.PROPERTY)
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
+        ids, fuzzy = property_search.search(query, limit=limit, offset=offset, **filters)
+        properties = []
+        if ids:
+            rank = {id: position for position, id in enumerate(ids)}
+            properties = Property.query.options(
+                *serializers.loader_options(serializers.PROPERTY_LOADERS, fields)
+            ).filter(Property.id.in_(ids)).all()
+            properties.sort(key=lambda prop: rank[prop.id])
+
+        return {
+            "properties": serializers.PROPERTY.many(properties, fields),
+            "fuzzy": fuzzy,
+        }, 200
+
+
 class PropertyResource(Resource):
+    @cached_response("properties", "property_pictures")
     def get(self, id):
-        prop = Property.query.get_or_404(id)
-        return prop.to_dict(), 200
+        try:
+            fields = serializers.requested_fields(serializers.PROPERTY_DETAIL)
+        except ValueError as e:
+            return {"message": str(e)}, 400
+        prop = Property.query.options(
+            *serializers.loader_options(serializers.PROPERTY_LOADERS, fields)
+        ).filter_by(id=id).first_or_404()
+        return serializers.PROPERTY_DETAIL(prop, fields), 200
 
     @jwt_required()
     def put(self, id):
@@ -68,32 +173,12 @@ class PropertyResource(Resource):
             prop.location = data.get("location", prop.location)
             prop.rent = data.get("rent", prop.rent)
             prop.status = data.get("status", prop.status)
-            new_pictures_data = data.get("pictures")
-
-            if new_pictures_data is not None:
-                # If pictures are provided in the payload, use them (they should be a list)
-                if isinstance(new_pictures_data, list):
-                    prop.pictures = json.dumps(new_pictures_data)
-                elif isinstance(new_pictures_data, str):
-                    # If frontend sent a single URL string, wrap it in a list
-                    prop.pictures = json.dumps([new_pictures_data])
-                else:
-                    # Invalid format, maybe log or return an error, for now default to empty
-                    print(f"Warning: Invalid pictures format received for property {id}: {new_pictures_data}")
-                    prop.pictures = json.dumps([])
-            else:
-                # If pictures are NOT provided in the payload, retain existing ones.
-                # The .to_dict() method already handles parsing, so just ensure it remains valid JSON text.
-                # No change needed here if we simply want to keep the current value.
-                # If the existing value is *not* valid JSON string, but just a plain string,
-                # we should convert it to a JSON list during the update to prevent future issues.
-                if prop.pictures and not prop.pictures.startswith('[') and not prop.pictures.startswith('"'):
-                    # Heuristic check: if it's not already a JSON list or a JSON string,
-                    # assume it's a plain URL and wrap it in a list.
-                    prop.pictures = json.dumps([prop.pictures])
-                elif not prop.pictures:
-                    # If it's None or empty, make it an empty JSON list
-                    prop.pictures = json.dumps([])
+            if data.get("pictures") is not None:
+                # Pictures left out of the payload are kept as they are
+                try:
+                    prop.set_pictures(_picture_urls(data["pictures"]))
+                except ValueError as e:
+                    return {"message": str(e)}, 400
 
             db.session.commit()
 
@@ -121,4 +206,48 @@ class PropertyResource(Resource):
         except Exception as e:
             print(f"DELETE error for property {id}: {e}")
             traceback.print_exc() # Print full traceback to console/logs
-            return {"message": str(e)}, 500
\ No newline at end of file
+            return {"message": str(e)}, 500
+
+class PropertyPictureListResource(Resource):
+    @jwt_required()
+    def post(self, id):
+        """Upload a picture to the end of a property's gallery.
+
+        The body is the image itself, or a multipart form with a ``file``
+        field. It is streamed to disk under its SHA-256, so the same picture
+        uploaded twice is stored once; thumbnail, card and full-size variants
+        are built in the background and listed once they exist.
+        """
+        user = current_identity()
+        if not user:
+            return {"message": "User not found"}, 404
+        prop = db.session.get(Property, id)
+        if prop is None:
+            return {"message": "Property not found"}, 404
+        if user.role != ROLE_ADMIN and prop.landlord_id != user.id:
+            return {"message": "You are not authorized to add pictures to this property."}, 403
+
+        upload = request.files.get("file")
+        try:
+            if upload is not None:
+                stored = media_store.save(upload.stream)
+            else:
+                stored = media_store.save(request.stream, request.content_length)
+        except MediaError as e:
+            return {"message": str(e)}, e.status
+
+        existing = next((picture for picture in prop.pictures if picture.content_hash == stored.digest), None)
+        if existing is not None:
+            return serializers.PICTURE(existing), 200
+
+        ready = bool(stored.width) and media_store.variants_exist(stored.digest, stored.width, stored.height)
+        picture = PropertyPicture(
+            url=stored.url, position=len(prop.pictures), width=stored.width, height=stored.height,
+            byte_size=stored.byte_size, content_hash=stored.digest, variants_ready=ready
+        )
+        prop.pictures.append(picture)
+        db.session.commit()
+
+        if not ready:
+            media_store.submit_variants(current_app._get_current_object(), stored)
+        return serializers.PICTURE(picture), 201
@@ -0,0 +1,370 @@
+# search.py - Ranked full-text property search over name and location, indexed in the database and kept in sync by ORM events
+import re
+from collections import Counter
+from sqlalchemy import event, inspect, text
+from cache import TTLCache
+from models import db, Property
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+MAX_TERMS = 8
+# Shorter words only match whole words; "a" would otherwise match most of the index
+MIN_PREFIX = 2
+# A misspelt word is swapped for indexed words sharing this share of its trigrams (Jaccard)
+MIN_SIMILARITY = 0.3
+# ...at most this many, each nearly as close as the best one
+MAX_CORRECTIONS = 3
+CLOSE_TO_BEST = 0.8
+# How long a worker reuses the indexed words it corrects typos against
+VOCABULARY_TTL = 60
+# How long a worker sticks to LIKE matching before looking for the index tables again
+MISSING_INDEX_TTL = 30
+
+# Optional filters shared by every backend; values are bound, never interpolated
+FILTERS = (
+    ("status", "p.status = :status"),
+    ("min_rent", "p.rent >= :min_rent"),
+    ("max_rent", "p.rent <= :max_rent"),
+    ("landlord_id", "p.landlord_id = :landlord_id"),
+)
+
+
+def terms(query):
+    """Lower-cased words of a search query ("Kilimani 2-bedroom" -> kilimani, 2, bedroom)"""
+    return TOKEN.findall(query.lower())[:MAX_TERMS]
+
+
+def trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+class Vocabulary:
+    """Indexed words by trigram, to find the ones a misspelt query word was meant to be"""
+
+    def __init__(self, words):
+        self.trigrams = {}
+        self.words = {}
+        for word in words:
+            grams = trigrams(word)
+            if grams:
+                self.trigrams[word] = grams
+                for gram in grams:
+                    self.words.setdefault(gram, []).append(word)
+
+    def corrections(self, word):
+        """Indexed words closest to ``word``, closest first"""
+        wanted = trigrams(word)
+        shared = Counter(other for gram in wanted for other in self.words.get(gram, ()))
+        scored = sorted(
+            ((count / (len(wanted) + len(self.trigrams[other]) - count), other) for other, count in shared.items()),
+            reverse=True
+        )
+        if not scored or scored[0][0] < MIN_SIMILARITY:
+            return []
+        cutoff = max(MIN_SIMILARITY, scored[0][0] * CLOSE_TO_BEST)
+        return [other for score, other in scored[:MAX_CORRECTIONS] if score >= cutoff]
+
+
+def _where(filters):
+    clauses = [clause for key, clause in FILTERS if filters.get(key) is not None]
+    return "".join(f" AND {clause}" for clause in clauses)
+
+
+def _params(filters, **extra):
+    return {**{key: filters[key] for key, _ in FILTERS if filters.get(key) is not None}, **extra}
+
+
+class SqliteSearchBackend:
+    """FTS5 table ranked with bm25, with typos corrected against its own vocabulary.
+
+    ``property_search`` holds name and location under the property id as
+    rowid; name matches count double. ``property_search_terms`` is an
+    ``fts5vocab`` view of the words in it. A query that matches nothing is
+    retried with each word replaced by the indexed words spelt most like it,
+    so the fallback costs one more ranked FTS query rather than a scan.
+    """
+
+    tables = ("property_search", "property_search_terms")
+
+    def __init__(self):
+        self._vocabulary = TTLCache(maxsize=1, ttl=VOCABULARY_TTL)
+
+    def create(self, connection):
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS property_search USING fts5("
+            "name, location, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS property_search_terms USING fts5vocab(property_search, row)"
+        ))
+
+    def remove(self, connection, ids):
+        connection.execute(text("DELETE FROM property_search WHERE rowid = :id"), [{"id": id} for id in ids])
+
+    def index(self, connection, rows):
+        self.remove(connection, [row["id"] for row in rows])
+        connection.execute(text("INSERT INTO property_search (rowid, name, location) VALUES (:id, :name, :location)"),
+                           rows)
+
+    def index_missing(self, connection):
+        connection.execute(text(
+            "INSERT INTO property_search (rowid, name, location) SELECT id, name, location FROM properties "
+            "WHERE id NOT IN (SELECT rowid FROM property_search)"
+        ))
+
+    def rebuild(self, connection):
+        connection.execute(text("DELETE FROM property_search"))
+        self.index_missing(connection)
+        self._vocabulary.clear()
+
+    def search(self, connection, words, filters, limit, offset=0):
+        match = " AND ".join(f'"{word}"*' if len(word) >= MIN_PREFIX else f'"{word}"' for word in words)
+        return self._ranked(connection, match, filters, limit, offset)
+
+    def fuzzy(self, connection, words, filters, limit):
+        vocabulary = self._vocabulary.get("words")
+        if vocabulary is None:
+            # Numbers (house and unit numbers) are only ever matched as typed
+            rows = connection.execute(text("SELECT term FROM property_search_terms"))
+            vocabulary = Vocabulary(term for term, in rows if not any(ch.isdigit() for ch in term))
+            self._vocabulary.set("words", vocabulary)
+
+        groups = []
+        for word in words:
+            corrections = vocabulary.corrections(word)
+            if corrections:
+                groups.append("(" + " OR ".join(f'"{correction}"' for correction in corrections) + ")")
+        if not groups:
+            return []
+        return self._ranked(connection, " AND ".join(groups), filters, limit)
+
+    def _ranked(self, connection, match, filters, limit, offset=0):
+        where = _where(filters)
+        # The index only holds existing properties; join them only to filter
+        source = "property_search JOIN properties p ON p.id = property_search.rowid" if where else "property_search"
+        rows = connection.execute(text(
+            f"SELECT property_search.rowid FROM {source} WHERE property_search MATCH :match{where} "
+            "ORDER BY bm25(property_search, 2.0, 1.0), property_search.rowid LIMIT :limit OFFSET :offset"
+        ), _params(filters, match=match, limit=limit, offset=offset))
+        return [row[0] for row in rows]
+
+
+class PostgresSearchBackend:
+    """``tsvector`` column (name weighted above location) with a GIN index, plus pg_trgm for typos"""
+
+    tables = ("property_search",)
+    DOCUMENT = "setweight(to_tsvector('simple', {name}), 'A') || setweight(to_tsvector('simple', {location}), 'B')"
+
+    def create(self, connection):
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS property_search ("
+            "property_id INTEGER PRIMARY KEY REFERENCES properties (id) ON DELETE CASCADE, "
+            "document TSVECTOR NOT NULL, content TEXT NOT NULL)"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_property_search_document ON property_search USING GIN (document)"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_property_search_content_trgm ON property_search "
+            "USING GIN (content gin_trgm_ops)"
+        ))
+
+    def remove(self, connection, ids):
+        connection.execute(text("DELETE FROM property_search WHERE property_id = ANY(:ids)"), {"ids": list(ids)})
+
+    def index(self, connection, rows):
+        document = self.DOCUMENT.format(name="CAST(:name AS TEXT)", location="CAST(:location AS TEXT)")
+        connection.execute(text(
+            f"INSERT INTO property_search (property_id, document, content) "
+            f"VALUES (:id, {document}, CAST(:name AS TEXT) || ' ' || CAST(:location AS TEXT)) "
+            "ON CONFLICT (property_id) DO UPDATE SET document = EXCLUDED.document, content = EXCLUDED.content"
+        ), rows)
+
+    def index_missing(self, connection):
+        document = self.DOCUMENT.format(name="p.name", location="p.location")
+        connection.execute(text(
+            f"INSERT INTO property_search (property_id, document, content) "
+            f"SELECT p.id, {document}, p.name || ' ' || p.location FROM properties p "
+            "WHERE NOT EXISTS (SELECT 1 FROM property_search s WHERE s.property_id = p.id)"
+        ))
+
+    def rebuild(self, connection):
+        connection.execute(text("DELETE FROM property_search"))
+        self.index_missing(connection)
+
+    def search(self, connection, words, filters, limit, offset=0):
+        query = " & ".join(f"{word}:*" if len(word) >= MIN_PREFIX else word for word in words)
+        rows = connection.execute(text(
+            "SELECT p.id FROM property_search s JOIN properties p ON p.id = s.property_id "
+            f"WHERE s.document @@ to_tsquery('simple', :query){_where(filters)} "
+            "ORDER BY ts_rank(s.document, to_tsquery('simple', :query)) DESC, p.id "
+            "LIMIT :limit OFFSET :offset"
+        ), _params(filters, query=query, limit=limit, offset=offset))
+        return [row[0] for row in rows]
+
+    def fuzzy(self, connection, words, filters, limit):
+        # <% keeps rows above pg_trgm.word_similarity_threshold and can use the trigram index
+        rows = connection.execute(text(
+            "SELECT p.id FROM property_search s JOIN properties p ON p.id = s.property_id "
+            f"WHERE :query <% s.content{_where(filters)} "
+            "ORDER BY word_similarity(:query, s.content) DESC, p.id LIMIT :limit"
+        ), _params(filters, query=" ".join(words), limit=limit))
+        return [row[0] for row in rows]
+
+
+BACKENDS = {
+    "sqlite": SqliteSearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+class PropertySearch:
+    """Search index over ``Property.name`` and ``Property.location``.
+
+    Flushed inserts, updates (of name or location) and deletes of
+    properties are written to the index in the same transaction. ORM bulk
+    statements against ``properties`` can't be followed row by row: bulk
+    inserts index whatever is missing and bulk updates/deletes rebuild the
+    index before commit. Databases without a backend, or where the index
+    tables haven't been created (``flask rebuild-search``), fall back to
+    unranked LIKE matching; missing tables are looked for again every
+    ``MISSING_INDEX_TTL`` seconds.
+    """
+
+    def __init__(self):
+        self._backends = {}
+        # Engine URLs whose index tables were missing; retried once the entry expires, so a
+        # migration or ``flask rebuild-search`` run from another process is picked up
+        self._missing = TTLCache(maxsize=16, ttl=MISSING_INDEX_TTL)
+
+    def init_app(self, app):
+        for name, listener in (("after_flush", self._after_flush), ("do_orm_execute", self._do_orm_execute),
+                               ("before_commit", self._before_commit), ("after_rollback", self._after_rollback)):
+            if not event.contains(db.session, name, listener):
+                event.listen(db.session, name, listener)
+        app.extensions["property_search"] = self
+
+    def backend(self, connection):
+        """The connection's backend, or None when its index tables don't exist"""
+        backend_class = BACKENDS.get(connection.dialect.name)
+        if backend_class is None:
+            return None
+        key = str(connection.engine.url)
+        backend = self._backends.get(key)
+        if backend is not None or self._missing.get(key):
+            return backend
+        if not inspect(connection).has_table(backend_class.tables[0]):
+            self._missing.set(key, True)
+            return None
+        backend = self._backends[key] = backend_class()
+        return backend
+
+    # ---------------- Maintenance ---------------- #
+    def create(self):
+        """Create (if needed) and fill the index for the current database; returns the rows indexed"""
+        connection = db.session.connection()
+        backend_class = BACKENDS.get(connection.dialect.name)
+        if backend_class is None:
+            raise RuntimeError(f"Full-text search isn't supported on {connection.dialect.name}")
+        backend = backend_class()
+        backend.create(connection)
+        backend.rebuild(connection)
+        db.session.commit()
+        self._backends.clear()
+        self._missing.clear()
+        return db.session.query(Property.id).count()
+
+    def _after_flush(self, session, flush_context):
+        changed, removed = [], []
+        for instance in session.new:
+            if isinstance(instance, Property):
+                changed.append(instance)
+        for instance in session.dirty:
+            if isinstance(instance, Property):
+                state = inspect(instance)
+                if state.attrs.name.history.has_changes() or state.attrs.location.history.has_changes():
+                    changed.append(instance)
+        for instance in session.deleted:
+            if isinstance(instance, Property):
+                removed.append(instance.id)
+        if not changed and not removed:
+            return
+
+        connection = session.connection()
+        backend = self.backend(connection)
+        if backend is None:
+            return
+        if removed:
+            backend.remove(connection, removed)
+        if changed:
+            backend.index(connection, [
+                {"id": prop.id, "name": prop.name, "location": prop.location} for prop in changed
+            ])
+
+    def _do_orm_execute(self, state):
+        if not (state.is_insert or state.is_update or state.is_delete):
+            return
+        if state.statement.table.name != Property.__tablename__:
+            return
+        sync = "missing" if state.is_insert else "rebuild"
+        if state.session.info.get("property_search_sync") != "rebuild":
+            state.session.info["property_search_sync"] = sync
+
+    def _before_commit(self, session):
+        sync = session.info.pop("property_search_sync", None)
+        if sync is None:
+            return
+        session.flush()
+        connection = session.connection()
+        backend = self.backend(connection)
+        if backend is None:
+            return
+        if sync == "rebuild":
+            backend.rebuild(connection)
+        else:
+            backend.index_missing(connection)
+
+    def _after_rollback(self, session):
+        session.info.pop("property_search_sync", None)
+
+    # ---------------- Queries ---------------- #
+    def search(self, query, limit=20, offset=0, **filters):
+        """Ids of the properties best matching ``query``, best first, and whether typo matching was used.
+
+        Every word must match the start of a word in the name or location
+        ("kilim" finds Kilimani). When nothing does, the first page is made of
+        properties whose words are spelt like the query's instead.
+        """
+        words = terms(query)
+        if not words:
+            return [], False
+        connection = db.session.connection()
+        backend = self.backend(connection)
+        if backend is None:
+            return self._like(words, filters, limit, offset), False
+
+        ids = backend.search(connection, words, filters, limit, offset)
+        if ids or offset:
+            return ids, False
+        return backend.fuzzy(connection, words, filters, limit), True
+
+    def _like(self, words, filters, limit, offset):
+        query = db.session.query(Property.id)
+        for word in words:
+            pattern = f"%{word}%"
+            query = query.filter(Property.name.ilike(pattern) | Property.location.ilike(pattern))
+        if filters.get("status") is not None:
+            query = query.filter(Property.status == filters["status"])
+        if filters.get("min_rent") is not None:
+            query = query.filter(Property.rent >= filters["min_rent"])
+        if filters.get("max_rent") is not None:
+            query = query.filter(Property.rent <= filters["max_rent"])
+        if filters.get("landlord_id") is not None:
+            query = query.filter(Property.landlord_id == filters["landlord_id"])
+        return [row[0] for row in query.order_by(Property.id).limit(limit).offset(offset)]
+
+
+property_search = PropertySearch()
@@ -1,13 +1,18 @@
 from app import create_app, db
-from models import User, Property, Lease, Bill, Notification, Payment, RepairRequest
+from models import User, Property, PropertyPicture, Lease, Bill, Notification, Payment, RepairRequest, LandlordFinancialSummary
+from summaries import rebuild_summaries
+from ledger import rebuild_ledger
+from analytics import rebuild_payment_rollups
 from datetime import date, datetime, timedelta, timezone
 
 app = create_app()
 with app.app_context():
     # --- Clear existing data (order matters) ---
+    LandlordFinancialSummary.query.delete()
     Payment.query.delete()
     Bill.query.delete()
     Lease.query.delete()
+    PropertyPicture.query.delete()
     Property.query.delete()
     Notification.query.delete()
     RepairRequest.query.delete()
@@ -92,9 +97,9 @@ with app.app_context():
             name=name,
             location=location,
             rent=rent,
-            pictures=f'["{image_url}"]',  # Store as JSON array with external URL
             landlord_id=landlord.id
         )
+        p.set_pictures([image_url])  # External URL, stored as the cover picture
         properties.append(p)
 
     db.session.add_all(properties)
@@ -203,4 +208,9 @@ with app.app_context():
     db.session.add_all([repair1, repair2])
     db.session.commit()
 
+    # --- Summaries ---
+    rebuild_summaries()
+    rebuild_ledger()
+    rebuild_payment_rollups()
+
     print("✅ Database seeded successfully with users, properties, leases, bills, payments, notifications, and repairs!")
\ No newline at end of file
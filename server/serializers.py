@@ -0,0 +1,311 @@
+# serializers.py - Per-model serializers compiled once from declared schemas, plus their eager-loading options
+from flask import request
+from sqlalchemy import Date, DateTime, inspect
+from sqlalchemy.orm import joinedload, selectinload
+import media
+from cache import TTLCache
+from models import User, Property, PropertyPicture, Lease, Bill, Payment, Notification, RepairRequest
+
+# Column formats of the SerializerMixin-era responses; user and notification
+# payloads have always used ISO datetimes
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Never serialized, whatever the model
+HIDDEN_COLUMNS = {"password_hash"}
+
+# ?fields= combinations come from clients, so only the most recent ones keep
+# their compiled serializer; the full one is never evicted
+PROJECTION_CACHE_SIZE = 64
+PROJECTION_CACHE_TTL = 3600
+
+# Loader options per output field; every relationship the schemas below
+# touch is loaded up front, so a page of N rows costs the same number of
+# queries as one. See loader_options.
+PROPERTY_LOADERS = {
+    "pictures": selectinload(Property.pictures),
+    "cover_image": selectinload(Property.cover_picture),
+    "cover_variants": selectinload(Property.cover_picture),
+    "images": selectinload(Property.pictures),
+}
+LEASE_LOADERS = {
+    "tenant": joinedload(Lease.tenant),
+    "property": (joinedload(Lease.property).joinedload(Property.landlord),
+                 joinedload(Lease.property).selectinload(Property.pictures),
+                 joinedload(Lease.property).selectinload(Property.cover_picture)),
+    "bills": selectinload(Lease.bills),
+    "payments": selectinload(Lease.payments),
+}
+BILL_LOADERS = {
+    "lease": (joinedload(Bill.lease).joinedload(Lease.tenant),
+              joinedload(Bill.lease).joinedload(Lease.property).selectinload(Property.pictures),
+              joinedload(Bill.lease).joinedload(Lease.property).selectinload(Property.cover_picture)),
+}
+NOTIFICATION_LOADERS = {
+    "sender": joinedload(Notification.sender),
+    "recipient": joinedload(Notification.recipient),
+}
+
+
+def loader_options(loaders, fields=None):
+    """The loader options for the fields a projection keeps (all of them without one)"""
+    options = []
+    for key, option in loaders.items():
+        if fields is None or key in fields:
+            options.extend(option if isinstance(option, tuple) else (option,))
+    return options
+
+
+def _date(value):
+    return value.isoformat() if value is not None else None
+
+
+def _datetime(value):
+    return value.strftime(DATETIME_FORMAT) if value is not None else None
+
+
+def _iso_datetime(value):
+    return value.isoformat() if value is not None else None
+
+
+class Nested:
+    """A relationship serialized with another schema (a list when ``many``).
+
+    ``attribute`` names the relationship when it differs from the output key.
+    """
+
+    def __init__(self, schema, many=False, attribute=None):
+        self.schema = schema
+        self.many = many
+        self.attribute = attribute
+
+
+class Schema:
+    """Response shape of one model, compiled into a plain function.
+
+    ``fields`` lists the output keys in order. Each is a column name, a
+    ``(key, function)`` pair computed from the instance, or a
+    ``(relationship, Nested(...))`` pair. At construction the schema is
+    turned into the source of a single function returning a dict literal
+    (date formatting picked per column type, nested schemas inlined as calls)
+    and compiled, so serializing a row is one function call with no
+    reflection or rule matching. Projections for ``?fields=`` are compiled
+    the same way on first use and cached.
+    """
+
+    def __init__(self, model, fields, iso_datetimes=False):
+        self.model = model
+        self.iso_datetimes = iso_datetimes
+        self.fields = []
+        columns = {attribute.key: attribute.columns[0].type for attribute in inspect(model).column_attrs}
+        for field in fields:
+            if isinstance(field, str):
+                if field not in columns or field in HIDDEN_COLUMNS:
+                    raise ValueError(f"{model.__name__} has no serializable column {field}")
+                self.fields.append((field, "column", columns[field]))
+            elif isinstance(field[1], Nested):
+                self.fields.append((field[0], "nested", field[1]))
+            else:
+                self.fields.append((field[0], "computed", field[1]))
+        self.keys = [key for key, _, _ in self.fields]
+        self._full = self._compile(None)
+        self._projections = TTLCache(maxsize=PROJECTION_CACHE_SIZE, ttl=PROJECTION_CACHE_TTL)
+
+    def __call__(self, instance, fields=None):
+        return self.compiled(fields)(instance)
+
+    def many(self, instances, fields=None):
+        dump = self.compiled(fields)
+        return [dump(instance) for instance in instances]
+
+    def compiled(self, fields=None):
+        key = _freeze(fields)
+        if key is None:
+            return self._full
+        dump = self._projections.get(key)
+        if dump is None:
+            dump = self._compile(fields)
+            self._projections.set(key, dump)
+        return dump
+
+    def _compile(self, projection):
+        namespace = {}
+        items = []
+        for key, kind, spec in self.fields:
+            if projection is not None and key not in projection:
+                continue
+            name = f"_{len(namespace)}"
+            if kind == "column":
+                if isinstance(spec, DateTime):
+                    namespace[name] = _iso_datetime if self.iso_datetimes else _datetime
+                    expression = f"{name}(obj.{key})"
+                elif isinstance(spec, Date):
+                    namespace[name] = _date
+                    expression = f"{name}(obj.{key})"
+                else:
+                    expression = f"obj.{key}"
+            elif kind == "computed":
+                namespace[name] = spec
+                expression = f"{name}(obj)"
+            else:
+                namespace[name] = spec.schema.compiled(projection.get(key) if projection else None)
+                attribute = spec.attribute or key
+                if spec.many:
+                    expression = f"[{name}(item) for item in obj.{attribute}]"
+                else:
+                    expression = f"{name}(obj.{attribute})"
+            items.append(f"{key!r}: {expression}")
+
+        source = (
+            "def dump(obj):\n"
+            "    if obj is None:\n"
+            "        return None\n"
+            f"    return {{{', '.join(items)}}}\n"
+        )
+        exec(compile(source, f"<serializer {self.model.__name__}>", "exec"), namespace)
+        return namespace["dump"]
+
+    def parse_fields(self, value):
+        """Turn ``"id,status,tenant.email"`` into a projection for this schema.
+
+        Raises ValueError naming the first unknown field.
+        """
+        if not value:
+            return None
+        projection = {}
+        for path in value.split(","):
+            path = path.strip()
+            if not path:
+                continue
+            schema, node = self, projection
+            parts = path.split(".")
+            for depth, part in enumerate(parts):
+                kinds = {key: (kind, spec) for key, kind, spec in schema.fields}
+                if part not in kinds:
+                    raise ValueError(f"Unknown field: {path}")
+                kind, spec = kinds[part]
+                last = depth == len(parts) - 1
+                if last:
+                    node[part] = None
+                    break
+                if kind != "nested":
+                    raise ValueError(f"Unknown field: {path}")
+                if part in node and node[part] is None:
+                    # The whole object was already requested
+                    break
+                node = node.setdefault(part, {})
+                schema = spec.schema
+        return projection
+
+
+def _freeze(projection):
+    if projection is None:
+        return None
+    return tuple(sorted((key, _freeze(value)) for key, value in projection.items()))
+
+
+def requested_fields(schema):
+    """The ``?fields=`` projection of the current request for ``schema`` (None for everything)"""
+    return schema.parse_fields(request.args.get("fields"))
+
+
+# ---------------- Computed fields ---------------- #
+def _property_pictures(prop):
+    return [picture.url for picture in prop.pictures]
+
+
+def _property_cover_image(prop):
+    cover = prop.cover_picture
+    return cover.url if cover is not None else None
+
+
+def _picture_variants(picture):
+    if picture is None or not picture.variants_ready:
+        return []
+    return [
+        {"name": name, "width": width, "height": height,
+         **{extension: media.variant_url(picture.content_hash, name, extension) for extension, _, _ in media.FORMATS}}
+        for name, width, height in media.variant_sizes(picture.width, picture.height)
+    ]
+
+
+def _property_cover_variants(prop):
+    return _picture_variants(prop.cover_picture)
+
+
+def _notification_sender(notification):
+    sender = notification.sender
+    if sender is None:
+        return {"id": None, "name": "System", "role": "System"}
+    return {"id": sender.public_id, "name": f"{sender.first_name} {sender.last_name}", "role": sender.role}
+
+
+def _notification_recipient(notification):
+    recipient = notification.recipient
+    if recipient is None:
+        return None
+    return {"id": recipient.public_id, "name": f"{recipient.first_name} {recipient.last_name}"}
+
+
+# ---------------- Schemas ---------------- #
+USER = Schema(User, (
+    "public_id", "first_name", "last_name", "username", "email", "national_id", "phone_number", "role",
+    "is_active", "created_at", "updated_at"
+), iso_datetimes=True)
+
+PICTURE = Schema(PropertyPicture, (
+    "id", "url", "position", "width", "height", "byte_size", ("variants", _picture_variants)
+))
+
+# Load with PROPERTY_LOADERS; "pictures" stays the plain list of URLs clients have always received
+PROPERTY_COLUMNS = ("id", "name", "location", "rent", "status", ("pictures", _property_pictures),
+                    ("cover_image", _property_cover_image), ("cover_variants", _property_cover_variants),
+                    "landlord_id")
+PROPERTY = Schema(Property, PROPERTY_COLUMNS)
+PROPERTY_DETAIL = Schema(Property, PROPERTY_COLUMNS + (("images", Nested(PICTURE, many=True, attribute="pictures")),))
+PROPERTY_WITH_LANDLORD = Schema(Property, PROPERTY_COLUMNS + (("landlord", Nested(USER)),))
+
+PAYMENT = Schema(Payment, ("id", "lease_id", "amount", "provider_id", "status", "transaction_id", "created_at"))
+
+BILL = Schema(Bill, ("id", "lease_id", "amount", "due_date", "status", "period", "created_at"))
+
+LEASE_COLUMNS = ("id", "tenant_id", "property_id", "start_date", "end_date", "rent_amount", "status",
+                 "vacate_date", "vacate_status")
+
+# A lease with everything about it, for lease endpoints (load with LEASE_LOADERS)
+LEASE = Schema(Lease, LEASE_COLUMNS + (
+    ("tenant", Nested(USER)),
+    ("property", Nested(PROPERTY_WITH_LANDLORD)),
+    ("bills", Nested(BILL, many=True)),
+    ("payments", Nested(PAYMENT, many=True)),
+))
+
+# A bill with its lease's tenant and property, for bill endpoints (load with BILL_LOADERS)
+BILL_WITH_LEASE = Schema(Bill, ("id", "lease_id", "amount", "due_date", "status", "period", "created_at", (
+    "lease", Nested(Schema(Lease, LEASE_COLUMNS + (("tenant", Nested(USER)), ("property", Nested(PROPERTY)))))
+)))
+
+NOTIFICATION = Schema(Notification, (
+    "id", ("sender", _notification_sender), ("recipient", _notification_recipient), "title", "message",
+    "notification_type", "is_broadcast", "broadcast_id", "is_read", "created_at", "read_at"
+), iso_datetimes=True)
+
+REPAIR_REQUEST = Schema(RepairRequest, (
+    "id", "tenant_id", "property_id", "title", "description", "status", "priority", "created_at"
+))
+
+# What Model.to_dict() returns for each model
+DEFAULT_SCHEMAS = {
+    User: USER,
+    Property: PROPERTY,
+    PropertyPicture: PICTURE,
+    Lease: LEASE,
+    Bill: BILL_WITH_LEASE,
+    Payment: PAYMENT,
+    Notification: NOTIFICATION,
+    RepairRequest: REPAIR_REQUEST,
+}
+
+
+def dump(instance, fields=None):
+    return DEFAULT_SCHEMAS[type(instance)](instance, fields)
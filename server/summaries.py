@@ -0,0 +1,251 @@
+# summaries.py - Incrementally maintained per-landlord financial summaries
+from datetime import date, datetime
+from sqlalchemy import func, case, and_, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from models import db, LandlordFinancialSummary, Lease, Bill, Payment, Property, SUCCESSFUL
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def period_for(value=None):
+    """Return the 'YYYY-MM' summary period a date or datetime falls in"""
+    value = value or date.today()
+    return value.strftime("%Y-%m")
+
+
+def get_or_create_summary(landlord_id, period):
+    """Fetch the summary row for a landlord and month, creating it if needed.
+
+    A new month carries the active lease count and expected rent forward from
+    the landlord's latest earlier month. The row is inserted in the caller's
+    transaction, and a row another worker created first wins over ours, so
+    callers racing on the same month all end up incrementing one row.
+    """
+    summary = LandlordFinancialSummary.query.filter_by(landlord_id=landlord_id, period=period).first()
+    if summary:
+        return summary
+
+    previous = LandlordFinancialSummary.query.filter(
+        LandlordFinancialSummary.landlord_id == landlord_id,
+        LandlordFinancialSummary.period < period
+    ).order_by(LandlordFinancialSummary.period.desc()).first()
+
+    row = dict(
+        landlord_id=landlord_id,
+        period=period,
+        collected=0,
+        billed=0,
+        pending_bills=0,
+        active_leases=previous.active_leases if previous else 0,
+        expected_rent=previous.expected_rent if previous else 0
+    )
+    table = LandlordFinancialSummary.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert_for = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        db.session.execute(
+            insert_for(table).values(**row).on_conflict_do_nothing(index_elements=[table.c.landlord_id, table.c.period])
+        )
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(table).values(**row))
+        except IntegrityError:
+            # Another transaction created the month first; use its row
+            pass
+    return LandlordFinancialSummary.query.filter_by(landlord_id=landlord_id, period=period).one()
+
+
+def _landlord_id_for_lease(lease):
+    if lease.property is not None:
+        return lease.property.landlord_id
+    return db.session.query(Property.landlord_id).filter(Property.id == lease.property_id).scalar()
+
+
+def _apply(landlord_id, period, **deltas):
+    """Add deltas to a summary row as SQL increments so concurrent workers don't lose updates"""
+    if landlord_id is None or not any(deltas.values()):
+        return
+    summary = get_or_create_summary(landlord_id, period)
+    for column, delta in deltas.items():
+        if delta:
+            setattr(summary, column, getattr(LandlordFinancialSummary, column) + delta)
+    # Flush so a second delta to the same row isn't overwritten before it is saved
+    db.session.flush()
+
+
+def apply_totals(totals):
+    """Apply deltas accumulated for many events at once, one update per summary row.
+
+    ``totals`` maps ``(landlord_id, period)`` to ``{column: delta}``.
+    """
+    for (landlord_id, period), deltas in totals.items():
+        _apply(landlord_id, period, **deltas)
+
+
+# ---------------- Event hooks (call before committing) ---------------- #
+def record_payment_status(payment, previous_status):
+    """Post a payment's amount to collected revenue when it becomes successful"""
+    if previous_status == payment.status:
+        return
+    if SUCCESSFUL not in (previous_status, payment.status):
+        return
+
+    sign = 1 if payment.status == SUCCESSFUL else -1
+    landlord_id = _landlord_id_for_lease(payment.lease)
+    _apply(landlord_id, period_for(payment.created_at), collected=sign * payment.amount)
+
+
+def bill_snapshot(bill):
+    """Capture the fields of a bill that feed the summary, before it is modified"""
+    return {"amount": bill.amount, "status": bill.status, "due_date": bill.due_date}
+
+
+def record_bill_change(bill, before=None, deleted=False):
+    """Move a bill's contribution from its old values (``before``) to its current ones"""
+    landlord_id = _landlord_id_for_lease(bill.lease)
+
+    if before:
+        _apply(
+            landlord_id, period_for(before["due_date"]),
+            billed=-before["amount"],
+            pending_bills=-before["amount"] if before["status"] == "unpaid" else 0
+        )
+    if not deleted:
+        _apply(
+            landlord_id, period_for(bill.due_date),
+            billed=bill.amount,
+            pending_bills=bill.amount if bill.status == "unpaid" else 0
+        )
+
+
+def lease_snapshot(lease):
+    """Capture the fields of a lease that feed the summary, before it is modified"""
+    return {"status": lease.status, "rent_amount": lease.rent_amount}
+
+
+def record_lease_change(lease, before=None, deleted=False):
+    """Keep the current month's occupancy and expected rent in step with a lease"""
+    was_active = bool(before) and before["status"] == "active"
+    is_active = not deleted and lease.status == "active"
+
+    active_delta = int(is_active) - int(was_active)
+    rent_delta = (lease.rent_amount if is_active else 0) - (before["rent_amount"] if was_active else 0)
+
+    if not active_delta and not rent_delta:
+        return
+
+    landlord_id = _landlord_id_for_lease(lease)
+    current = period_for()
+    _apply(landlord_id, current, active_leases=active_delta, expected_rent=rent_delta)
+
+    # Months already opened ahead of time (e.g. by a bill due next month) carry the same snapshot
+    LandlordFinancialSummary.query.filter(
+        LandlordFinancialSummary.landlord_id == landlord_id,
+        LandlordFinancialSummary.period > current
+    ).update({
+        LandlordFinancialSummary.active_leases: LandlordFinancialSummary.active_leases + active_delta,
+        LandlordFinancialSummary.expected_rent: LandlordFinancialSummary.expected_rent + rent_delta
+    }, synchronize_session=False)
+
+
+# ---------------- Reads ---------------- #
+def landlord_totals(landlord_id):
+    """All-time collected and pending totals for a landlord, from the summary rows"""
+    collected, pending = db.session.query(
+        func.coalesce(func.sum(LandlordFinancialSummary.collected), 0),
+        func.coalesce(func.sum(LandlordFinancialSummary.pending_bills), 0)
+    ).filter(LandlordFinancialSummary.landlord_id == landlord_id).one()
+    return {"collected": collected, "pending_bills": pending}
+
+
+def collection_rate(landlord_id=None, period=None):
+    """Share of a month's expected rent that has been collected, as a percentage.
+
+    Expected rent comes from each landlord's latest row up to the month, since
+    a month's row is only created once something happens in it.
+    """
+    period = period or period_for()
+    latest = db.session.query(
+        LandlordFinancialSummary.landlord_id,
+        func.max(LandlordFinancialSummary.period).label("period")
+    ).filter(LandlordFinancialSummary.period <= period)
+    if landlord_id is not None:
+        latest = latest.filter(LandlordFinancialSummary.landlord_id == landlord_id)
+    latest = latest.group_by(LandlordFinancialSummary.landlord_id).subquery()
+
+    collected, expected = db.session.query(
+        func.coalesce(func.sum(case(
+            (LandlordFinancialSummary.period == period, LandlordFinancialSummary.collected), else_=0
+        )), 0),
+        func.coalesce(func.sum(LandlordFinancialSummary.expected_rent), 0)
+    ).join(
+        latest, and_(
+            latest.c.landlord_id == LandlordFinancialSummary.landlord_id,
+            latest.c.period == LandlordFinancialSummary.period
+        )
+    ).one()
+    if not expected:
+        return 0
+    return round(collected / expected * 100, 2)
+
+
+# ---------------- Backfill ---------------- #
+def rebuild_summaries(batch_size=1000):
+    """Recompute every summary row from Payment, Bill and Lease history.
+
+    Historical occupancy is not recorded anywhere, so active leases and
+    expected rent are only rebuilt for the current month and later ones.
+    """
+    totals = {}
+
+    def row(landlord_id, period):
+        return totals.setdefault((landlord_id, period), {
+            "collected": 0, "billed": 0, "pending_bills": 0, "active_leases": 0, "expected_rent": 0
+        })
+
+    payments = db.session.query(Property.landlord_id, Payment.created_at, Payment.amount).join(
+        Lease, Payment.lease_id == Lease.id
+    ).join(
+        Property, Lease.property_id == Property.id
+    ).filter(Payment.status == SUCCESSFUL).yield_per(batch_size)
+    for landlord_id, created_at, amount in payments:
+        row(landlord_id, period_for(created_at or datetime.now()))["collected"] += amount
+
+    bills = db.session.query(Property.landlord_id, Bill.due_date, Bill.amount, Bill.status).join(
+        Lease, Bill.lease_id == Lease.id
+    ).join(
+        Property, Lease.property_id == Property.id
+    ).yield_per(batch_size)
+    for landlord_id, due_date, amount, status in bills:
+        summary = row(landlord_id, period_for(due_date))
+        summary["billed"] += amount
+        if status == "unpaid":
+            summary["pending_bills"] += amount
+
+    current = period_for()
+    leases = db.session.query(
+        Property.landlord_id, func.count(Lease.id), func.coalesce(func.sum(Lease.rent_amount), 0)
+    ).join(
+        Property, Lease.property_id == Property.id
+    ).filter(Lease.status == "active").group_by(Property.landlord_id)
+    for landlord_id, active_leases, expected_rent in leases:
+        row(landlord_id, current).update(active_leases=active_leases, expected_rent=expected_rent)
+
+    # Months opened ahead of time carry the current occupancy snapshot
+    for (landlord_id, period), values in totals.items():
+        if period > current and (landlord_id, current) in totals:
+            snapshot = totals[(landlord_id, current)]
+            values.update(active_leases=snapshot["active_leases"], expected_rent=snapshot["expected_rent"])
+
+    LandlordFinancialSummary.query.delete()
+    db.session.bulk_insert_mappings(LandlordFinancialSummary, [
+        {"landlord_id": landlord_id, "period": period, **values}
+        for (landlord_id, period), values in totals.items()
+    ])
+    db.session.commit()
+
+    logger.info(f"Rebuilt {len(totals)} landlord financial summary rows")
+    return len(totals)
@@ -0,0 +1,133 @@
+# conftest.py - App, database and factory fixtures shared by the server tests
+import os
+import sys
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Never touch a developer's database; keep every backend in-process
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ["JWT_REVOCATION_BACKEND"] = "memory"
+os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+
+from app import create_app  # noqa: E402
+from models import bcrypt, db as _db, User, Property, Lease, Payment, Bill  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+PASSWORD = "secret1"
+
+
+@pytest.fixture(scope="session")
+def app():
+    app = create_app()
+    app.config["TESTING"] = True
+    return app
+
+
+@pytest.fixture
+def db(app):
+    """A fresh schema per test. No app context stays pushed: like in production, every request
+    (and every setup step, through ``app.app_context()``) gets its own ``g`` and session"""
+    with app.app_context():
+        _db.create_all()
+    yield _db
+    with app.app_context():
+        _db.session.remove()
+        _db.drop_all()
+
+
+@pytest.fixture
+def engine(app, db):
+    with app.app_context():
+        return db.engine
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
+
+
+@pytest.fixture(scope="session")
+def password_hash():
+    # bcrypt is deliberately slow; hash the shared test password once
+    return bcrypt.generate_password_hash(PASSWORD).decode("utf-8")
+
+
+@pytest.fixture
+def make_user(app, db, password_hash):
+    """Create a user with ``role`` and return its id"""
+    counter = iter(range(1, 10**6))
+
+    def make_user(role):
+        n = next(counter)
+        with app.app_context():
+            user = User(username=f"{role}{n}", email=f"{role}{n}@example.com", national_id=10000 + n, role=role,
+                        first_name="Test", last_name=f"User{n}", phone_number="0712345678",
+                        password_hash=password_hash)
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return make_user
+
+
+@pytest.fixture
+def auth_headers(app, db):
+    def auth_headers(user_id):
+        with app.app_context():
+            user = db.session.get(User, user_id)
+            token = create_access_token(identity=user.public_id, additional_claims={"role": user.role})
+        return {"Authorization": f"Bearer {token}"}
+    return auth_headers
+
+
+@pytest.fixture
+def portfolio(app, db, make_user):
+    """Add ``count`` let properties to the landlord ``landlord_id``, each with a tenant, a payment, a pending and an
+    overdue bill"""
+    def portfolio(landlord_id, count):
+        today = date.today()
+        tenant_ids = [make_user("tenant") for _ in range(count)]
+        with app.app_context():
+            for tenant_id in tenant_ids:
+                prop = Property(name=f"Unit {tenant_id}", location="Kilimani", rent=1000, status="occupied",
+                                landlord_id=landlord_id)
+                prop.set_pictures([f"https://images.example/{tenant_id}.jpg"])
+                db.session.add(prop)
+                db.session.flush()
+                lease = Lease(tenant_id=tenant_id, property_id=prop.id, rent_amount=1000,
+                              start_date=today - timedelta(days=90))
+                db.session.add(lease)
+                db.session.flush()
+                db.session.add(Payment(lease_id=lease.id, amount=1000, status="successful",
+                                       transaction_id=f"TX{lease.id}"))
+                db.session.add(Bill(lease_id=lease.id, amount=1000, due_date=today + timedelta(days=5),
+                                    status="unpaid"))
+                overdue = Bill(lease_id=lease.id, amount=1000, due_date=today, status="unpaid")
+                db.session.add(overdue)
+                db.session.flush()
+                # Bill refuses past due dates; backdate it behind the validator's back
+                Bill.query.filter_by(id=overdue.id).update({"due_date": today - timedelta(days=5)})
+            db.session.commit()
+    return portfolio
+
+
+@pytest.fixture
+def count_statements(engine):
+    """Context manager collecting the SQL statements sent to the database inside its block"""
+    @contextmanager
+    def count_statements():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return count_statements
@@ -0,0 +1,23 @@
+def dashboard_statements(client, count_statements, headers):
+    # The first request also fills the per-worker identity cache; measure a warm one
+    client.get("/landlord/dashboard", headers=headers)
+    with count_statements() as statements:
+        response = client.get("/landlord/dashboard", headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return statements, response.get_json()["dashboard"]
+
+
+def test_landlord_dashboard_statement_count_does_not_grow_with_portfolio(client, count_statements, make_user,
+                                                                         auth_headers, portfolio):
+    landlord_id = make_user("landlord")
+    headers = auth_headers(landlord_id)
+
+    portfolio(landlord_id, 2)
+    small, dashboard = dashboard_statements(client, count_statements, headers)
+    assert dashboard["property_summary"]["total_properties"] == 2
+
+    portfolio(landlord_id, 25)
+    large, dashboard = dashboard_statements(client, count_statements, headers)
+    assert dashboard["property_summary"]["total_properties"] == 27
+
+    assert len(large) == len(small), large
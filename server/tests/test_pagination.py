@@ -0,0 +1,33 @@
+import base64
+import json
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor
+
+
+def raw_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+@pytest.mark.parametrize("values", [[None], [{}], [[1]], [True], [1, 2], {"id": 1}])
+def test_decode_cursor_rejects_anything_but_scalar_sort_keys(values):
+    with pytest.raises(ValueError):
+        decode_cursor(raw_cursor(values))
+
+
+def test_decode_cursor_round_trips():
+    assert decode_cursor(encode_cursor("2026-01-01T00:00:00", 7), size=2) == ["2026-01-01T00:00:00", 7]
+
+
+@pytest.mark.parametrize("values", [[None], [{}], ["x"]])
+def test_properties_answers_400_for_a_tampered_cursor(client, values):
+    response = client.get(f"/properties?cursor={raw_cursor(values)}")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("values", [[None, 1], ["2026-01-01T00:00:00", {}], ["2026-01-01T00:00:00", "x"]])
+def test_notifications_answer_400_for_a_tampered_cursor(client, make_user, auth_headers, values):
+    headers = auth_headers(make_user("tenant"))
+    response = client.get(f"/notifications?cursor={raw_cursor(values)}", headers=headers)
+    assert response.status_code == 400
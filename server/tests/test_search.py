@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy import text
+
+import cache
+from models import Property
+from search import property_search, SqliteSearchBackend, MISSING_INDEX_TTL
+
+
+@pytest.fixture
+def search_state(app, db):
+    yield property_search
+    with app.app_context():
+        for table in reversed(SqliteSearchBackend.tables):
+            db.session.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        db.session.commit()
+    property_search._backends.clear()
+    property_search._missing.clear()
+
+
+def test_search_picks_up_an_index_created_after_the_first_lookup(app, db, client, make_user, search_state,
+                                                               monkeypatch):
+    landlord_id = make_user("landlord")
+    with app.app_context():
+        db.session.add(Property(name="Garden Court", location="Kilimani", rent=1000, landlord_id=landlord_id))
+        db.session.commit()
+
+    # No index yet: unranked LIKE matching, so a prefix still matches but a typo doesn't
+    assert [p["name"] for p in client.get("/properties/search?q=kilim").get_json()["properties"]] == ["Garden Court"]
+    assert client.get("/properties/search?q=kilmani").get_json()["properties"] == []
+
+    # Another process (a migration or `flask rebuild-search`) creates and fills the index
+    with app.app_context():
+        backend = SqliteSearchBackend()
+        backend.create(db.session.connection())
+        backend.rebuild(db.session.connection())
+        db.session.commit()
+
+    clock = cache.time.monotonic()
+    monkeypatch.setattr(cache.time, "monotonic", lambda: clock + MISSING_INDEX_TTL + 1)
+    body = client.get("/properties/search?q=kilmani").get_json()
+    assert body["fuzzy"] is True
+    assert [p["name"] for p in body["properties"]] == ["Garden Court"]
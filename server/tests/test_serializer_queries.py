@@ -0,0 +1,64 @@
+import pytest
+
+from models import Notification
+
+
+def listing_statements(client, count_statements, path, headers):
+    # The first request also compiles the serializers and fills the identity cache; measure a warm one
+    client.get(path, headers=headers)
+    with count_statements() as statements:
+        response = client.get(path, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return statements, response.get_json()
+
+
+@pytest.mark.parametrize("path, key, per_unit", [
+    ("/properties?limit=100", "properties", 1),
+    ("/properties?limit=100&fields=id,name,cover_image", "properties", 1),
+    ("/leases", "leases", 1),
+    ("/leases?fields=id,status,tenant.email,property.name,property.cover_image", "leases", 1),
+    ("/tenants", "tenants", 1),
+    # Bill's default schema nests the lease with its tenant and property
+    ("/bills", "bills", 2),
+])
+def test_listing_statement_count_does_not_grow_with_rows(client, count_statements, make_user, auth_headers,
+                                                         portfolio, path, key, per_unit):
+    landlord_id = make_user("landlord")
+    headers = auth_headers(landlord_id)
+
+    portfolio(landlord_id, 2)
+    small, body = listing_statements(client, count_statements, path, headers)
+    assert len(body[key]) == 2 * per_unit
+
+    portfolio(landlord_id, 25)
+    large, body = listing_statements(client, count_statements, path, headers)
+    assert len(body[key]) == 27 * per_unit
+
+    assert len(large) == len(small), large
+
+
+def test_notification_statement_count_does_not_grow_with_senders(app, db, client, count_statements, make_user,
+                                                                 auth_headers):
+    tenant_id = make_user("tenant")
+    headers = auth_headers(tenant_id)
+
+    def notify(count):
+        # One landlord per notification, so every row has a sender of its own to load
+        sender_ids = [make_user("landlord") for _ in range(count)]
+        with app.app_context():
+            db.session.add_all([
+                Notification(sender_id=sender_id, recipient_id=tenant_id, title="Rent", message="Rent is due",
+                             notification_type="payment")
+                for sender_id in sender_ids
+            ])
+            db.session.commit()
+
+    notify(2)
+    small, body = listing_statements(client, count_statements, "/notifications?limit=100", headers)
+    assert len(body["notifications"]) == 2
+
+    notify(25)
+    large, body = listing_statements(client, count_statements, "/notifications?limit=100", headers)
+    assert len(body["notifications"]) == 27
+
+    assert len(large) == len(small), large
@@ -1,12 +1,14 @@
 # utils.py - Utility functions for notifications and background tasks
-import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from twilio.rest import Client
 from datetime import datetime, timedelta, date
 from celery import Celery
-from models import db, Lease, Notification, User
+from models import db, Lease, Notification, User, SUCCESSFUL
+import summaries
+import outbox
+import rent_status
+import billing
+import ledger
+import analytics
+from rent_status import REMINDER_DAYS
 import logging
 
 # Configure logging
@@ -25,35 +27,14 @@ def make_celery(app):
 
 # Email utilities
 def send_email(to_email, subject, body, html_body=None):
-    """Send email using SMTP"""
+    """Send one email immediately over SMTP.
+
+    Request handlers and scheduled jobs should use outbox.enqueue_email so
+    delivery happens off the request path and is retried on failure.
+    """
     try:
-        smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-        smtp_port = int(os.getenv('SMTP_PORT', '587'))
-        email_user = os.getenv('EMAIL_USER')
-        email_password = os.getenv('EMAIL_PASSWORD')
-
-        if not all([email_user, email_password]):
-            logger.error("Email credentials not configured")
-            return False
-
-        msg = MIMEMultipart('alternative')
-        msg['From'] = email_user
-        msg['To'] = to_email
-        msg['Subject'] = subject
-
-        # Add plain text version
-        text_part = MIMEText(body, 'plain')
-        msg.attach(text_part)
-
-        # Add HTML version if provided
-        if html_body:
-            html_part = MIMEText(html_body, 'html')
-            msg.attach(html_part)
-
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(email_user, email_password)
-            server.send_message(msg)
+        with outbox.SMTPMailer() as mailer:
+            mailer.send(to_email, subject, body, html_body)
 
         logger.info(f"Email sent successfully to {to_email}")
         return True
@@ -63,23 +44,9 @@ def send_email(to_email, subject, body, html_body=None):
         return False
 
 def send_sms(phone_number, message):
-    """Send SMS using Twilio"""
+    """Send one SMS immediately using Twilio (see outbox.enqueue_sms for queued delivery)"""
     try:
-        account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-        auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-        from_phone = os.getenv('TWILIO_PHONE_NUMBER')
-
-        if not all([account_sid, auth_token, from_phone]):
-            logger.error("Twilio credentials not configured")
-            return False
-
-        client = Client(account_sid, auth_token)
-
-        message = client.messages.create(
-            body=message,
-            from_=from_phone,
-            to=phone_number
-        )
+        message = outbox.SMSSender().send(phone_number, message)
 
         logger.info(f"SMS sent successfully to {phone_number}: {message.sid}")
         return True
@@ -103,33 +70,26 @@ def create_background_task(func):
 # Automated reminder functions
 def check_overdue_rent():
     """Check for overdue rent and send reminders"""
-    today = date.today()
     overdue_leases = []
 
-    # Get all active leases
-    active_leases = Lease.query.filter_by(status='active').all()
-
-    for lease in active_leases:
-        if not lease.is_rent_up_to_date():
-            days_behind = lease.days_behind_rent()
-
-            # Send reminders at 1, 7, 14, and 30 days overdue
-            if days_behind in [1, 7, 14, 30]:
-                send_rent_reminder(lease, days_behind)
-                overdue_leases.append({
-                    'lease_id': lease.id,
-                    'tenant_name': f"{lease.tenant.first_name} {lease.tenant.last_name}",
-                    'days_behind': days_behind,
-                    'amount_due': lease.calculate_outstanding_rent()
-                })
+    # Send reminders at 1, 7, 14, and 30 days overdue; only those leases are loaded
+    for status in rent_status.overdue_leases(days_behind=REMINDER_DAYS):
+        send_rent_reminder(status.lease, status.days_behind, status.amount_due,
+                           tenant=status.tenant, sender_id=status.landlord_id)
+        overdue_leases.append({
+            'lease_id': status.lease.id,
+            'tenant_name': f"{status.tenant.first_name} {status.tenant.last_name}",
+            'days_behind': status.days_behind,
+            'amount_due': status.amount_due
+        })
 
+    db.session.commit()
     logger.info(f"Processed {len(overdue_leases)} overdue rent reminders")
     return overdue_leases
 
-def send_rent_reminder(lease, days_behind):
-    """Send rent reminder for specific lease"""
-    tenant = lease.tenant
-    amount_due = lease.calculate_outstanding_rent()
+def send_rent_reminder(lease, days_behind, amount_due, tenant=None, sender_id=None):
+    """Queue a rent reminder for a specific lease; the caller commits"""
+    tenant = tenant or lease.tenant
 
     # Determine urgency based on days behind
     if days_behind >= 30:
@@ -191,35 +151,24 @@ Property Management Team
 </html>
 """
 
-    # Send email
-    email_sent = send_email(tenant.email, subject, email_body, html_body)
+    # Queue email; the outbox worker delivers it after this transaction commits
+    outbox.enqueue_email(tenant.email, subject, email_body, html_body)
 
-    # Send SMS for urgent cases
-    sms_sent = False
-    if days_behind >= 7:
+    # Queue SMS for urgent cases
+    if days_behind >= 7 and tenant.phone_number:
         sms_message = f"RENT REMINDER: Your rent payment is {days_behind} days overdue. Amount due: ${amount_due}. Please pay immediately to avoid penalties."
-        sms_sent = send_sms(tenant.phone_number, sms_message)
+        outbox.enqueue_sms(tenant.phone_number, sms_message)
 
     # Create notification record
     notification = Notification(
-        sender_id=1,  # System/admin user
+        sender_id=sender_id or lease.property.landlord_id,
         recipient_id=tenant.id,
-        notification_type='rent_reminder',
+        notification_type='payment',
         title=subject,
-        body=email_body,
-        audience='tenant',
-        is_email_sent=email_sent,
-        is_sms_sent=sms_sent,
-        metadata={
-            'lease_id': lease.id,
-            'days_behind': days_behind,
-            'amount_due': amount_due,
-            'urgency': urgency
-        }
+        message=f"Your rent is {days_behind} days overdue. Outstanding amount: ${amount_due}."
     )
 
     db.session.add(notification)
-    db.session.commit()
 
 def check_lease_expiry():
     """Check for leases expiring soon and send notifications"""
@@ -234,20 +183,23 @@ def check_lease_expiry():
     ).all()
 
     notifications_sent = 0
+    emails_queued = 0
 
     for lease in expiring_leases:
         days_until_expiry = (lease.end_date - today).days
 
         # Send notifications at 60, 30, 14, and 7 days before expiry
         if days_until_expiry in [60, 30, 14, 7]:
-            send_lease_expiry_notification(lease, days_until_expiry)
+            if send_lease_expiry_notification(lease, days_until_expiry):
+                emails_queued += 1
             notifications_sent += 1
 
-    logger.info(f"Sent {notifications_sent} lease expiry notifications")
+    logger.info(f"Sent {notifications_sent} lease expiry notifications; "
+                f"queued {emails_queued} emails for the outbox worker")
     return notifications_sent
 
 def send_lease_expiry_notification(lease, days_until_expiry):
-    """Send lease expiry notification"""
+    """Notify the tenant in-app and queue the expiry email; returns whether the email was queued"""
     tenant = lease.tenant
 
     subject = f"Lease Expiry Notice - {days_until_expiry} days remaining"
@@ -268,75 +220,48 @@ Thank you,
 Property Management Team
 """
 
-    # Send email
-    email_sent = send_email(tenant.email, subject, email_body)
+    # Queue email; the outbox worker delivers it after this transaction commits,
+    # and records whether it was actually sent on the outbound message
+    email_queued = bool(tenant.email) and outbox.enqueue_email(tenant.email, subject, email_body) is not None
 
     # Create notification
     notification = Notification(
         sender_id=1,  # System/admin user
         recipient_id=tenant.id,
-        notification_type='lease_expiry',
+        notification_type='lease',
         title=subject,
-        body=email_body,
-        audience='tenant',
-        is_email_sent=email_sent,
-        metadata={
-            'lease_id': lease.id,
-            'days_until_expiry': days_until_expiry,
-            'expiry_date': lease.end_date.isoformat()
-        }
+        message=email_body
     )
 
     db.session.add(notification)
     db.session.commit()
+    return email_queued
 
 # Data analysis utilities
-def calculate_rent_collection_rate():
-    """Calculate overall rent collection rate"""
-    active_leases = Lease.query.filter_by(status='active').all()
-
-    if not active_leases:
-        return 0
-
-    up_to_date_count = sum(1 for lease in active_leases if lease.is_rent_up_to_date())
-    return round((up_to_date_count / len(active_leases)) * 100, 2)
+def calculate_rent_collection_rate(period=None):
+    """Calculate overall rent collection rate from the landlord financial summaries"""
+    return summaries.collection_rate(period=period)
 
 def get_payment_analytics(start_date=None, end_date=None):
-    """Get payment analytics for a date range"""
-    from models import Payment
-
+    """Get successful-payment analytics for a date range from the payment rollups"""
     if not start_date:
         start_date = datetime.now() - timedelta(days=30)
     if not end_date:
         end_date = datetime.now()
-
-    payments = Payment.query.filter(
-        Payment.created_at.between(start_date, end_date),
-        Payment.status == 'completed'
-    ).all()
-
-    analytics = {
-        'total_payments': len(payments),
-        'total_amount': sum(p.amount for p in payments),
-        'payment_methods': {},
-        'payment_types': {}
+    start_date = start_date.date() if isinstance(start_date, datetime) else start_date
+    end_date = end_date.date() if isinstance(end_date, datetime) else end_date
+
+    report = analytics.payment_analytics(start_date, end_date, status=SUCCESSFUL)
+    return {
+        'total_payments': report['total_count'],
+        'total_amount': report['total_amount'],
+        'payment_methods': {
+            provider: statuses.get(SUCCESSFUL, {'count': 0, 'amount': 0})
+            for provider, statuses in report['by_provider'].items()
+        },
+        'series': report['series']
     }
 
-    for payment in payments:
-        # Count by method
-        if payment.method not in analytics['payment_methods']:
-            analytics['payment_methods'][payment.method] = {'count': 0, 'amount': 0}
-        analytics['payment_methods'][payment.method]['count'] += 1
-        analytics['payment_methods'][payment.method]['amount'] += payment.amount
-
-        # Count by type
-        if payment.payment_type not in analytics['payment_types']:
-            analytics['payment_types'][payment.payment_type] = {'count': 0, 'amount': 0}
-        analytics['payment_types'][payment.payment_type]['count'] += 1
-        analytics['payment_types'][payment.payment_type]['amount'] += payment.amount
-
-    return analytics
-
 # Maintenance utilities for repair requests
 def send_repair_request_notification(repair_request, recipient_role='landlord'):
     """Send notification about repair request"""
@@ -393,6 +318,18 @@ def daily_rent_check():
         logger.error(f"Error during daily rent check: {str(e)}")
         return 0
 
+def monthly_billing_run(period=None):
+    """Monthly task to bill every active lease and post the matching ledger charges"""
+    try:
+        report = billing.generate_monthly_bills(period)
+        report["ledger_charges"] = ledger.post_rent_charges(report["period"])
+        logger.info(f"Monthly billing completed: {report}")
+        return report
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error during monthly billing: {str(e)}")
+        return None
+
 def weekly_lease_expiry_check():
     """Weekly task to check for expiring leases"""
     try:
@@ -410,8 +347,8 @@ def monthly_analytics_report():
         start_date = start_date.replace(day=1)
         end_date = datetime.now().replace(day=1) - timedelta(days=1)
 
-        analytics = get_payment_analytics(start_date, end_date)
-        collection_rate = calculate_rent_collection_rate()
+        payment_stats = get_payment_analytics(start_date, end_date)
+        collection_rate = calculate_rent_collection_rate(start_date.strftime('%Y-%m'))
 
         # Send report to administrators
         admins = User.query.filter_by(role='admin').all()
@@ -420,28 +357,25 @@ def monthly_analytics_report():
 Monthly Property Management Report - {start_date.strftime('%B %Y')}
 
 Payment Summary:
-- Total Payments: {analytics['total_payments']}
-- Total Amount Collected: ${analytics['total_amount']:,.2f}
+- Total Payments: {payment_stats['total_payments']}
+- Total Amount Collected: ${payment_stats['total_amount']:,.2f}
 - Rent Collection Rate: {collection_rate}%
 
 Payment Methods:
 """
-        for method, data in analytics['payment_methods'].items():
+        for method, data in payment_stats['payment_methods'].items():
             report_body += f"- {method.title()}: {data['count']} payments (${data['amount']:,.2f})\n"
 
-        report_body += "\nPayment Types:\n"
-        for ptype, data in analytics['payment_types'].items():
-            report_body += f"- {ptype.title()}: {data['count']} payments (${data['amount']:,.2f})\n"
-
         for admin in admins:
-            send_email(
+            outbox.enqueue_email(
                 admin.email,
                 f"Monthly Property Management Report - {start_date.strftime('%B %Y')}",
                 report_body
             )
+        db.session.commit()
 
         logger.info(f"Monthly analytics report sent to {len(admins)} administrators")
-        return analytics
+        return payment_stats
     except Exception as e:
         logger.error(f"Error generating monthly report: {str(e)}")
         return None
\ No newline at end of file
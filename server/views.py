@@ -1,28 +1,43 @@
 from flask_restful import Resource, Api, reqparse
-from flask import request, jsonify, render_template, flash, redirect, url_for, make_response
-from models import db, User, Lease, Bill, Notification, Payment, RepairRequest, Property
+from flask import request, jsonify, render_template, flash, redirect, url_for, make_response, Response, stream_with_context, current_app
+from models import db, User, Lease, Bill, Notification, Payment, RepairRequest, Property, SUCCESSFUL, FAILED
 from flask_jwt_extended import create_access_token, create_refresh_token, JWTManager, get_jwt_identity, get_jwt, get_jti, jwt_required, verify_jwt_in_request
-import base64
+import json
 from functools import wraps
 import re
-import requests, os
-from datetime import datetime
+import os
+import time
+from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
-from utils import send_email, send_sms
+import outbox
+import payment_inbox
+import rent_status
+import exports
+import analytics
+import ledger
+import serializers
+from sqlalchemy import func, and_, or_
+from sqlalchemy.exc import IntegrityError
+import summaries
+from identity import current_identity, current_user, invalidate_identity
+from revocation import revocation_store
+from mpesa import mpesa_client, MpesaError, MpesaUnavailable
+import notifications
+from notifications import fan_out_broadcast, visible_to
+from pagination import encode_cursor, decode_cursor, parse_limit
+from response_cache import cached_response, USER
 
 
 api = Api()
 jwt = JWTManager()
 
-jwt_blocklist = set()
-
 # Email validation regex
 EMAIL_REGEX = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
 
 # Function to check if token has been blocked
 @jwt.token_in_blocklist_loader
 def check_revoked(jwt_headers, jwt_payload):
-    return jwt_payload.get("jti") in jwt_blocklist
+    return revocation_store.is_revoked(jwt_payload.get("jti"))
 
 # Function to manage Role Based Access (RBAC)
 def roles_required(*allowed_roles):
@@ -31,11 +46,8 @@ def roles_required(*allowed_roles):
         @jwt_required()
         def wrapper(*args, **kwargs):
             try:
-                # Get the user identity from JWT token
-                user_id = get_jwt_identity()
-
-                # Fetch the user from database to get their role
-                user = User.query.filter_by(public_id=user_id).first()
+                # Resolve the user's id and role, cached across requests
+                user = current_identity()
 
                 if not user:
                     return {
@@ -151,8 +163,8 @@ class LogoutResource(Resource):
     @jwt_required()
     def post(self):
         try:
-            jti = get_jwt().get("jti")
-            jwt_blocklist.add(jti)
+            token = get_jwt()
+            revocation_store.revoke(token.get("jti"), token.get("exp"))
             return {"message": "Logout successful"}, 200
         except Exception as e:
             return {"message": "Something went wrong during logout", "error": str(e)}, 500
@@ -163,7 +175,7 @@ class RefreshResource(Resource):
     def post(self):
         try:
             user_id = get_jwt_identity()
-            user = User.query.filter_by(public_id=user_id).first()
+            user = current_user()
             if not user or not user.is_active:
                 return {"message": "User not found or inactive"}, 404
 
@@ -178,8 +190,7 @@ class ProfileResource(Resource):
     @jwt_required()
     def get(self):
         try:
-            user_id = get_jwt_identity()
-            user = User.query.filter_by(public_id=user_id).first()
+            user = current_user()
 
             if not user:
                 return {"message": "User not found"}, 404
@@ -190,8 +201,7 @@ class ProfileResource(Resource):
     @jwt_required()
     def put(self):
         try:
-            user_id = get_jwt_identity()
-            user = User.query.filter_by(public_id=user_id).first()
+            user = current_user()
 
             if not user:
                 return {"message": "User not found"}, 404
@@ -207,6 +217,7 @@ class ProfileResource(Resource):
                     updated_fields.append(field)
             if updated_fields:
                 db.session.commit()
+                invalidate_identity(user.public_id)
                 return {
                     "message": f"Profile updated successfully. Updated fields: {', '.join(updated_fields)}",
                     "user": user.to_dict()
@@ -226,8 +237,7 @@ class DashboardResource(Resource):
     def get(self):
         """Get dashboard data based on user role"""
         try:
-            user_id = get_jwt_identity()
-            user = User.query.filter_by(public_id=user_id).first()
+            user = current_user()
 
             if not user:
                 return {"message": "User not found"}, 404
@@ -268,8 +278,7 @@ class DashboardStatsResource(Resource):
     def get(self):
         """Get quick stats based on user role"""
         try:
-            user_id = get_jwt_identity()
-            user = User.query.filter_by(public_id=user_id).first()
+            user = current_user()
 
             if not user:
                 return {"message": "User not found"}, 404
@@ -306,8 +315,7 @@ class UserProfileDashboardResource(Resource):
     def get(self):
         """Get user profile information and dashboard display"""
         try:
-            user_id = get_jwt_identity()
-            user = User.query.filter_by(public_id=user_id).first()
+            user = current_user()
 
             if not user:
                 return {"message": "User not found"}, 404
@@ -366,83 +374,70 @@ class UserProfileDashboardResource(Resource):
 
 class LandlordDashboardResource(Resource):
     @roles_required('landlord')
-    @jwt_required() # Add jwt_required if not already handled by roles_required
     def get(self):
         """Enhanced landlord dashboard with comprehensive data"""
         try:
-            user_id = get_jwt_identity()
-            landlord = User.query.filter_by(public_id=user_id).first()
+            landlord = current_user()
 
             if not landlord:
                 return {"message": "Landlord not found"}, 404
 
-            # --- Fetch comprehensive data ---
-            properties = Property.query.filter_by(landlord_id=landlord.id).all()
-            total_properties = len(properties)
-            occupied_units = 0
-            vacant_units = 0
-
-            # Initialize tenant and lease data
-            total_leases = 0
+            # --- Occupancy per property (one grouped query) ---
+            occupancy = db.session.query(
+                Property.id,
+                Property.rent,
+                func.count(Lease.id).label("active_leases")
+            ).outerjoin(
+                Lease, and_(Lease.property_id == Property.id, Lease.status == 'active')
+            ).filter(
+                Property.landlord_id == landlord.id
+            ).group_by(Property.id, Property.rent).all()
+
+            total_properties = len(occupancy)
+            occupied_units = sum(1 for row in occupancy if row.active_leases > 0)
+            vacant_units = total_properties - occupied_units
+            expected_monthly_revenue = sum(row.rent for row in occupancy)
+
+            # --- Overdue bill counts per active lease (one query) ---
+            lease_rows = self._active_lease_summaries(landlord.id)
+
+            # --- Collected and pending totals from the materialized summary ---
+            totals = summaries.landlord_totals(landlord.id)
+            total_collected_sum = totals["collected"]
+            pending_payments_sum = totals["pending_bills"]
+
+            month_start = date.today().replace(day=1)
             up_to_date_tenants_list = []
             behind_tenants_list = []
             overdue_payments_count = 0
             monthly_revenue_sum = 0
-            total_collected_sum = 0
-            pending_payments_sum = 0
-
-            for prop in properties:
-                # Assuming a property can have units, and units have leases
-                # You'll need to adjust this based on your actual Property/Unit/Lease model structure
-                # For simplicity, let's assume Property directly links to Leases
-                property_leases = Lease.query.filter_by(property_id=prop.id, status='active').all()
-                for lease in property_leases:
-                    total_leases += 1
-                    # Check payment status (simplified logic, adjust as per your payment tracking)
-                    # This is a placeholder logic: you'd need to query Payment records for this lease
-                    # and compare against expected rent due dates.
-                    payments_for_lease = Payment.query.filter_by(lease_id=lease.id).all()
-
-                    # Example: Check if last payment was within this month and covered rent
-                    # This part needs *your* actual payment logic to determine "up to date" or "behind"
-                    is_up_to_date = True # Placeholder
-                    if is_up_to_date:
-                        up_to_date_tenants_list.append(lease.tenant.to_dict()) # Assuming Lease has a 'tenant' relationship
-                    else:
-                        behind_tenants_list.append(lease.tenant.to_dict())
-                        overdue_payments_count += 1
-
-                    # Calculate financial summaries
-                    # Again, this needs your actual payment/bill logic
-                    # For example: sum up `Payment.amount` for the current month vs `Bill.amount`
-                    monthly_revenue_sum += lease.monthly_rent # Simplistic, assumes all rent is collected
-                    total_collected_sum += sum(p.amount for p in payments_for_lease if p.status == 'completed')
-                    pending_payments_sum += sum(b.amount for b in Bill.query.filter_by(lease_id=lease.id, status='pending').all())
-
-
-                # Occupancy logic (adjust based on your Unit model if you have one)
-                # For simplicity, assuming if a property has any active leases, it's occupied
-                if property_leases:
-                    occupied_units += 1
+            new_tenants_this_month = 0
+
+            for lease, tenant, overdue in lease_rows:
+                monthly_revenue_sum += lease.rent_amount
+                overdue_payments_count += overdue
+                if lease.start_date and lease.start_date >= month_start:
+                    new_tenants_this_month += 1
+
+                # A tenant is behind as soon as one of their bills is past due and unpaid
+                if overdue:
+                    behind_tenants_list.append(tenant.to_dict())
                 else:
-                    vacant_units += 1
+                    up_to_date_tenants_list.append(tenant.to_dict())
 
+            total_leases = len(lease_rows)
 
-            # Maintenance requests (assuming 'property_id' or 'landlord_id' on RepairRequest)
+            # Maintenance requests still being worked on
             maintenance_requests = RepairRequest.query.join(Property).filter(
                 Property.landlord_id == landlord.id,
-                RepairRequest.status.in_(['pending', 'in_progress']) # Count active requests
+                RepairRequest.status.in_(['open', 'in progress'])
             ).count()
 
-
-            # Collection Rate calculation (adjust as needed)
-            expected_monthly_revenue = sum(p.monthly_rent for p in properties) # Simplified
             collection_rate = (total_collected_sum / expected_monthly_revenue * 100) if expected_monthly_revenue > 0 else 0
 
             # Notification counts
             unread_notifications = Notification.query.filter_by(recipient_id=landlord.id, is_read=False).count()
-            recent_notifications = [n.to_dict() for n in Notification.query.filter_by(recipient_id=landlord.id).order_by(Notification.created_at.desc()).limit(5).all()]
-            recent_broadcasts = [n.to_dict() for n in Notification.query.filter_by(sender_id=landlord.id, is_broadcast=True).order_by(Notification.created_at.desc()).limit(5).all()]
+            recent_notifications = [n.to_dict() for n in Notification.query.options(*serializers.loader_options(serializers.NOTIFICATION_LOADERS)).filter_by(recipient_id=landlord.id).order_by(Notification.created_at.desc()).limit(5).all()]
 
 
             dashboard_data = {
@@ -462,11 +457,11 @@ class LandlordDashboardResource(Resource):
                     "monthly_revenue": monthly_revenue_sum,
                     "pending_payments": pending_payments_sum,
                     "total_collected": total_collected_sum,
-                    "overdue_payments": overdue_payments_count # Use the count from lease checks
+                    "overdue_payments": overdue_payments_count
                 },
                 "tenant_summary": {
                     "total_tenants": total_leases, # Assuming one tenant per lease for simplicity
-                    "new_tenants_this_month": 0, # Implement logic to count new leases
+                    "new_tenants_this_month": new_tenants_this_month,
                     "tenants_behind_rent": len(behind_tenants_list)
                 },
                 "recent_activities": [], # Populate with actual recent activities (e.g., new leases, payments, repair updates)
@@ -496,23 +491,56 @@ class LandlordDashboardResource(Resource):
             print(f"Error in LandlordDashboardResource: {e}")
             return {"message": "Error fetching landlord dashboard", "error": str(e)}, 500
 
+    def _active_lease_summaries(self, landlord_id):
+        """Return (lease, tenant, overdue_count) for every active lease of the
+        landlord. Overdue bills are counted in SQL so the statement count does
+        not grow with the size of the portfolio."""
+        landlord_leases = db.session.query(Lease.id).join(Property).filter(
+            Property.landlord_id == landlord_id,
+            Lease.status == 'active'
+        )
+
+        overdue = db.session.query(
+            Bill.lease_id.label("lease_id"),
+            func.count(Bill.id).label("overdue")
+        ).filter(
+            Bill.lease_id.in_(landlord_leases),
+            Bill.status == 'unpaid',
+            Bill.due_date < date.today()
+        ).group_by(Bill.lease_id).subquery()
+
+        rows = db.session.query(
+            Lease,
+            User,
+            func.coalesce(overdue.c.overdue, 0)
+        ).join(
+            Property, Lease.property_id == Property.id
+        ).join(
+            User, Lease.tenant_id == User.id
+        ).outerjoin(
+            overdue, overdue.c.lease_id == Lease.id
+        ).filter(
+            Property.landlord_id == landlord_id,
+            Lease.status == 'active'
+        ).all()
+        return rows
+
 class TenantDashboardResource(Resource):
     @roles_required('tenant')
     def get(self):
         """Enhanced tenant dashboard with comprehensive data"""
         try:
-            user_id = get_jwt_identity()
-            tenant = User.query.filter_by(public_id=user_id).first()
+            tenant = current_user()
 
             if not tenant:
                 return {"message": "Tenant not found"}, 404
 
             # Notification counts
             unread_notifications = Notification.query.filter(
-                ((Notification.recipient_id == tenant.id) | (Notification.is_broadcast == True)) & (Notification.is_read == False)
+                visible_to(tenant.id) & (Notification.is_read == False)
             ).count()
             recent_notifications  = Notification.query.filter(
-                (Notification.recipient_id == tenant.id) | (Notification.is_broadcast == True)
+                visible_to(tenant.id)
             ).order_by(Notification.created_at.desc()).limit(5).all()
 
             #Active lease information
@@ -572,8 +600,7 @@ class AdminDashboardResource(Resource):
     def get(self):
         """Enhanced admin dashboard with system overview"""
         try:
-            user_id = get_jwt_identity()
-            admin = User.query.filter_by(public_id=user_id).first()
+            admin = current_user()
 
             if not admin:
                 return {"message": "Admin not found"}, 404
@@ -638,9 +665,13 @@ class AdminDashboardResource(Resource):
 class UsersResource(Resource):
     @roles_required('admin')
     def get(self):
+        try:
+            fields = serializers.requested_fields(serializers.USER)
+        except ValueError as e:
+            return {"message": str(e)}, 400
         try:
             users = User.query.all()
-            users_list = [user.to_dict() for user in users]
+            users_list = serializers.USER.many(users, fields)
 
             return {
                 "users": users_list,
@@ -664,6 +695,7 @@ class UserManagementResource(Resource):
             if "is_active" in data:
                 user.is_active = bool(data["is_active"])
                 db.session.commit()
+                invalidate_identity(user.public_id)
 
                 status = "activated" if user.is_active else "deactivated"
                 return {
@@ -706,16 +738,19 @@ def landlord_or_admin_required(fn):
 class LeaseListResource(Resource):
     @jwt_required()
     def get(self):
-        user_id = get_jwt_identity()
         role = get_jwt().get("role")
+        try:
+            fields = serializers.requested_fields(serializers.LEASE)
+        except ValueError as e:
+            return {"message": str(e)}, 400
 
-        user = User.query.filter_by(public_id=user_id).first()
+        user = current_identity()
+        query = Lease.query.options(*serializers.loader_options(serializers.LEASE_LOADERS, fields))
         if role == "tenant":
-            leases = Lease.query.filter_by(tenant_id = user.id).all()
-        else:
-            leases = Lease.query.all()
+            query = query.filter_by(tenant_id = user.id)
+        leases = query.order_by(Lease.id).all()
 
-        return {"leases": [lease.to_dict() for lease in leases]}, 200
+        return {"leases": serializers.LEASE.many(leases, fields)}, 200
 
     @tenant_required
     def post(self):
@@ -728,7 +763,7 @@ class LeaseListResource(Resource):
         try:
             start_date = datetime.fromisoformat(data["start_date"]).date()
             end_date = datetime.fromisoformat(data["end_date"]).date()
-            user = User.query.filter_by(public_id=get_jwt_identity()).first()
+            user = current_identity()
             lease = Lease(
                 tenant_id = user.id,
                 property_id = data["property_id"],
@@ -739,13 +774,20 @@ class LeaseListResource(Resource):
             db.session.add(lease)
             db.session.flush()
 
+            due_date = start_date + relativedelta(months=1)
             new_bill = Bill(
                 lease_id=lease.id,
                 amount=lease.rent_amount,
-                due_date=start_date + relativedelta(months=1),
-                status="unpaid"
+                due_date=due_date,
+                status="unpaid",
+                period=summaries.period_for(due_date)
             )
             db.session.add(new_bill)
+            db.session.flush()
+
+            summaries.record_lease_change(lease)
+            summaries.record_bill_change(new_bill)
+            ledger.charge_lease_through(lease)
             db.session.commit()
             return {"message": "Lease created with initial bill",
                     "lease": lease.to_dict(),
@@ -759,18 +801,25 @@ class LeaseListResource(Resource):
 
 class LeaseResource(Resource):
     @jwt_required()
+    @cached_response("leases", "users", "properties", "property_pictures", "bills", "payments", scope=USER)
     def get(self, lease_id):
-        lease = Lease.query.get(lease_id)
+        try:
+            fields = serializers.requested_fields(serializers.LEASE)
+        except ValueError as e:
+            return {"message": str(e)}, 400
+        lease = Lease.query.options(*serializers.loader_options(serializers.LEASE_LOADERS, fields)).filter_by(
+            id=lease_id
+        ).first()
         if not lease:
             return {"message": "Lease not found"}, 404
 
         role = get_jwt().get("role")
-        user = User.query.filter_by(public_id=get_jwt_identity()).first()
+        user = current_identity()
         if role == "tenant" and lease.tenant_id != user.id:
             return {"message": "Unauthorized"}, 403
 
 
-        return {"lease": lease.to_dict()}, 200
+        return {"lease": lease.to_dict(fields)}, 200
     @landlord_or_admin_required
     def patch(self, lease_id):
         lease = Lease.query.get(lease_id)
@@ -779,6 +828,7 @@ class LeaseResource(Resource):
 
         data = request.get_json() or {}
         updated_fields = []
+        before = summaries.lease_snapshot(lease)
 
         if "status" in data and data ["status"] in ["active","terminated", "expired", "pending"]:
             lease.status = data["status"]
@@ -804,6 +854,9 @@ class LeaseResource(Resource):
 
         if updated_fields:
             try:
+                summaries.record_lease_change(lease, before)
+                if lease.status == "active":
+                    ledger.charge_lease_through(lease)
                 db.session.commit()
                 return{"message":f"Lease updated ({', '.join(updated_fields)})", "lease":lease.to_dict()}, 200
             except Exception as e:
@@ -819,6 +872,10 @@ class LeaseResource(Resource):
             return {"message": "Lease not found"}, 404
 
         try:
+            for bill in lease.bills:
+                summaries.record_bill_change(bill, summaries.bill_snapshot(bill), deleted=True)
+            summaries.record_lease_change(lease, summaries.lease_snapshot(lease), deleted=True)
+            ledger.delete_lease(lease.id)
             db.session.delete(lease)
             db.session.commit()
             return {"message": "Lease deleted successfully"}, 200
@@ -831,16 +888,19 @@ class BillListResource(Resource):
     def get(self):
         """Get all bills for the logged-in tenant via their leases"""
         role = get_jwt().get("role")
-        user = User.query.filter_by(public_id=get_jwt_identity()).first()
+        user = current_identity()
+        try:
+            fields = serializers.requested_fields(serializers.BILL_WITH_LEASE)
+        except ValueError as e:
+            return {"message": str(e)}, 400
 
+        query = Bill.query.options(*serializers.loader_options(serializers.BILL_LOADERS, fields))
         if role == "tenant":
-            leases = Lease.query.filter_by(tenant_id=user.id).all()
-            lease_ids = [lease.id for lease in leases]
-            bills = Bill.query.filter(Bill.lease_id.in_(lease_ids)).all()
-        else:  # landlord or admin
-            bills = Bill.query.all()
+            query = query.filter(Bill.lease_id.in_(db.session.query(Lease.id).filter(Lease.tenant_id == user.id)))
+        # landlords and admins see every bill
+        bills = query.order_by(Bill.id).all()
 
-        return {"bills":[bill.to_dict() for bill in bills]},200
+        return {"bills": serializers.BILL_WITH_LEASE.many(bills, fields)},200
 
     @landlord_or_admin_required
     def post(self):
@@ -865,12 +925,20 @@ class BillListResource(Resource):
                 lease_id=int(data["lease_id"]),
                 amount=float(data["amount"]),
                 due_date= due_date,
-                status=data.get("status", "unpaid")
+                status=data.get("status", "unpaid"),
+                # Same period as the monthly run, so it won't bill this lease again for the month
+                period=summaries.period_for(due_date)
             )
             db.session.add(new_bill)
+            db.session.flush()
+            summaries.record_bill_change(new_bill)
             db.session.commit()
             return new_bill.to_dict(), 201
 
+        except IntegrityError:
+            db.session.rollback()
+            return {"message": "This lease already has a bill for that month"}, 409
+
         except ValueError as ve:
             return {"message": str(ve)}, 400
 
@@ -883,21 +951,28 @@ class BillResource(Resource):
     @jwt_required()
     def get(self, bill_id):
         """Get a single bill by ID"""
-        bill = Bill.query.get_or_404(bill_id)
+        try:
+            fields = serializers.requested_fields(serializers.BILL_WITH_LEASE)
+        except ValueError as e:
+            return {"message": str(e)}, 400
+        bill = Bill.query.options(*serializers.loader_options(serializers.BILL_LOADERS, fields)).filter_by(
+            id=bill_id
+        ).first_or_404()
         role = get_jwt().get("role")
-        user = User.query.filter_by(public_id=get_jwt_identity()).first()
+        user = current_identity()
 
         if role == "tenant" and bill.lease.tenant_id != user.id:
             return {"message": "Unauthorized"}, 403
 
-        return bill.to_dict()
+        return bill.to_dict(fields)
 
     @jwt_required()
     def patch(self, bill_id):
         data = request.get_json() or {}
         bill = Bill.query.get_or_404(bill_id)
         role = get_jwt().get("role")
-        user = User.query.filter_by(public_id=get_jwt_identity()).first()
+        user = current_identity()
+        before = summaries.bill_snapshot(bill)
 
         # Tenant can only mark their own bill as paid
         if role == "tenant":
@@ -905,6 +980,7 @@ class BillResource(Resource):
                 return {"message": "Unauthorized"}, 403
             if "status" in request.json and request.json["status"] == "paid":
                 bill.status = "paid"
+                summaries.record_bill_change(bill, before)
                 db.session.commit()
                 return bill.to_dict(), 200
             else:
@@ -925,6 +1001,7 @@ class BillResource(Resource):
                 except ValueError:
                     return {"message": "Invalid date format. Use YYYY-MM-DD"}, 400
 
+        summaries.record_bill_change(bill, before)
         db.session.commit()
         return bill.to_dict(), 200
 
@@ -932,6 +1009,7 @@ class BillResource(Resource):
     def delete(self, bill_id):
         """Delete a bill"""
         bill = Bill.query.get_or_404(bill_id)
+        summaries.record_bill_change(bill, summaries.bill_snapshot(bill), deleted=True)
         db.session.delete(bill)
         db.session.commit()
         return {"message": "Bill deleted successfully"}, 200
@@ -942,7 +1020,6 @@ class LeaseVacateResource(Resource):
         """
         Tenant submits a vacate notice for their lease.
         """
-        current_user_id = get_jwt_identity()
         data = request.get_json()
 
         vacate_date = data.get("vacate_date")
@@ -956,7 +1033,7 @@ class LeaseVacateResource(Resource):
             return {"error": "Lease not found"}, 404
 
         # ensure tenant owns this lease
-        user = User.query.filter_by(public_id=current_user_id).first()
+        user = current_identity()
         if not user or lease.tenant_id != user.id:
             return {"error": "Unauthorized"}, 403
 
@@ -979,8 +1056,7 @@ class LeaseVacateResource(Resource):
 class LeaseVacateApprovalResource(Resource):
     @landlord_or_admin_required
     def put(self, lease_id):
-        current_user_id = get_jwt_identity()
-        user = User.query.get(public_id=current_user_id).first()
+        user = current_identity()
 
         if user.role not in ["landlord", "admin"]:
             return {"error": "Unauthorized"}, 403
@@ -1021,25 +1097,57 @@ class NotificationListResource(Resource):
     def get(self):
         """Get notifications for the current user"""
         try:
-            user_id = get_jwt_identity()
-            user = User.query.filter_by(public_id=user_id).first()
+            user = current_identity()
 
             if not user:
                 return {"message": "User not found"}, 404
 
-            notifications = Notification.query.filter((Notification.recipient_id == user.id) | (Notification.is_broadcast == True)).order_by(Notification.created_at.desc()).all()
+            try:
+                limit = parse_limit(request.args.get('limit'))
+                cursor = request.args.get('cursor')
+                after = decode_cursor(cursor, size=2) if cursor else None
+                after_created_at = datetime.fromisoformat(after[0]) if after else None
+                after_id = int(after[1]) if after else None
+            except (ValueError, TypeError):
+                return {"message": "Invalid cursor or limit"}, 400
+            try:
+                fields = serializers.requested_fields(serializers.NOTIFICATION)
+            except ValueError as e:
+                return {"message": str(e)}, 400
 
             notification_type = request.args.get('type')
             unread_only = request.args.get('unread_only') == "true"
 
+            query = Notification.query.filter(visible_to(user.id))
             if notification_type:
-                notifications = [n for n in notifications if n.notification_type == notification_type]
+                query = query.filter(Notification.notification_type == notification_type)
+
+            unread_count = query.filter(Notification.is_read == False).count()
+
             if unread_only:
-                notifications = [n for n in notifications if not n.is_read]
+                query = query.filter(Notification.is_read == False)
+            if after:
+                # Keyset on (created_at, id), newest first
+                query = query.filter(or_(
+                    Notification.created_at < after_created_at,
+                    and_(Notification.created_at == after_created_at, Notification.id < after_id)
+                ))
+
+            notifications = query.options(*serializers.loader_options(serializers.NOTIFICATION_LOADERS, fields)).order_by(
+                Notification.created_at.desc(), Notification.id.desc()
+            ).limit(limit + 1).all()
+            has_more = len(notifications) > limit
+            notifications = notifications[:limit]
+
+            next_cursor = None
+            if has_more:
+                last = notifications[-1]
+                next_cursor = encode_cursor(last.created_at.isoformat(), last.id)
 
             return {
-                "notifications": [notification.to_dict() for notification in notifications],
-                "unread_count": len([n for n in notifications if not n.is_read])
+                "notifications": serializers.NOTIFICATION.many(notifications, fields),
+                "unread_count": unread_count,
+                "next_cursor": next_cursor
             }, 200
         except Exception as e:
             return {"message": "Error fetching notifications", "error": str(e)}, 500
@@ -1048,8 +1156,7 @@ class NotificationListResource(Resource):
     def post(self):
         """Send message to tenants"""
         try:
-            user_id = get_jwt_identity()
-            sender = User.query.filter_by(public_id=user_id).first()
+            sender = current_user()
 
             if not sender:
                 return {"message": "Sender not found"}, 404
@@ -1069,30 +1176,17 @@ class NotificationListResource(Resource):
 
 
             if is_broadcast:
-                tenants = User.query.filter_by(role="tenant", is_active=True).all()
+                broadcast_id, recipients_count = fan_out_broadcast(sender.id, title, message, notification_type)
 
-                if not tenants:
+                if not recipients_count:
+                    db.session.rollback()
                     return {"message": "No active tenants found"}, 404
 
-                notifications_created = []
-                for tenant in tenants:
-                    notification = Notification(
-                        sender_id=sender.id,
-                        recipient_id=tenant.id,
-                        title=title,
-                        message=message,
-                        notification_type=notification_type,
-                        is_broadcast=True
-                    )
-                    db.session.add(notification)
-                    notifications_created.append({
-                        "recipient": f"{tenant.first_name} {tenant.last_name}",
-                        "recipient_email": tenant.email
-                    })
                 db.session.commit()
                 return {
-                    "message": f"Broadcast notification sent to {len(tenants)} tenant(s)",
-                    "recipients": notifications_created,
+                    "message": f"Broadcast notification sent to {recipients_count} tenant(s)",
+                    "broadcast_id": broadcast_id,
+                    "recipients_count": recipients_count,
                     "notification_details": {
                         "title": title,
                         "message": message,
@@ -1133,8 +1227,7 @@ class NotificationResource(Resource):
     def get(self, notification_id):
         """Get a specific notification"""
         try:
-            user_id = get_jwt_identity()
-            user = User.query.filter_by(public_id=user_id).first()
+            user = current_identity()
 
             if not user:
                 return {"message": "User not found"}, 404
@@ -1153,8 +1246,7 @@ class NotificationResource(Resource):
     @jwt_required()
     def patch(self, notification_id):
         try:
-            user_id = get_jwt_identity()
-            user = User.query.filter_by(public_id=user_id).first()
+            user = current_identity()
 
             if not user:
                 return{"message": "User not found"}, 404
@@ -1188,8 +1280,7 @@ class NotificationResource(Resource):
     @roles_required('landlord', 'admin')
     def delete(self, notification_id):
         try:
-            user_id = get_jwt_identity()
-            user = User.query.filter_by(publi_id=user_id).first()
+            user = current_identity()
 
             notification = Notification.query.get(notification_id)
             if not notification:
@@ -1197,19 +1288,123 @@ class NotificationResource(Resource):
 
             if notification.sender_id != user.id:
                 return {"message": "Unauthorized - only sender can delete"}, 403
-            db.session.delete()
+            db.session.delete(notification)
             db.session.commit()
             return {"message": "Notification deleted successfully"}, 200
         except Exception as e:
             db.session.rollback()
             return {"message": "Error deleting notification", "error": str(e)}, 500
 
+# Seconds a stream or long-poll waits for a wake-up before re-checking the database
+NOTIFICATION_HEARTBEAT = 15
+MAX_LONG_POLL_TIMEOUT = 30
+# Every open stream holds a worker thread: cap how many each worker process serves at once,
+# and for how long before the client reconnects (possibly to a less busy worker)
+NOTIFICATION_STREAM_LIMIT = 4
+NOTIFICATION_STREAM_MAX_SECONDS = 300
+
+class NotificationStreamResource(Resource):
+    @jwt_required()
+    def get(self):
+        """Server-Sent Events stream of new notifications for the current user.
+
+        Resumes after the ``Last-Event-ID`` header or ``?since=`` id; otherwise
+        only notifications created after the stream opens are sent. Streams
+        end after ``NOTIFICATION_STREAM_MAX_SECONDS`` (EventSource reconnects
+        on its own); when the worker already serves
+        ``NOTIFICATION_STREAM_LIMIT`` streams the answer is 503 and clients
+        should use ``/notifications/poll`` instead.
+        """
+        user = current_identity()
+        if not user:
+            return {"message": "User not found"}, 404
+
+        since = request.headers.get("Last-Event-ID") or request.args.get("since")
+        try:
+            last_id = int(since) if since else notifications.latest_notification_id(user.id)
+        except ValueError:
+            return {"message": "since must be a notification id"}, 400
+        user_id = user.id
+
+        config = current_app.config
+        limit = int(config.get("NOTIFICATION_STREAM_LIMIT", NOTIFICATION_STREAM_LIMIT))
+        max_seconds = float(config.get("NOTIFICATION_STREAM_MAX_SECONDS", NOTIFICATION_STREAM_MAX_SECONDS))
+        if not notifications.hub.open_stream(limit):
+            return {"message": "Too many open notification streams; poll /notifications/poll instead",
+                    "poll": "/notifications/poll"}, 503, {"Retry-After": str(NOTIFICATION_HEARTBEAT)}
+
+        def stream(last_id):
+            deadline = time.monotonic() + max_seconds
+            subscription = notifications.hub.subscribe(user_id)
+            try:
+                yield f"retry: {NOTIFICATION_HEARTBEAT * 1000}\n\n"
+                while True:
+                    pending = notifications.notifications_since(user_id, last_id)
+                    # The stream outlives the request; don't pin a pooled connection between checks
+                    db.session.close()
+                    for notification in pending:
+                        last_id = notification["id"]
+                        yield f"id: {last_id}\nevent: notification\ndata: {json.dumps(notification)}\n\n"
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if not subscription.wait(min(NOTIFICATION_HEARTBEAT, remaining)):
+                        yield ": keep-alive\n\n"
+            finally:
+                notifications.hub.unsubscribe(subscription)
+
+        response = Response(
+            stream_with_context(stream(last_id)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        # Runs once the server is done with the response, even if the stream never started
+        response.call_on_close(notifications.hub.close_stream)
+        return response
+
+class NotificationPollResource(Resource):
+    @jwt_required()
+    def get(self):
+        """Long-poll for notifications newer than ``?since=<id>``.
+
+        Answers at once if there is something new, otherwise waits up to
+        ``?timeout=`` seconds for a wake-up from the notification hub.
+        """
+        user = current_identity()
+        if not user:
+            return {"message": "User not found"}, 404
+
+        try:
+            since = request.args.get("since")
+            last_id = int(since) if since else notifications.latest_notification_id(user.id)
+            timeout = min(float(request.args.get("timeout", 25)), MAX_LONG_POLL_TIMEOUT)
+        except ValueError:
+            return {"message": "since must be a notification id and timeout a number"}, 400
+
+        user_id = user.id
+        new_notifications = notifications.notifications_since(user_id, last_id)
+        if not new_notifications and timeout > 0:
+            subscription = notifications.hub.subscribe(user_id)
+            try:
+                # Re-check after subscribing so a commit in between isn't missed
+                new_notifications = notifications.notifications_since(user_id, last_id)
+                if not new_notifications:
+                    # Hand the connection back to the pool while waiting; loaded objects stay attached
+                    db.session.commit()
+                    subscription.wait(timeout)
+                    new_notifications = notifications.notifications_since(user_id, last_id)
+            finally:
+                notifications.hub.unsubscribe(subscription)
+
+        if new_notifications:
+            last_id = new_notifications[-1]["id"]
+        return {"notifications": new_notifications, "since": last_id}, 200
+
 class BroadcastNotificationResource(Resource):
-    @roles_required()
+    @roles_required('landlord', 'admin')
     def post(self):
         try:
-            user_id = get_jwt_identity()
-            sender = User.query.filter_by(public_id=user_id).first()
+            sender = current_user()
 
             if not sender:
                 return {"message": "Sender not found"}, 404
@@ -1225,32 +1420,21 @@ class BroadcastNotificationResource(Resource):
             message = data.get('message').strip()
             notification_type = data.get('notification_type', 'general')
 
-            tenants = User.query.filter_by(role='tenant', is_active=True).all()
-            if not tenants:
+            broadcast_id, recipients_count = fan_out_broadcast(sender.id, title, message, notification_type)
+            if not recipients_count:
+                db.session.rollback()
                 return {"message": "No active tenants found to send broadcast"}, 404
 
-            notifications_sent = []
-            for tenant in tenants:
-                notification = Notification(
-                    sender_id=sender.id,
-                    recipient_id=tenant.id,
-                    title=title,
-                    message=message,
-                    notification_type=notification_type,
-                    is_broadcast=True
-                )
-                db.session.add(notification)
-                notifications_sent.append(f"{tenant.first_name} {tenant.last_name}")
             db.session.commit()
             return {
-                "message": f"Broadcast sent successfully to {len(tenants)} tenant(s)",
+                "message": f"Broadcast sent successfully to {recipients_count} tenant(s)",
                 "broadcast_details": {
+                    "broadcast_id": broadcast_id,
                     "title": title,
                     "message": message,
                     "type": notification_type,
                     "sender": f"{sender.first_name} {sender.last_name}",
-                    "recipients_count": len(tenants),
-                    "recipients": notifications_sent
+                    "recipients_count": recipients_count
                 }
             }, 201
         except ValueError as ve:
@@ -1261,12 +1445,20 @@ class BroadcastNotificationResource(Resource):
 
 class TenantListResource(Resource):
     @roles_required('landlord', 'admin')
+    @cached_response("users", "leases")
     def get(self):
         try:
-            tenants = User.query.filter_by(role='tenants', is_active=True).all()
+            tenants = User.query.filter_by(role='tenant', is_active=True).order_by(User.id).all()
+            # Every tenant's active lease in one query (the earliest, if a tenant has several)
+            active_leases = {}
+            if tenants:
+                for lease in Lease.query.filter(
+                    Lease.status == "active", Lease.tenant_id.in_([tenant.id for tenant in tenants])
+                ).order_by(Lease.id.desc()):
+                    active_leases[lease.tenant_id] = lease
             tenant_list = []
             for tenant in tenants:
-                active_lease = Lease.query.filter_by(tenant_id=tenant.id, status="active").first()
+                active_lease = active_leases.get(tenant.id)
                 tenant_info = {
                     "public_id": tenant.public_id,
                     "email": tenant.email,
@@ -1293,22 +1485,6 @@ class TenantListResource(Resource):
 
 
 
-def get_access_token():
-    consumer_key = os.getenv('MPESA_CONSUMER_KEY')
-    consumer_secret = os.getenv("MPESA_CONSUMER_SECRET")
-    if not consumer_key or not consumer_secret:
-        return None
-
-    auth_url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-
-    try:
-        res = requests.get(auth_url, auth=(consumer_key, consumer_secret))
-        if res.status_code == 200:
-            return res.json()["access_token"]
-    except Exception:
-        pass
-    return None
-
 class PaymentInitResource(Resource):
     @jwt_required()
     def post(self):
@@ -1319,64 +1495,42 @@ class PaymentInitResource(Resource):
         args = parser.parse_args()
 
         # Check Lease ownership
-        lease = Lease.query.get(args['lease_id'])
+        lease = db.session.get(Lease, args['lease_id'])
         if not lease:
             return {'error': 'Lease not found'},404
 
         # Check if user is tenant of the lease or admin/landlord
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        if current_user.role == 'tenant' and lease.tenant_id != current_user_id:
-            return {"error": "Unauthorized access to lease"}
-
-
-
-       # Generete Safaricom password
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        raw_password = f"{os.getenv('MPESA_SHORTCODE')}{os.getenv('MPESA_PASSKEY')}{timestamp}"
-        password = base64.b64encode(raw_password.encode()).decode("utf-8")
+        identity = current_identity()
+        if identity.role == 'tenant' and lease.tenant_id != identity.id:
+            return {"error": "Unauthorized access to lease"}, 403
 
         if not args.get('phone_number'):
-            return {"error": "Phone number required for M-Pesa"}
-
-
-        # Prepare STK push
-        payload = {
-            "BusinessShortCode": os.getenv("MPESA_SHORTCODE"),
-            "Password": password,
-            "Timestamp": timestamp,
-            "TransactionType": "CustomerPaybillOnline",
-            "Amount": int(args["amount"]),
-            "PartyA": args["phone_number"], # tenant phone
-            "PartyB": os.getenv("MPESA_SHORTCODE"),
-            "PhoneNumber": args["phone_number"],
-            "CallBackUrl": f"{os.getenv('MPESA_CALLBACK_URL')}/payments/mpesa/callback",
-            "AccountReference": f"Lease-{lease.id}",
-            "TransactionDesc": f"Rent Payment for lease {lease.id}"
-        }
-
-        headers = {
-            "Authorization": f"Bearer {os.getenv('MPESA_ACCESS_TOKEN')}",
-            "Content-Type": "application/json",
-        }
-        res = requests.post(
-            "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest",
-            json=payload,
-            headers=headers,
-        )
-        res_json = res.json()
+            return {"error": "Phone number required for M-Pesa"}, 400
 
-        if res.status_code != 200 or "CheckoutRequestID" not in res_json:
-            return {"error": "Failed to initiate payment", "details": res_json}, 400
+        # Prepare STK push over the shared, pooled Daraja client
+        try:
+            res_json = mpesa_client.stk_push(
+                args["phone_number"],  # tenant phone
+                args["amount"],
+                account_reference=f"Lease-{lease.id}",
+                description=f"Rent Payment for lease {lease.id}"
+            )
+        except MpesaUnavailable as e:
+            return {"error": "M-Pesa is unavailable, please try again shortly", "details": str(e)}, 503
+        except MpesaError as e:
+            return {"error": "Failed to initiate payment", "details": e.details or str(e)}, 400
 
         # Create payment record
         payment = Payment(
             lease_id = lease.id,
             amount = args["amount"],
+            provider_id = "mpesa",
             status = 'pending',
             transaction_id = res_json["CheckoutRequestID"]
         )
         db.session.add(payment)
+        db.session.flush()
+        analytics.record_payment(payment)
         db.session.commit()
 
 
@@ -1387,50 +1541,19 @@ class PaymentInitResource(Resource):
 
 class MpesaCallbackResource(Resource): # called after user approves payment
     def post(self):
-        body = request.json
+        body = request.get_json(silent=True)
         try:
-            if not body:
+            if not body or "stkCallback" not in body.get("Body", {}):
                 return {"error": "Invalid callback"}, 400
 
-            result = body.get("Body", {}).get("stkCallback", {})
-            checkout_id = result.get("CheckoutRequestID")
-            result_code = result.get("ResultCode")
-
-            payment = Payment.query.filter_by(transaction_id=checkout_id).first()
-            if not payment:
-                return {"error": "Payment not found"}, 404
-
-            if result_code == 0:  # Success
-                payment.status = "completed"
-            else:  # Failed or cancelled
-                payment.status = "failed"
-
-            db.session.commit()
-            return {"message": "Callback processed"}, 200
+            # Store and ACK; payment_inbox applies it (idempotently) in the next batch
+            payment_inbox.record_callback(body)
+            return {"ResultCode": 0, "ResultDesc": "Accepted"}, 200
 
         except Exception as e:
+            db.session.rollback()
             return {"error": f"Callback processing failed: {str(e)}"}, 500
 
-    def send_payment_notifications(self, payment): # Send notifications after successful payment
-        lease = payment.lease
-        tenant = lease.tenant
-
-        # Create notification record
-        notification = Notification(
-            sender_id=tenant.id,
-            notification_type='payment_received',
-            title=f'Payment Received - {payment.payment_type.title()}',
-            body=f'Payment of ${payment.amount} for {payment.payment_type} has been received for lease #{lease.id}.',
-            audience='landlord',
-            metadata={
-                'payment_id': payment.id,
-                'lease_id': lease.id,
-                'amount': payment.amount
-            }
-        )
-        db.session.add(notification)
-        db.session.commit()
-
 class PaymentStatusResource(Resource):
     @jwt_required()
     def get(self, payment_id):
@@ -1455,63 +1578,64 @@ class PaymentStatusResource(Resource):
 class PaymentHistoryResource(Resource): # Get payment history for a lease
     @jwt_required()
     def get(self, lease_id):
-        current_user_id = get_jwt_identity()
-        lease = Lease.query.get(lease_id)
+        identity = current_identity()
+        lease = db.session.get(Lease, lease_id)
 
         if not lease:
             return {"error": "Lease not found"}, 404
 
         # Check access permissions
-        current_user = User.query.get(current_user_id)
-        if (current_user.role == 'tenant' and lease.tenant_id != current_user_id):
+        if (identity.role == 'tenant' and lease.tenant_id != identity.id):
             return {"error": "Unauthorized"}, 403
 
+        try:
+            fields = serializers.requested_fields(serializers.PAYMENT)
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
         payments = Payment.query.filter_by(lease_id=lease_id).order_by(Payment.created_at.desc()).all()
+        status = rent_status.lease_rent_status(lease_ids=[lease_id])
         return {
             'lease_id': lease_id,
-            'payments': [payment.to_dict() for payment in payments],
-            'total_paid': sum(p.amount for p in payments if p.status == 'completed'),
-            'rent_status': {
-                'is_up_to_date': lease.is_rent_up_to_date(),
-                'days_behind': lease.days_behind_rent(),
-                'outstanding_amount': lease.calculate_outstanding_rent()
-            }
+            'payments': serializers.PAYMENT.many(payments, fields),
+            'total_paid': sum(p.amount for p in payments if p.status == SUCCESSFUL),
+            'rent_status': rent_status.status_dict(status[0]) if status else None
         }, 200
 
 class LandlordPaymentDashboardResource(Resource): # Dashboard data for landlords
     @jwt_required()
     def get(self):
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = User.query.filter_by(public_id=get_jwt_identity()).first()
 
-        if current_user.role not in ['landlord', 'admin']:
+        if not current_user or current_user.role not in ['landlord', 'admin']:
             return {"error": "Unauthorized"}, 403
 
-        # Get all leases (landlords would have property filtering here)
-        leases = Lease.query.filter_by(status='active').all()
+        # Landlords only see their own portfolio; admins see everything
+        landlord_id = current_user.id if current_user.role == 'landlord' else None
 
         up_to_date = []
         behind_rent = []
 
-        for lease in leases:
-            lease_data = lease.to_dict_with_payment_status()
-            if lease.is_rent_up_to_date():
+        for status in rent_status.lease_rent_status(landlord_id=landlord_id):
+            lease_data = {
+                'id': status.lease.id,
+                'property_id': status.lease.property_id,
+                'tenant_id': status.tenant.id,
+                'tenant_name': f"{status.tenant.first_name} {status.tenant.last_name}",
+                'rent_amount': status.lease.rent_amount,
+                **rent_status.status_dict(status)
+            }
+            if status.days_behind == 0:
                 up_to_date.append(lease_data)
             else:
                 behind_rent.append(lease_data)
 
-        # Calculate summary statistics
-        total_expected_rent = sum(lease.rent_amount for lease in leases)
-        total_collected = sum(p.amount for lease in leases
-                            for p in lease.payments
-                            if p.status == 'completed' and p.payment_type == 'rent')
-
         return {
             'summary': {
-                'total_leases': len(leases),
+                'total_leases': len(up_to_date) + len(behind_rent),
                 'up_to_date_count': len(up_to_date),
                 'behind_count': len(behind_rent),
-                'collection_rate': round((total_collected / total_expected_rent * 100), 2) if total_expected_rent > 0 else 0
+                'collection_rate': summaries.collection_rate(landlord_id)
             },
             'up_to_date_tenants': up_to_date,
             'behind_tenants': behind_rent
@@ -1521,53 +1645,106 @@ class LandlordPaymentDashboardResource(Resource): # Dashboard data for landlords
 
 
 
-class RentReminderResource(Resource):
-    """Send rent reminders (automated system)"""
-    @jwt_required()
-    def post(self):
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+class ExportResource(Resource):
+    """Stream payments, bills or leases as CSV or NDJSON for reporting tools"""
+    @roles_required('landlord', 'admin')
+    def get(self, kind):
+        if kind not in exports.EXPORTS:
+            return {"message": f"Unknown export: {kind}. Must be one of {list(exports.EXPORTS)}"}, 404
 
-        if current_user.role not in ['admin', 'landlord']:
-            return {"error": "Unauthorized"}, 403
+        fmt = request.args.get("format", "csv")
+        if fmt not in exports.FORMATS:
+            return {"message": f"Invalid format: {fmt}. Must be one of {list(exports.FORMATS)}"}, 400
 
-        # Find leases with overdue rent
-        overdue_leases = []
-        for lease in Lease.query.filter_by(status='active').all():
-            if not lease.is_rent_up_to_date():
-                overdue_leases.append(lease)
-
-        reminders_sent = 0
-        for lease in overdue_leases:
-            # Create notification
-            notification = Notification(
-                sender_id=current_user_id,
-                recipient_id=lease.tenant_id,
-                notification_type='rent_reminder',
-                title='Rent Payment Reminder',
-                body=f'Your rent payment of ${lease.rent_amount} is overdue by {lease.days_behind_rent()} days. Please make payment as soon as possible.',
-                audience='tenant',
-                metadata={'lease_id': lease.id, 'amount_due': lease.calculate_outstanding_rent()}
-            )
-            db.session.add(notification)
+        try:
+            start = date.fromisoformat(request.args["start"]) if request.args.get("start") else None
+            end = date.fromisoformat(request.args["end"]) if request.args.get("end") else None
+        except ValueError:
+            return {"message": "Invalid date format. Use YYYY-MM-DD"}, 400
+
+        # Landlords only export their own portfolio; admins may pick a landlord
+        identity = current_identity()
+        if identity.role == 'landlord':
+            landlord_id = identity.id
+        else:
+            landlord_id = request.args.get("landlord_id", type=int)
 
-            # Send email/SMS (implement these functions)
-            try:
-                send_email(lease.tenant.email, notification.title, notification.body)
-                notification.is_email_sent = True
-            except:
-                pass
+        gzip = request.accept_encodings.quality("gzip") > 0
+        body = exports.stream_export(kind, fmt, landlord_id=landlord_id, start=start, end=end, gzip=gzip)
+
+        extension = "csv" if fmt == "csv" else "ndjson"
+        headers = {
+            "Content-Disposition": f'attachment; filename="{kind}.{extension}"',
+            "Cache-Control": "no-store",
+            "X-Accel-Buffering": "no",
+            "Vary": "Accept-Encoding"
+        }
+        if gzip:
+            headers["Content-Encoding"] = "gzip"
+        return Response(stream_with_context(body), mimetype=exports.FORMATS[fmt], headers=headers)
 
-            try:
-                send_sms(lease.tenant.phone_number, f"{notification.title}: {notification.body}")
-                notification.is_sms_sent = True
-            except:
-                pass
 
-            reminders_sent += 1
+class PaymentAnalyticsResource(Resource):
+    """Payment counts and amounts over time, read from the daily/monthly rollups"""
+    @roles_required('landlord', 'admin')
+    def get(self):
+        try:
+            end = date.fromisoformat(request.args["end"]) if request.args.get("end") else date.today()
+            start = date.fromisoformat(request.args["start"]) if request.args.get("start") \
+                else end - relativedelta(months=1) + relativedelta(days=1)
+        except ValueError:
+            return {"message": "Invalid date format. Use YYYY-MM-DD"}, 400
+        if start > end:
+            return {"message": "start must be on or before end"}, 400
+
+        granularity = request.args.get("granularity")
+        if granularity is not None and granularity not in analytics.GRANULARITIES:
+            return {"message": f"Invalid granularity: {granularity}. Must be one of {list(analytics.GRANULARITIES)}"}, 400
+
+        # Landlords only see their own portfolio; admins may pick a landlord
+        identity = current_identity()
+        landlord_id = identity.id if identity.role == 'landlord' else request.args.get("landlord_id", type=int)
+
+        return analytics.payment_analytics(
+            start, end,
+            granularity=granularity,
+            landlord_id=landlord_id,
+            property_id=request.args.get("property_id", type=int),
+            status=request.args.get("status")
+        ), 200
 
+
+class RentReminderResource(Resource):
+    """Send rent reminders (automated system)"""
+    @roles_required('admin', 'landlord')
+    def post(self):
+        identity = current_identity()
+
+        # Find leases with overdue rent in one query; landlords only remind their own tenants
+        landlord_id = identity.id if identity.role == 'landlord' else None
+        overdue_leases = rent_status.overdue_leases(landlord_id=landlord_id)
+
+        reminders = []
+        for status in overdue_leases:
+            title = 'Rent Payment Reminder'
+            message = (f'Your rent payment of ${status.amount_due} is overdue by {status.days_behind} days. '
+                       'Please make payment as soon as possible.')
+            reminders.append(dict(
+                sender_id=identity.id,
+                recipient_id=status.tenant.id,
+                notification_type='payment',
+                title=title,
+                message=message
+            ))
+
+            # Queue email/SMS; they go out once this transaction commits
+            outbox.enqueue_email(status.tenant.email, title, message)
+            if status.tenant.phone_number:
+                outbox.enqueue_sms(status.tenant.phone_number, f"{title}: {message}")
+
+        notifications.bulk_notify(reminders)
         db.session.commit()
-        return {"message": f"Sent {reminders_sent} rent reminders"}, 200
+        return {"message": f"Sent {len(reminders)} rent reminders"}, 200
 
 # Repair request routes
 class RepairRequestResource(Resource):